@@ -1,126 +1,265 @@
-from dotenv import load_dotenv
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+import logging
+import math
 import os
-from math import cos, radians
+import uuid
 
-load_dotenv()
+DOTENV_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env')
+# En conteneur les variables viennent de l'environnement : python-dotenv n'est importé que s'il y a un .env
+if os.path.exists(DOTENV_PATH):
+    from dotenv import load_dotenv
+    load_dotenv(DOTENV_PATH)
 
+from commands import register_commands
 from config import Config
 from extensions import db
 from models.company import Company
 from models.job import Job
-from models.location import Location
+from services.clustering import get_cluster_pyramid
+from services.compression import init_compression
+from services.database import configure_database, init_database
+from services.geo import filter_by_radius
+from services.heatmap import cell_size, heatmap_cells
+from services.hydration import (
+    attach_locations, company_jobs, company_payloads, job_payloads, load_by_ids, located_payloads, map_payloads
+)
+from services.map_entities import read_model_enabled, read_model_failed, viewport_entities
+from services.map_filters import parse_filters
+from services.map_query import (
+    bbox_candidates, candidate_locations, nearest_candidates, parse_viewport, union_candidates, viewport_bbox
+)
+from services.metrics import init_metrics
+from services.pagination import ListQuery, int_arg
+from services.response_cache import cached, init_response_cache
+from services.search import search_jobs
+from services.serialization import JSONProvider
+from services.spatial_index import get_spatial_index, init_spatial_index
+from services.streaming import STREAM_FORMATS, stream_list
+from services.sync import current_token, decode_token, encode_token, init_change_log_poller, viewport_delta
+from services.tiles import init_tile_cache, render_tile, valid_tile
+
+logger = logging.getLogger(__name__)
 
 def test_db_connection():
     try:
         db.session.execute(text('SELECT 1'))
-        print("Connexion à la base de données OK")
+        return True
     except Exception as e:
-        print("Erreur de connexion à la BDD :", e)
+        db.session.rollback()
+        logger.warning("Erreur de connexion à la BDD : %s", e)
+        return False
 
 def create_app(test_config=None):
     app = Flask(__name__)
+    app.config.from_object(Config)
     if test_config:
         app.config.update(test_config)
-    else:
-        app.config.from_object(Config)
+    configure_database(app)
     db.init_app(app)
+    init_database(app)
+    app.json = JSONProvider(app)
+    init_metrics(app)
+    init_compression(app)
+    init_spatial_index(app)
+    init_tile_cache(app)
+    init_response_cache(app)
+    init_change_log_poller(app)
+    register_commands(app)
 
     @app.route('/')
     def home():
         return jsonify({"message": "Bienvenue !"})
 
+    def list_response(model, sort_column, entity_type):
+        try:
+            page = ListQuery.from_args(model, sort_column, request.args, app.config['LIST_MAX_LIMIT'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        fmt = request.args.get('format')
+        if fmt is None and request.args.get('stream', 'false').lower() == 'true':
+            fmt = 'json'
+        if fmt is not None:
+            if fmt not in STREAM_FORMATS:
+                return jsonify({'error': "format doit valoir 'json' ou 'ndjson'"}), 400
+            generator = stream_list(page, entity_type, fmt, app.config['STREAM_BATCH_SIZE'])
+            return Response(stream_with_context(generator), mimetype=STREAM_FORMATS[fmt])
+        rows, next_cursor = page.fetch()
+        result = page.serialize(rows)
+        if page.with_location:
+            attach_locations(entity_type, [row.id for row in rows], result)
+        response = jsonify(result)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
+
+    def lookup_ids():
+        payload = request.get_json(silent=True) or {}
+        raw_ids = payload.get('ids') if isinstance(payload, dict) else None
+        if not isinstance(raw_ids, list):
+            raise ValueError('ids doit être une liste')
+        if len(raw_ids) > app.config['LOOKUP_MAX_IDS']:
+            raise ValueError("Trop d'ids (max %d)" % app.config['LOOKUP_MAX_IDS'])
+        ids = []
+        for position, raw in enumerate(raw_ids):
+            try:
+                ids.append(uuid.UUID(raw))
+            except (TypeError, ValueError, AttributeError):
+                raise ValueError("ids[%d] n'est pas un UUID valide" % position)
+        return list(dict.fromkeys(ids))
+
     @app.route('/companies', methods=['GET'])
+    @cached(lambda view_args, data: {'companies'})
     def get_companies():
-        companies = Company.query.all()
-        result = []
-        for company in companies:
-            company_dict = company.to_dict()
-            location = Location.query.filter_by(
-                entity_type='company', 
-                entity_id=company.id
-            ).first()
-            company_dict['location'] = location.to_dict() if location else None
-            result.append(company_dict)
-        return jsonify(result)
+        return list_response(Company, Company.created_at, 'company')
 
     @app.route('/companies/<uuid:company_id>', methods=['GET'])
+    @cached(lambda view_args, data: {'company:%s' % view_args['company_id']}
+            | {'job:%s' % job['id'] for job in data()['jobs']})
     def get_company(company_id):
         company = Company.query.get_or_404(company_id)
-        company_dict = company.to_dict()
-        location = Location.query.filter_by(
-            entity_type='company', 
-            entity_id=company.id
-        ).first()
-        company_dict['location'] = location.to_dict() if location else None
+        company_dict = company_payloads([company])[0]
         jobs = Job.query.filter_by(company_id=company.id).all()
         company_dict['jobs'] = [job.to_dict() for job in jobs]
         return jsonify(company_dict)
 
+    @app.route('/companies/lookup', methods=['POST'])
+    def lookup_companies():
+        try:
+            ids = lookup_ids()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        # Même forme que /companies/<id>, en un nombre fixe de requêtes quel que soit le nombre d'ids
+        rows = load_by_ids(Company, ids)
+        companies = [rows[company_id] for company_id in ids if company_id in rows]
+        jobs = company_jobs([company.id for company in companies])
+        results = company_payloads(companies)
+        for company, company_dict in zip(companies, results):
+            company_dict['jobs'] = jobs[company.id]
+        return jsonify({
+            'companies': results,
+            'missing': [str(company_id) for company_id in ids if company_id not in rows]
+        })
+
     @app.route('/jobs', methods=['GET'])
+    @cached(lambda view_args, data: {'jobs'})
     def get_jobs():
-        jobs = Job.query.all()
-        result = []
-        for job in jobs:
-            job_dict = job.to_dict()
-            location = Location.query.filter_by(
-                entity_type='job', 
-                entity_id=job.id
-            ).first()
-            job_dict['location'] = location.to_dict() if location else None
-            result.append(job_dict)
-        return jsonify(result)
+        return list_response(Job, Job.posted_at, 'job')
+
+    @app.route('/jobs/search', methods=['GET'])
+    @cached(lambda view_args, data: {'jobs', 'companies', 'map'})
+    def search_jobs_route():
+        text = request.args.get('q', '').strip()
+        if not text:
+            return jsonify({'error': 'q est requis'}), 400
+        try:
+            limit = int_arg(request.args, 'limit', 20)
+            offset = int_arg(request.args, 'offset', 0, minimum=0)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        limit = min(limit, app.config['SEARCH_MAX_LIMIT'])
+        viewport = None
+        if 'center_lat' in request.args or 'center_lng' in request.args:
+            try:
+                viewport = parse_viewport(request.args)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+        # Recherche éventuellement restreinte aux offres localisées dans le viewport
+        jobs, scores, next_offset = search_jobs(app, text, limit, offset, viewport,
+                                                app.config['MAP_GEOHASH_MAX_PREFIXES'])
+        results = job_payloads(jobs, with_company=True)
+        for job, payload in zip(jobs, results):
+            payload['score'] = scores.get(job.id)
+        return jsonify({
+            'query': text,
+            'results': results,
+            'next_offset': next_offset
+        })
+
+    @app.route('/jobs/lookup', methods=['POST'])
+    def lookup_jobs():
+        try:
+            ids = lookup_ids()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        rows = load_by_ids(Job, ids)
+        jobs = [rows[job_id] for job_id in ids if job_id in rows]
+        return jsonify({
+            'jobs': job_payloads(jobs, with_company=True),
+            'missing': [str(job_id) for job_id in ids if job_id not in rows]
+        })
 
     @app.route('/jobs/<uuid:job_id>', methods=['GET'])
+    @cached(lambda view_args, data: {'job:%s' % view_args['job_id'], 'company:%s' % data()['company_id']})
     def get_job(job_id):
         job = Job.query.get_or_404(job_id)
-        job_dict = job.to_dict()
-        location = Location.query.filter_by(
-            entity_type='job', 
-            entity_id=job.id
-        ).first()
-        job_dict['location'] = location.to_dict() if location else None
-        company = db.session.get(Company, job.company_id)
-        if company:
-            job_dict['company_name'] = company.name
-            job_dict['company_image_url'] = company.image_url
-        else:
-            job_dict['company_name'] = None
-            job_dict['company_image_url'] = None
-        return jsonify(job_dict)
+        return jsonify(job_payloads([job], with_company=True)[0])
 
     @app.route('/map/entities', methods=['GET'])
+    @cached(lambda view_args, data: {'map'})
     def get_entities_in_map_zone():
-        center_lat = request.args.get('center_lat', type=float)
-        center_lng = request.args.get('center_lng', type=float)
-        zoom_level = request.args.get('zoom_level', type=int, default=12)
-        radius_km = request.args.get('radius_km', type=float)
-        if center_lat is None or center_lng is None:
-            return jsonify({'error': 'center_lat et center_lng sont requis'}), 400
-        if not radius_km:
-            radius_km = 50.0 / (2 ** (zoom_level - 10))
-        lat_delta = radius_km / 111.0
-        lng_delta = radius_km / (111.0 * cos(radians(center_lat)))
-        locations = Location.query.filter(
-            Location.latitude.between(center_lat - lat_delta, center_lat + lat_delta),
-            Location.longitude.between(center_lng - lng_delta, center_lng + lng_delta)
-        ).all()
-        companies = []
-        jobs = []
-        for location in locations:
-            if location.entity_type == 'company':
-                company = db.session.get(Company, location.entity_id)
-                if company:
-                    company_dict = company.to_dict()
-                    company_dict['location'] = location.to_dict()
-                    companies.append(company_dict)
-            elif location.entity_type == 'job':
-                job = db.session.get(Job, location.entity_id)
-                if job:
-                    job_dict = job.to_dict()
-                    job_dict['location'] = location.to_dict()
-                    jobs.append(job_dict)
+        try:
+            viewport = parse_viewport(request.args)
+            filters = parse_filters(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        center_lat, center_lng, radius_km, zoom_level, sort, limit = viewport
+        cluster = request.args.get('cluster', 'false').lower() == 'true'
+        min_lat, max_lat, min_lng, max_lng = viewport_bbox(viewport)
+        index = get_spatial_index(app)
+        if cluster and zoom_level <= app.config['MAP_CLUSTER_MAX_ZOOM']:
+            if filters is not None:
+                return jsonify({'error': "Les filtres ne sont pas disponibles avec cluster=true"}), 400
+            clusters = get_cluster_pyramid(app, index).query(zoom_level, min_lat, max_lat, min_lng, max_lng)
+            return jsonify({
+                'center': {
+                    'lat': center_lat,
+                    'lng': center_lng
+                },
+                'radius_km': radius_km,
+                'zoom_level': zoom_level,
+                'clusters': clusters,
+                'total_entities': sum(c['count'] for c in clusters)
+            })
+        if request.args.get('since'):
+            try:
+                since = decode_token(request.args['since'])
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            token, delta = viewport_delta(viewport, since, app.config['MAP_SYNC_MAX_CHANGES'],
+                                          app.config['MAP_GEOHASH_MAX_PREFIXES'], filters,
+                                          app.config['MAP_SYNC_WINDOW_SECONDS'])
+            # Jeton trop ancien (journal purgé ou trop de modifications) ou journal absent : tout le viewport
+            if delta is not None:
+                return jsonify({
+                    'center': {
+                        'lat': center_lat,
+                        'lng': center_lng
+                    },
+                    'radius_km': radius_km,
+                    'zoom_level': zoom_level,
+                    'since': request.args['since'],
+                    'sync_token': encode_token(token) if token is not None else None,
+                    **delta
+                })
+        else:
+            token = current_token()
+        companies = None
+        if read_model_enabled():
+            try:
+                companies, jobs = viewport_entities(viewport, filters, app.config['MAP_GEOHASH_MAX_PREFIXES'])
+            except SQLAlchemyError as e:
+                read_model_failed(e)
+        if companies is None:
+            source = index if filters is None else None
+            candidates = bbox_candidates(source, min_lat, max_lat, min_lng, max_lng,
+                                         app.config['MAP_GEOHASH_MAX_PREFIXES'], filters)
+            selected = filter_by_radius(candidates, center_lat, center_lng, radius_km,
+                                        sort_by_distance=sort == 'distance', limit=limit)
+            distances = {candidate.id: distance for candidate, distance in selected}
+            locations = candidate_locations(source, [candidate for candidate, _ in selected])
+            companies, jobs = map_payloads(locations, distances)
         return jsonify({
             'center': {
                 'lat': center_lat,
@@ -130,12 +269,173 @@ def create_app(test_config=None):
             'zoom_level': zoom_level,
             'companies': companies,
             'jobs': jobs,
-            'total_entities': len(companies) + len(jobs)
+            'total_entities': len(companies) + len(jobs),
+            'sync_token': encode_token(token) if token is not None else None,
+            'reset': bool(request.args.get('since'))
+        })
+
+    @app.route('/map/nearest', methods=['GET'])
+    @cached(lambda view_args, data: {'map'})
+    def get_nearest_entities():
+        lat = request.args.get('lat', type=float)
+        lng = request.args.get('lng', type=float)
+        k = request.args.get('k', type=int, default=20)
+        entity_type = request.args.get('entity_type')
+        if lat is None or lng is None:
+            return jsonify({'error': 'lat et lng sont requis'}), 400
+        # Comparaisons fausses pour nan : rejeté comme inf et les valeurs hors limites
+        if not (-90.0 <= lat <= 90.0 and -180.0 <= lng <= 180.0):
+            return jsonify({'error': 'lat doit être entre -90 et 90, lng entre -180 et 180'}), 400
+        if k <= 0 or k > app.config['MAP_NEAREST_MAX_K']:
+            return jsonify({'error': 'k doit être compris entre 1 et %d' % app.config['MAP_NEAREST_MAX_K']}), 400
+        if entity_type not in (None, 'company', 'job'):
+            return jsonify({'error': "entity_type doit valoir 'company' ou 'job'"}), 400
+        index = get_spatial_index(app)
+        selected = nearest_candidates(index, lat, lng, k, entity_type, app.config['MAP_NEAREST_START_KM'],
+                                      app.config['MAP_NEAREST_MAX_KM'], app.config['MAP_GEOHASH_MAX_PREFIXES'])
+        distances = {candidate.id: distance for candidate, distance in selected}
+        locations = candidate_locations(index, [candidate for candidate, _ in selected])
+        results = []
+        for kind, entity_dict in located_payloads(locations, distances):
+            entity_dict['entity_type'] = kind
+            results.append(entity_dict)
+        return jsonify({
+            'center': {
+                'lat': lat,
+                'lng': lng
+            },
+            'k': k,
+            'entity_type': entity_type,
+            'results': results
+        })
+
+    @app.route('/map/heatmap', methods=['GET'])
+    @cached(lambda view_args, data: {'map'})
+    def get_heatmap():
+        bbox = [request.args.get(key, type=float) for key in ('min_lat', 'max_lat', 'min_lng', 'max_lng')]
+        zoom = request.args.get('zoom', type=int, default=6)
+        if None in bbox:
+            return jsonify({'error': 'min_lat, max_lat, min_lng et max_lng sont requis'}), 400
+        if not all(math.isfinite(value) for value in bbox):
+            return jsonify({'error': 'bbox invalide'}), 400
+        min_lat, max_lat, min_lng, max_lng = bbox
+        if min_lat > max_lat or min_lng > max_lng:
+            return jsonify({'error': 'bbox invalide'}), 400
+        try:
+            filters = parse_filters(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        zoom = min(max(zoom, 0), 22)
+        size = cell_size(zoom, app.config['MAP_HEATMAP_CELLS_PER_TILE'])
+        if ((max_lat - min_lat) / size + 1) * ((max_lng - min_lng) / size + 1) > app.config['MAP_HEATMAP_MAX_CELLS']:
+            return jsonify({'error': 'Zone trop grande pour ce niveau de zoom'}), 400
+        cells, size = heatmap_cells(min_lat, max_lat, min_lng, max_lng, zoom, filters,
+                                    app.config['MAP_HEATMAP_CELLS_PER_TILE'],
+                                    app.config['MAP_GEOHASH_MAX_PREFIXES'])
+        return jsonify({
+            'zoom': zoom,
+            'cell_size_deg': size,
+            'fields': ['lat', 'lng', 'count'],
+            'cells': cells,
+            'total': sum(cell[2] for cell in cells),
+            'max': max((cell[2] for cell in cells), default=0)
+        })
+
+    @app.route('/map/entities/batch', methods=['POST'])
+    def get_entities_in_map_zones():
+        payload = request.get_json(silent=True) or {}
+        raw_viewports = payload.get('viewports') if isinstance(payload, dict) else None
+        if not isinstance(raw_viewports, list) or not raw_viewports:
+            return jsonify({'error': 'viewports doit être une liste non vide'}), 400
+        if len(raw_viewports) > app.config['MAP_BATCH_MAX_VIEWPORTS']:
+            return jsonify({'error': 'Trop de viewports (max %d)' % app.config['MAP_BATCH_MAX_VIEWPORTS']}), 400
+        viewports = []
+        for position, raw in enumerate(raw_viewports):
+            try:
+                if not isinstance(raw, dict):
+                    raise ValueError('objet attendu')
+                viewports.append(parse_viewport(raw))
+            except ValueError as e:
+                return jsonify({'error': 'viewport %d : %s' % (position, e)}), 400
+        index = get_spatial_index(app)
+        candidates = union_candidates(index, [viewport_bbox(v) for v in viewports],
+                                      app.config['MAP_GEOHASH_MAX_PREFIXES'])
+        selections = [filter_by_radius(candidates, v.center_lat, v.center_lng, v.radius_km,
+                                       sort_by_distance=v.sort == 'distance', limit=v.limit)
+                      for v in viewports]
+        selected = {}
+        for selection in selections:
+            for candidate, _ in selection:
+                selected[candidate.id] = candidate
+        locations = candidate_locations(index, list(selected.values()))
+        companies, jobs = map_payloads(locations)
+        known = {entity['id'] for entity in companies + jobs}
+        results = []
+        for raw, viewport, selection in zip(raw_viewports, viewports, selections):
+            kept = [(c, d) for c, d in selection if str(c.entity_id) in known]
+            results.append({
+                'id': raw.get('id'),
+                'center': {
+                    'lat': viewport.center_lat,
+                    'lng': viewport.center_lng
+                },
+                'radius_km': viewport.radius_km,
+                'zoom_level': viewport.zoom_level,
+                'companies': [{'id': str(c.entity_id), 'distance_km': d}
+                              for c, d in kept if c.entity_type == 'company'],
+                'jobs': [{'id': str(c.entity_id), 'distance_km': d}
+                         for c, d in kept if c.entity_type == 'job'],
+                'total_entities': len(kept)
+            })
+        return jsonify({
+            'viewports': results,
+            'companies': companies,
+            'jobs': jobs
         })
 
+    @app.route('/map/tiles/<int:z>/<int:x>/<int:y>', methods=['GET'])
+    def get_map_tile(z, x, y):
+        if not valid_tile(z, x, y):
+            return jsonify({'error': 'Tuile invalide'}), 404
+        body, etag = render_tile(app, get_spatial_index(app), z, x, y)
+        response = app.response_class(body, mimetype='application/geo+json')
+        response.set_etag(etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = app.config['MAP_TILE_MAX_AGE']
+        return response.make_conditional(request)
+
+    @app.route('/metrics', methods=['GET'])
+    def get_metrics():
+        metrics = app.extensions.get('metrics')
+        if metrics is None:
+            return jsonify({'error': 'Métriques désactivées'}), 404
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+    @app.route('/cache/stats', methods=['GET'])
+    def get_cache_stats():
+        cache = app.extensions.get('response_cache')
+        if cache is None:
+            return jsonify({'enabled': False})
+        return jsonify({'enabled': True, **cache.snapshot()})
+
+    @app.route('/health/live', methods=['GET'])
+    def liveness():
+        # Le processus répond : aucune dépendance vérifiée, une base en panne ne justifie pas un redémarrage
+        return jsonify({'status': 'ok'})
+
+    @app.route('/health/ready', methods=['GET'])
+    def readiness():
+        database = test_db_connection()
+        warmed_up = not app.config.get('WARMUP_ENABLED') or app.extensions.get('warmed_up', False)
+        ready = database and warmed_up
+        payload = {'status': 'ok' if ready else 'unavailable', 'database': database, 'warmed_up': warmed_up}
+        return jsonify(payload), 200 if ready else 503
+
     return app
 
-import os
 if __name__ == "__main__":
     app = create_app()
+    if app.config.get('WARMUP_ENABLED'):
+        from services.server import warm_up
+        warm_up(app)
     app.run()
@@ -0,0 +1,43 @@
+import argparse
+import json
+import sys
+
+
+def compare(baseline, current, metric='p50_ms', threshold=0.2):
+    rows = []
+    regressions = []
+    for size, result in sorted(current['results'].items(), key=lambda item: int(item[0])):
+        base_result = baseline['results'].get(size, {}).get('scenarios', {})
+        for name, stats in sorted(result['scenarios'].items()):
+            before = base_result.get(name, {}).get(metric)
+            after = stats[metric]
+            change = (after - before) / before if before else None
+            rows.append((size, name, before, after, change))
+            if change is not None and change > threshold:
+                regressions.append((size, name, change))
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare deux rapports de bench.run")
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--metric', default='p50_ms')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="Hausse relative au-delà de laquelle un scénario est en régression")
+    args = parser.parse_args(argv)
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    rows, regressions = compare(baseline, current, args.metric, args.threshold)
+    for size, name, before, after, change in rows:
+        delta = f"{change:+.1%}" if change is not None else "n/a"
+        print(f"{size:>8} {name:<22} {before if before is not None else '-':>10} {after:>10} {delta:>8}")
+    for size, name, change in regressions:
+        print(f"REGRESSION {size} {name}: {change:+.1%}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,123 @@
+import datetime
+import uuid
+
+import numpy as np
+from sqlalchemy import insert
+
+from extensions import db
+from models.company import Company
+from models.job import Job
+from models.location import Location
+from services.geo import geohash_encode
+from services.map_entities import read_model_mode, rebuild_entities
+
+# (ville, latitude, longitude, poids, dispersion en km)
+CITIES = [
+    ("Paris", 48.8566, 2.3522, 0.35, 8.0),
+    ("Lyon", 45.7640, 4.8357, 0.12, 5.0),
+    ("Marseille", 43.2965, 5.3698, 0.10, 6.0),
+    ("Toulouse", 43.6047, 1.4442, 0.08, 5.0),
+    ("Lille", 50.6292, 3.0573, 0.07, 4.0),
+    ("Bordeaux", 44.8378, -0.5792, 0.07, 4.0),
+    ("Nantes", 47.2184, -1.5536, 0.06, 4.0),
+    ("Strasbourg", 48.5734, 7.7521, 0.05, 3.0),
+    ("Rennes", 48.1173, -1.6778, 0.05, 3.0),
+    ("Montpellier", 43.6108, 3.8767, 0.05, 3.0),
+]
+RURAL_SHARE = 0.1
+FRANCE_BBOX = (42.5, 50.9, -4.5, 7.8)
+JOB_TITLES = ["Développeur", "Data analyst", "Comptable", "Vendeur", "Infirmier",
+              "Chef de projet", "Technicien", "Commercial", "Serveur", "Assistant RH"]
+JOB_TYPES = ['full_time', 'part_time', 'internship', 'contract']
+JOB_TYPE_WEIGHTS = [0.55, 0.2, 0.1, 0.15]
+WORDS = ("poste mission équipe client projet expérience compétences outils horaires "
+         "formation salaire avantages entreprise contrat travail").split()
+BATCH_SIZE = 10000
+EPOCH = datetime.datetime(2024, 1, 1)
+
+
+def _uuids(rng, count):
+    raw = rng.integers(0, 256, size=(count, 16), dtype=np.uint8)
+    return [uuid.UUID(bytes=bytes(row), version=4) for row in raw]
+
+
+def _text(rng, min_words, max_words):
+    return ' '.join(rng.choice(WORDS, size=int(rng.integers(min_words, max_words))))
+
+
+def sample_points(rng, count):
+    # Points regroupés autour des villes, plus une part répartie uniformément sur le territoire
+    weights = np.array([city[3] for city in CITIES])
+    weights = weights / weights.sum() * (1 - RURAL_SHARE)
+    choice = rng.choice(len(CITIES) + 1, size=count, p=np.append(weights, RURAL_SHARE))
+    lats = rng.uniform(FRANCE_BBOX[0], FRANCE_BBOX[1], size=count)
+    lngs = rng.uniform(FRANCE_BBOX[2], FRANCE_BBOX[3], size=count)
+    for i, (_, lat, lng, _, spread_km) in enumerate(CITIES):
+        mask = choice == i
+        n = int(mask.sum())
+        lats[mask] = lat + rng.normal(0, spread_km / 111.0, size=n)
+        lngs[mask] = lng + rng.normal(0, spread_km / (111.0 * np.cos(np.radians(lat))), size=n)
+    return np.round(lats, 6), np.round(lngs, 6)
+
+
+def _insert(table, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(insert(table), rows[start:start + BATCH_SIZE])
+
+
+def _locations(rng, entity_type, ids):
+    lats, lngs = sample_points(rng, len(ids))
+    location_ids = _uuids(rng, len(ids))
+    return [{
+        'id': location_ids[i],
+        'entity_type': entity_type,
+        'entity_id': ids[i],
+        'latitude': float(lats[i]),
+        'longitude': float(lngs[i]),
+        'address': f"{i} rue de la Gare",
+        'cp': "75000",
+        'created_at': EPOCH,
+        'geohash': geohash_encode(float(lats[i]), float(lngs[i]))
+    } for i in range(len(ids))]
+
+
+def generate(job_count, seed=42, jobs_per_company=10):
+    rng = np.random.default_rng(seed)
+    company_count = max(1, job_count // jobs_per_company)
+    company_ids = _uuids(rng, company_count)
+    user_ids = _uuids(rng, company_count)
+    company_offsets = rng.integers(0, 365 * 24 * 3600, size=company_count)
+    companies = [{
+        'id': company_ids[i],
+        'user_id': user_ids[i],
+        'name': f"Entreprise {i}",
+        'description': _text(rng, 20, 80),
+        'website': f"https://entreprise{i}.example.com",
+        'created_at': EPOCH + datetime.timedelta(seconds=int(company_offsets[i])),
+        'image_url': None
+    } for i in range(company_count)]
+    job_ids = _uuids(rng, job_count)
+    owners = rng.integers(0, company_count, size=job_count)
+    salaries = np.round(rng.lognormal(10.4, 0.35, size=job_count), 2)
+    job_types = rng.choice(JOB_TYPES, size=job_count, p=JOB_TYPE_WEIGHTS)
+    titles = rng.choice(JOB_TITLES, size=job_count)
+    job_offsets = rng.integers(0, 365 * 24 * 3600, size=job_count)
+    jobs = [{
+        'id': job_ids[i],
+        'company_id': company_ids[owners[i]],
+        'title': str(titles[i]),
+        'description': _text(rng, 50, 200),
+        'salary': float(salaries[i]),
+        'job_type': str(job_types[i]),
+        'posted_at': EPOCH + datetime.timedelta(seconds=int(job_offsets[i])),
+        'image_url': None
+    } for i in range(job_count)]
+    _insert(Company.__table__, companies)
+    _insert(Job.__table__, jobs)
+    _insert(Location.__table__, _locations(rng, 'company', company_ids))
+    _insert(Location.__table__, _locations(rng, 'job', job_ids))
+    db.session.commit()
+    # Insertions Core hors session : la table de lecture est reconstruite d'un bloc
+    if read_model_mode() != 'off':
+        rebuild_entities()
+    return company_ids, job_ids
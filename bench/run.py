@@ -0,0 +1,144 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from app import create_app
+from bench.generate import CITIES, generate
+from extensions import db
+from services.geo import tiles_for_point
+
+PARIS = CITIES[0]
+
+
+def scenarios(company_ids, job_ids):
+    paris_tiles = tiles_for_point(PARIS[1], PARIS[2], 16)
+    return {
+        'home': lambda i: '/',
+        'companies_page': lambda i: '/companies?limit=100',
+        'jobs_page': lambda i: '/jobs?limit=100&fields=id,title,salary,job_type,location',
+        'company_detail': lambda i: f'/companies/{company_ids[i % len(company_ids)]}',
+        'job_detail': lambda i: f'/jobs/{job_ids[i % len(job_ids)]}',
+        'map_city_center': lambda i: f'/map/entities?center_lat={PARIS[1]}&center_lng={PARIS[2]}'
+                                     '&radius_km=1&sort=distance&limit=200',
+        'map_region_clusters': lambda i: f'/map/entities?center_lat={PARIS[1]}&center_lng={PARIS[2]}'
+                                         '&radius_km=200&zoom_level=7&cluster=true',
+        'map_tile_clusters': lambda i: '/map/tiles/%d/%d/%d' % paris_tiles[10],
+        'map_tile_entities': lambda i: '/map/tiles/%d/%d/%d' % paris_tiles[16],
+        'jobs_search': lambda i: '/jobs/search?q=chef%20projet&limit=20',
+    }
+
+
+def time_scenario(client, app, url_for, repeat, warmup):
+    for i in range(warmup):
+        client.get(url_for(i))
+    timings = []
+    sizes = []
+    for i in range(repeat):
+        tile_cache = app.extensions.get('tile_cache')
+        if tile_cache is not None:
+            tile_cache.clear()
+        started = time.perf_counter()
+        response = client.get(url_for(i))
+        timings.append((time.perf_counter() - started) * 1000)
+        if response.status_code != 200:
+            raise RuntimeError(f"{url_for(i)} -> {response.status_code}")
+        sizes.append(len(response.get_data()))
+    timings = np.array(timings)
+    return {
+        'repeat': repeat,
+        'mean_ms': round(float(timings.mean()), 3),
+        'p50_ms': round(float(np.percentile(timings, 50)), 3),
+        'p95_ms': round(float(np.percentile(timings, 95)), 3),
+        'min_ms': round(float(timings.min()), 3),
+        'max_ms': round(float(timings.max()), 3),
+        'response_bytes': int(np.median(sizes))
+    }
+
+
+def run_size(size, args, database_url):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': database_url,
+        'RESPONSE_CACHE_BACKEND': 'memory' if args.with_cache else 'none',
+        'SPATIAL_INDEX_ENABLED': args.spatial_index,
+    })
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        started = time.perf_counter()
+        company_ids, job_ids = generate(size, seed=args.seed)
+        generation_s = time.perf_counter() - started
+    results = {'generation_s': round(generation_s, 3), 'scenarios': {}}
+    selected = scenarios(company_ids, job_ids)
+    with app.test_client() as client:
+        for name, url_for in selected.items():
+            if args.only and name not in args.only:
+                continue
+            results['scenarios'][name] = time_scenario(client, app, url_for, args.repeat, args.warmup)
+            print(f"[{size}] {name}: p50={results['scenarios'][name]['p50_ms']} ms", file=sys.stderr)
+    with app.app_context():
+        db.drop_all()
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks des routes sur données synthétiques")
+    parser.add_argument('--sizes', default='10000,100000',
+                        help="Nombres d'offres générées, séparés par des virgules (ex : 10000,100000,1000000)")
+    parser.add_argument('--repeat', type=int, default=30)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--only', nargs='*', help="Limiter aux scénarios nommés")
+    parser.add_argument('--database-url', help="Base dédiée au benchmark (ses tables sont supprimées) ; "
+                                               "SQLite temporaire par défaut")
+    parser.add_argument('--spatial-index', action='store_true', help="Activer l'index spatial en mémoire")
+    parser.add_argument('--with-cache', action='store_true', help="Garder le cache de réponses actif")
+    parser.add_argument('--output', help="Fichier JSON du rapport (sortie standard par défaut)")
+    args = parser.parse_args(argv)
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'date': datetime.datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'spatial_index': args.spatial_index,
+            'with_cache': args.with_cache
+        },
+        'results': {}
+    }
+    for size in [int(s) for s in args.sizes.split(',')]:
+        if args.database_url:
+            report['results'][str(size)] = run_size(size, args, args.database_url)
+            continue
+        with tempfile.TemporaryDirectory() as tmp:
+            database_url = 'sqlite:///' + os.path.join(tmp, 'bench.db')
+            report['results'][str(size)] = run_size(size, args, database_url)
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    return report
+
+
+if __name__ == '__main__':
+    main()
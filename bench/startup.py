@@ -0,0 +1,127 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from bench.run import git_commit
+
+# Exécuté dans un interpréteur neuf : aucun module de l'application n'est encore importé
+CHILD = r'''
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+application = app.create_app()
+created = time.perf_counter()
+if application.config.get('WARMUP_ENABLED'):
+    from services.server import warm_up
+    warm_up(application)
+warmed = time.perf_counter()
+response = application.test_client().get(sys.argv[1])
+first = time.perf_counter()
+ready_at = time.time()
+if response.status_code != 200:
+    raise SystemExit("%s -> %d" % (sys.argv[1], response.status_code))
+second_started = time.perf_counter()
+application.test_client().get(sys.argv[1])
+done = time.perf_counter()
+print(json.dumps({
+    'import': (imported - started) * 1000,
+    'create_app': (created - imported) * 1000,
+    'warm_up': (warmed - created) * 1000,
+    'first_request': (first - warmed) * 1000,
+    'second_request': (done - second_started) * 1000,
+    'ready_at': ready_at,
+}))
+'''
+
+DEFAULT_PATH = '/map/entities?center_lat=48.8566&center_lng=2.3522&radius_km=1'
+
+
+def stats(values):
+    values = np.array(values)
+    return {
+        'repeat': len(values),
+        'mean_ms': round(float(values.mean()), 3),
+        'p50_ms': round(float(np.percentile(values, 50)), 3),
+        'p95_ms': round(float(np.percentile(values, 95)), 3),
+        'min_ms': round(float(values.min()), 3),
+        'max_ms': round(float(values.max()), 3)
+    }
+
+
+def run_child(path, env):
+    # total : du lancement du processus à la fin de la première réponse, interpréteur compris
+    started = time.time()
+    output = subprocess.run([sys.executable, '-c', CHILD, path], env=env, check=True,
+                            capture_output=True, text=True).stdout
+    timings = json.loads(output.strip().splitlines()[-1])
+    timings['total'] = (timings.pop('ready_at') - started) * 1000
+    return timings
+
+
+def measure(size, args, database_url):
+    env = dict(os.environ, DATABASE_URL=database_url, PYTHONPATH=os.getcwd(),
+               WARMUP_ENABLED='true' if args.warmup else 'false',
+               SPATIAL_INDEX_ENABLED='true' if args.spatial_index else 'false')
+    samples = [run_child(args.path, env) for _ in range(args.repeat)]
+    scenarios = {name: stats([sample[name] for sample in samples]) for name in samples[0]}
+    print(f"[{size}] time-to-first-request p50={scenarios['total']['p50_ms']} ms", file=sys.stderr)
+    return {'scenarios': scenarios}
+
+
+def prepare(size, database_url):
+    from app import create_app
+    from bench.generate import generate
+    from extensions import db
+    app = create_app({'SQLALCHEMY_DATABASE_URI': database_url})
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        generate(size)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Temps de démarrage à froid jusqu'à la première réponse")
+    parser.add_argument('--sizes', default='1000', help="Nombres d'offres générées, séparés par des virgules")
+    parser.add_argument('--repeat', type=int, default=10, help="Nombre de démarrages mesurés")
+    parser.add_argument('--path', default=DEFAULT_PATH, help="Route de la première requête")
+    parser.add_argument('--warmup', action='store_true', help="Activer la phase de warm-up (WARMUP_ENABLED)")
+    parser.add_argument('--spatial-index', action='store_true', help="Activer l'index spatial en mémoire")
+    parser.add_argument('--database-url', help="Base dédiée au benchmark (ses tables sont supprimées) ; "
+                                               "SQLite temporaire par défaut")
+    parser.add_argument('--output', help="Fichier JSON du rapport (sortie standard par défaut)")
+    args = parser.parse_args(argv)
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'python': sys.version.split()[0],
+            'path': args.path,
+            'repeat': args.repeat,
+            'warmup': args.warmup,
+            'spatial_index': args.spatial_index
+        },
+        'results': {}
+    }
+    for size in [int(s) for s in args.sizes.split(',')]:
+        with tempfile.TemporaryDirectory() as tmp:
+            database_url = args.database_url or 'sqlite:///' + os.path.join(tmp, 'startup.db')
+            prepare(size, database_url)
+            report['results'][str(size)] = measure(size, args, database_url)
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    return report
+
+
+if __name__ == '__main__':
+    main()
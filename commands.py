@@ -0,0 +1,145 @@
+import datetime
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import inspect, text
+
+from extensions import db
+from models.company import Company
+from models.job import Job
+from models.location import Location
+from services.geo import geohash_encode
+from services.ingest import KINDS, Ingestor
+from services.map_entities import install_entity_triggers, rebuild_entities
+from services.sync import install_change_log, prune_changes
+
+locations_cli = AppGroup('locations', help='Maintenance de la table locations.')
+ingest_cli = AppGroup('ingest', help='Import massif de fichiers CSV ou GeoJSON.')
+jobs_cli = AppGroup('jobs', help='Maintenance de la table jobs.')
+sync_cli = AppGroup('sync', help='Journal des modifications pour la synchronisation de la carte.')
+map_cli = AppGroup('map', help='Table de lecture map_entities servie par /map/entities.')
+
+
+def ensure_geohash_column():
+    inspector = inspect(db.engine)
+    columns = {column['name'] for column in inspector.get_columns('locations')}
+    if 'geohash' not in columns:
+        db.session.execute(text('ALTER TABLE locations ADD COLUMN geohash VARCHAR(12)'))
+        click.echo("Colonne locations.geohash ajoutée")
+    indexes = {index['name'] for index in inspector.get_indexes('locations')}
+    if 'ix_locations_geohash_entity_type' not in indexes:
+        db.session.execute(text(
+            'CREATE INDEX ix_locations_geohash_entity_type ON locations (geohash, entity_type)'
+        ))
+        click.echo("Index ix_locations_geohash_entity_type créé")
+    db.session.commit()
+
+
+@locations_cli.command('backfill-geohash')
+@click.option('--batch-size', default=1000, show_default=True, help='Nombre de lignes par lot.')
+def backfill_geohash(batch_size):
+    """Calcule le geohash des localisations qui n'en ont pas encore."""
+    ensure_geohash_column()
+    total = 0
+    while True:
+        rows = db.session.query(Location.id, Location.latitude, Location.longitude).filter(
+            Location.geohash.is_(None)
+        ).limit(batch_size).all()
+        if not rows:
+            break
+        db.session.execute(
+            Location.__table__.update().where(Location.__table__.c.id == db.bindparam('location_id')),
+            [{'location_id': row.id,
+              'geohash': geohash_encode(float(row.latitude), float(row.longitude))} for row in rows]
+        )
+        db.session.commit()
+        total += len(rows)
+        click.echo(f"{total} localisations mises à jour")
+    click.echo(f"Terminé : {total} localisations rétro-remplies")
+
+
+def _ingest_command(kind):
+    @ingest_cli.command(kind, help=f"Importe des {kind} depuis un fichier CSV ou GeoJSON.")
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--format', 'fmt', type=click.Choice(['csv', 'geojson']),
+                  help="Format du fichier (déduit de l'extension par défaut).")
+    @click.option('--chunk-size', default=5000, show_default=True, help='Nombre d\'enregistrements par lot.')
+    @click.option('--resume', is_flag=True, help='Reprendre après le dernier lot validé.')
+    @click.option('--rejects', type=click.Path(dir_okay=False), help='Fichier NDJSON des lignes rejetées.')
+    def command(path, fmt, chunk_size, resume, rejects):
+        fmt = fmt or ('geojson' if path.endswith(('.geojson', '.json')) else 'csv')
+        try:
+            ingestor = Ingestor(kind, path, fmt, chunk_size, rejects, echo=click.echo)
+        except RuntimeError as e:
+            raise click.ClickException(str(e))
+        stats = ingestor.run(resume=resume)
+        click.echo(f"Terminé : {stats['written']} écrits, {stats['rejected']} rejetés "
+                   f"en {stats['seconds']} s ({stats['rows_per_second']} lignes/s)")
+        if stats['rejected']:
+            click.echo(f"Lignes rejetées : {ingestor.rejects_path}")
+    return command
+
+
+for _kind in KINDS:
+    _ingest_command(_kind)
+
+
+@jobs_cli.command('create-indexes')
+def create_job_indexes():
+    """Crée les index de jobs et companies utilisés par les filtres de la carte et la recherche."""
+    for table in (Job.__table__, Company.__table__):
+        existing = {index['name'] for index in inspect(db.engine).get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            # Les index plein texte ne sont créés que sous PostgreSQL
+            index.create(db.engine)
+            if index.name in {i['name'] for i in inspect(db.engine).get_indexes(table.name)}:
+                click.echo(f"Index {index.name} créé")
+    click.echo("Index de jobs à jour")
+
+
+@sync_cli.command('install')
+def sync_install():
+    """Crée la table map_changes et, sous PostgreSQL, les triggers qui l'alimentent."""
+    if install_change_log():
+        click.echo("Triggers installés : passez MAP_SYNC_CHANGE_LOG=trigger pour ne pas journaliser deux fois")
+    else:
+        click.echo("Table map_changes créée (journalisation par la session SQLAlchemy)")
+
+
+@sync_cli.command('prune')
+@click.option('--days', default=7, show_default=True, help='Âge maximal des entrées conservées.')
+def sync_prune(days):
+    """Supprime les entrées du journal plus anciennes que --days."""
+    older_than = datetime.datetime.utcnow() - datetime.timedelta(days=days)
+    click.echo(f"{prune_changes(older_than)} entrées supprimées")
+
+
+@map_cli.command('rebuild')
+@click.option('--batch-size', default=5000, show_default=True, help='Nombre de localisations par lot.')
+def map_rebuild(batch_size):
+    """Crée si besoin la table map_entities et la reconstruit entièrement depuis les tables sources."""
+    total = rebuild_entities(batch_size, echo=click.echo)
+    click.echo(f"Terminé : {total} entités dans map_entities")
+
+
+@map_cli.command('install')
+@click.option('--batch-size', default=5000, show_default=True, help='Nombre de localisations par lot.')
+def map_install(batch_size):
+    """Crée la table map_entities, sous PostgreSQL les triggers qui la tiennent à jour, puis la remplit."""
+    triggers = install_entity_triggers()
+    total = rebuild_entities(batch_size, echo=click.echo)
+    click.echo(f"Terminé : {total} entités dans map_entities")
+    if triggers:
+        click.echo("Triggers installés : passez MAP_READ_MODEL=trigger pour ne pas mettre à jour deux fois")
+    else:
+        click.echo("Pas de triggers hors PostgreSQL : passez MAP_READ_MODEL=session")
+
+
+def register_commands(app):
+    app.cli.add_command(locations_cli)
+    app.cli.add_command(ingest_cli)
+    app.cli.add_command(jobs_cli)
+    app.cli.add_command(sync_cli)
+    app.cli.add_command(map_cli)
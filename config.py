@@ -3,3 +3,63 @@ import os
 class Config:
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    DATABASE_REPLICA_URL = os.getenv('DATABASE_REPLICA_URL')
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '20'))
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '10'))
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+    DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'
+    DB_POOL_SATURATION_RATIO = float(os.getenv('DB_POOL_SATURATION_RATIO', '0.9'))
+    DB_CONNECT_TIMEOUT = int(os.getenv('DB_CONNECT_TIMEOUT', '5'))
+    DB_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', '0'))
+    REPLICA_CHECK_SECONDS = float(os.getenv('REPLICA_CHECK_SECONDS', '10'))
+    REPLICA_RETRY_SECONDS = float(os.getenv('REPLICA_RETRY_SECONDS', '30'))
+    REPLICA_MAX_LAG_SECONDS = float(os.getenv('REPLICA_MAX_LAG_SECONDS', '30'))
+    SPATIAL_INDEX_ENABLED = os.getenv('SPATIAL_INDEX_ENABLED', 'false').lower() == 'true'
+    SPATIAL_INDEX_CELL_DEG = float(os.getenv('SPATIAL_INDEX_CELL_DEG', '0.05'))
+    SPATIAL_INDEX_REFRESH_SECONDS = float(os.getenv('SPATIAL_INDEX_REFRESH_SECONDS', '5'))
+    MAP_CLUSTER_MAX_ZOOM = int(os.getenv('MAP_CLUSTER_MAX_ZOOM', '14'))
+    MAP_CLUSTER_CELLS_PER_TILE = int(os.getenv('MAP_CLUSTER_CELLS_PER_TILE', '4'))
+    MAP_CLUSTER_CACHE_SECONDS = float(os.getenv('MAP_CLUSTER_CACHE_SECONDS', '60'))
+    MAP_TILE_CACHE_SIZE = int(os.getenv('MAP_TILE_CACHE_SIZE', '1024'))
+    MAP_TILE_CACHE_SECONDS = float(os.getenv('MAP_TILE_CACHE_SECONDS', '300'))
+    MAP_TILE_MAX_AGE = int(os.getenv('MAP_TILE_MAX_AGE', '60'))
+    LIST_MAX_LIMIT = int(os.getenv('LIST_MAX_LIMIT', '1000'))
+    LOOKUP_MAX_IDS = int(os.getenv('LOOKUP_MAX_IDS', '500'))
+    STREAM_BATCH_SIZE = int(os.getenv('STREAM_BATCH_SIZE', '1000'))
+    RESPONSE_CACHE_BACKEND = os.getenv('RESPONSE_CACHE_BACKEND', 'memory')
+    RESPONSE_CACHE_SECONDS = float(os.getenv('RESPONSE_CACHE_SECONDS', '30'))
+    RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', '2048'))
+    RESPONSE_CACHE_MAX_BYTES = int(os.getenv('RESPONSE_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+    RESPONSE_CACHE_REDIS_URL = os.getenv('RESPONSE_CACHE_REDIS_URL', 'redis://localhost:6379/0')
+    MAP_GEOHASH_MAX_PREFIXES = int(os.getenv('MAP_GEOHASH_MAX_PREFIXES', '16'))
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_SLOW_REQUEST_MS = float(os.getenv('METRICS_SLOW_REQUEST_MS', '500'))
+    METRICS_MAX_QUERIES = int(os.getenv('METRICS_MAX_QUERIES', '20'))
+    METRICS_MULTIPROC_DIR = os.getenv('METRICS_MULTIPROC_DIR')
+    METRICS_FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', '5'))
+    MAP_BATCH_MAX_VIEWPORTS = int(os.getenv('MAP_BATCH_MAX_VIEWPORTS', '20'))
+    MAP_NEAREST_MAX_K = int(os.getenv('MAP_NEAREST_MAX_K', '200'))
+    MAP_NEAREST_START_KM = float(os.getenv('MAP_NEAREST_START_KM', '5'))
+    MAP_NEAREST_MAX_KM = float(os.getenv('MAP_NEAREST_MAX_KM', '2000'))
+    MAP_HEATMAP_CELLS_PER_TILE = int(os.getenv('MAP_HEATMAP_CELLS_PER_TILE', '8'))
+    MAP_HEATMAP_MAX_CELLS = int(os.getenv('MAP_HEATMAP_MAX_CELLS', '40000'))
+    MAP_SYNC_CHANGE_LOG = os.getenv('MAP_SYNC_CHANGE_LOG', 'session')
+    MAP_READ_MODEL = os.getenv('MAP_READ_MODEL', 'off')
+    MAP_SYNC_MAX_CHANGES = int(os.getenv('MAP_SYNC_MAX_CHANGES', '5000'))
+    MAP_SYNC_WINDOW_SECONDS = float(os.getenv('MAP_SYNC_WINDOW_SECONDS', '10'))
+    MAP_CHANGE_POLL_SECONDS = float(os.getenv('MAP_CHANGE_POLL_SECONDS', '1'))
+    SEARCH_MAX_LIMIT = int(os.getenv('SEARCH_MAX_LIMIT', '100'))
+    SEARCH_INDEX_REFRESH_SECONDS = float(os.getenv('SEARCH_INDEX_REFRESH_SECONDS', '300'))
+    JSON_BACKEND = os.getenv('JSON_BACKEND', 'json')
+    JSON_ENSURE_ASCII = os.getenv('JSON_ENSURE_ASCII', 'true').lower() == 'true'
+    COMPRESSION_ENABLED = os.getenv('COMPRESSION_ENABLED', 'true').lower() == 'true'
+    COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', '1024'))
+    COMPRESSION_ENCODINGS = os.getenv('COMPRESSION_ENCODINGS', 'zstd,br,gzip')
+    COMPRESSION_GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', '6'))
+    COMPRESSION_BROTLI_LEVEL = int(os.getenv('COMPRESSION_BROTLI_LEVEL', '5'))
+    COMPRESSION_ZSTD_LEVEL = int(os.getenv('COMPRESSION_ZSTD_LEVEL', '3'))
+    WARMUP_ENABLED = os.getenv('WARMUP_ENABLED', 'false').lower() == 'true'
+    WARMUP_CONNECTIONS = int(os.getenv('WARMUP_CONNECTIONS', '2'))
+    WARMUP_PATHS = os.getenv('WARMUP_PATHS', '/map/entities?center_lat=48.8566&center_lng=2.3522&radius_km=1 '
+                                             '/jobs?limit=1 /companies?limit=1')
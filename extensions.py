@@ -1,4 +1,6 @@
 # extensions.py
 from flask_sqlalchemy import SQLAlchemy
 
-db = SQLAlchemy()
\ No newline at end of file
+from services.database import RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
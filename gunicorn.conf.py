@@ -0,0 +1,61 @@
+import multiprocessing
+import os
+import tempfile
+
+# Serveur de production : gunicorn -c gunicorn.conf.py wsgi:app
+bind = '0.0.0.0:%s' % os.getenv('PORT', '5000')
+workers = int(os.getenv('WEB_CONCURRENCY', str(min(multiprocessing.cpu_count() * 2 + 1, 8))))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+# SIGTERM / SIGHUP : les requêtes en cours ont ce délai pour se terminer avant l'arrêt du worker
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+# Workers recyclés périodiquement : limite la dérive mémoire des pages copiées depuis le maître
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '10000'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '1000'))
+# create_app est exécuté une seule fois dans le maître puis hérité par fork
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+# Chaque worker dépose ses compteurs dans ce répertoire : /metrics les additionne, quel que soit le worker
+# interrogé. Lu par Config lors du chargement de l'application, il est donc fixé avant le préchargement
+if not os.getenv('METRICS_MULTIPROC_DIR'):
+    os.environ['METRICS_MULTIPROC_DIR'] = tempfile.mkdtemp(prefix='cartographie-metrics-')
+metrics_dir = os.environ['METRICS_MULTIPROC_DIR']
+
+
+def when_ready(server):
+    if preload_app:
+        from services.server import preload_shared_state
+        from wsgi import app
+        preload_shared_state(app)
+
+
+def post_fork(server, worker):
+    if preload_app:
+        from services.server import after_fork
+        from wsgi import app
+        after_fork(app)
+
+
+def post_worker_init(worker):
+    # Exécuté dans chaque worker avant qu'il accepte des connexions : aucun client ne paie le démarrage
+    app = worker.wsgi
+    if app.config.get('WARMUP_ENABLED'):
+        from services.server import warm_up
+        warm_up(app)
+
+
+def worker_exit(server, worker):
+    # Les compteurs accumulés depuis la dernière écriture périodique ne sont pas perdus
+    extensions = getattr(getattr(worker, 'wsgi', None), 'extensions', {})
+    metrics = extensions.get('metrics')
+    if metrics is not None:
+        metrics.flush()
+
+
+def child_exit(server, worker):
+    # Exécuté dans le maître : les compteurs du worker terminé rejoignent l'archive commune
+    if os.path.isdir(metrics_dir):
+        from services.metrics import archive_worker
+        archive_worker(metrics_dir, worker.pid)
@@ -2,6 +2,7 @@ from sqlalchemy.dialects.postgresql import UUID
 import datetime
 import uuid
 from extensions import db
+from services.text_search import company_search_vector
 
 class Company(db.Model):
     __tablename__ = 'companies'
@@ -14,6 +15,11 @@ class Company(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     image_url = db.Column(db.String(255), nullable=True)
 
+    __table_args__ = (
+        db.Index('ix_companies_name_search', company_search_vector(name),
+                 postgresql_using='gin').ddl_if(dialect='postgresql'),
+    )
+
     def to_dict(self):
         return {
             "id": str(self.id),
@@ -1,20 +1,34 @@
 from sqlalchemy.dialects.postgresql import UUID
 import datetime
 from extensions import db
+from services.text_search import job_search_vector
 import uuid
 
+JOB_TYPES = ('full_time', 'part_time', 'internship', 'contract')
+
 class Job(db.Model):
     __tablename__ = 'jobs'
 
     id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    company_id = db.Column(UUID(as_uuid=True), db.ForeignKey('companies.id', ondelete='CASCADE'), nullable=False)
+    # active_history : l'ancienne entreprise reste connue des invalidations de cache après un commit
+    company_id = db.column_property(
+        db.Column(UUID(as_uuid=True), db.ForeignKey('companies.id', ondelete='CASCADE'), nullable=False),
+        active_history=True)
     title = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text, nullable=False)
     salary = db.Column(db.Numeric(10,2), nullable=True)
-    job_type = db.Column(db.Enum('full_time', 'part_time', 'internship', 'contract', name='job_type_enum'), nullable=False)
+    job_type = db.Column(db.Enum(*JOB_TYPES, name='job_type_enum'), nullable=False)
     posted_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     image_url = db.Column(db.String(255), nullable=True)
 
+    __table_args__ = (
+        db.Index('ix_jobs_company_id_posted_at', 'company_id', 'posted_at'),
+        db.Index('ix_jobs_job_type_posted_at', 'job_type', 'posted_at'),
+        db.Index('ix_jobs_job_type_salary', 'job_type', 'salary'),
+        db.Index('ix_jobs_search', job_search_vector(title, description),
+                 postgresql_using='gin').ddl_if(dialect='postgresql'),
+    )
+
     def to_dict(self):
         return {
             "id": str(self.id),
@@ -1,21 +1,30 @@
 from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import event
 import datetime
 from extensions import db
+from services.geo import geohash_encode
 import uuid
 
 class Location(db.Model):
     __tablename__ = 'locations'
 
     id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    entity_type = db.Column(db.Enum('company', 'job', name='entity_type_enum'), nullable=False)
-    entity_id = db.Column(UUID(as_uuid=True), nullable=False)
-    latitude = db.Column(db.Numeric(9,6), nullable=False)
-    longitude = db.Column(db.Numeric(9,6), nullable=False)
+    # active_history : l'ancienne valeur est chargée avant modification, même sur une instance expirée,
+    # pour que les événements de modification (map_changes, tuiles, caches) connaissent l'ancienne position
+    entity_type = db.column_property(db.Column(db.Enum('company', 'job', name='entity_type_enum'), nullable=False),
+                                     active_history=True)
+    entity_id = db.column_property(db.Column(UUID(as_uuid=True), nullable=False), active_history=True)
+    latitude = db.column_property(db.Column(db.Numeric(9,6), nullable=False), active_history=True)
+    longitude = db.column_property(db.Column(db.Numeric(9,6), nullable=False), active_history=True)
     address = db.Column(db.Text)
     cp = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    geohash = db.Column(db.String(12), nullable=True)
 
-    __table_args__ = (db.UniqueConstraint('entity_type', 'entity_id', name='uix_entity_type_id'),)
+    __table_args__ = (
+        db.UniqueConstraint('entity_type', 'entity_id', name='uix_entity_type_id'),
+        db.Index('ix_locations_geohash_entity_type', 'geohash', 'entity_type'),
+    )
 
     def to_dict(self):
         return {
@@ -27,4 +36,10 @@ class Location(db.Model):
             "address": self.address,
             "cp": self.cp,
             "created_at": self.created_at.isoformat()
-        } 
\ No newline at end of file
+        } 
+
+@event.listens_for(Location, 'before_insert')
+@event.listens_for(Location, 'before_update')
+def set_geohash(mapper, connection, target):
+    if target.latitude is not None and target.longitude is not None:
+        target.geohash = geohash_encode(float(target.latitude), float(target.longitude))
@@ -0,0 +1,18 @@
+from sqlalchemy.dialects.postgresql import UUID
+import datetime
+from extensions import db
+
+class MapChange(db.Model):
+    __tablename__ = 'map_changes'
+
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True, autoincrement=True)
+    entity_type = db.Column(db.String(10), nullable=False)
+    entity_id = db.Column(UUID(as_uuid=True), nullable=False)
+    action = db.Column(db.String(10), nullable=False)
+    latitude = db.Column(db.Numeric(9,6), nullable=True)
+    longitude = db.Column(db.Numeric(9,6), nullable=True)
+    prev_latitude = db.Column(db.Numeric(9,6), nullable=True)
+    prev_longitude = db.Column(db.Numeric(9,6), nullable=True)
+    changed_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, index=True)
+
+    __table_args__ = {'sqlite_autoincrement': True}
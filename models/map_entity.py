@@ -0,0 +1,28 @@
+from sqlalchemy.dialects.postgresql import UUID
+import datetime
+from extensions import db
+
+class MapEntity(db.Model):
+    __tablename__ = 'map_entities'
+
+    # Une ligne par entité localisée : id de sa localisation, coordonnées, attributs filtrables
+    # et payload déjà prêt pour /map/entities
+    id = db.Column(UUID(as_uuid=True), primary_key=True)
+    entity_type = db.Column(db.String(10), nullable=False)
+    entity_id = db.Column(UUID(as_uuid=True), nullable=False)
+    company_id = db.Column(UUID(as_uuid=True), nullable=False)
+    latitude = db.Column(db.Numeric(9,6), nullable=False)
+    longitude = db.Column(db.Numeric(9,6), nullable=False)
+    geohash = db.Column(db.String(12), nullable=False)
+    job_type = db.Column(db.String(20), nullable=True)
+    salary = db.Column(db.Numeric(10,2), nullable=True)
+    posted_at = db.Column(db.DateTime, nullable=True)
+    payload = db.Column(db.JSON, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('entity_type', 'entity_id', name='uix_map_entities_entity'),
+        db.Index('ix_map_entities_geohash_entity_type', 'geohash', 'entity_type'),
+        db.Index('ix_map_entities_job_type_posted_at', 'job_type', 'posted_at'),
+        db.Index('ix_map_entities_company_id', 'company_id'),
+    )
@@ -0,0 +1,68 @@
+import logging
+from collections import namedtuple
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+Change = namedtuple('Change', 'action table values previous')
+
+TRACKED_TABLES = ('companies', 'jobs', 'locations')
+
+_subscribers = []
+
+
+def subscribe(callback):
+    # callback(app, changes) est appelé après chaque commit qui touche une table suivie
+    if callback not in _subscribers:
+        _subscribers.append(callback)
+
+
+def _snapshot(action, obj):
+    state = inspect(obj)
+    values = {}
+    previous = {}
+    for attr in state.mapper.column_attrs:
+        values[attr.key] = state.dict.get(attr.key)
+        if action == 'updated':
+            history = state.attrs[attr.key].history
+            if history.deleted:
+                previous[attr.key] = history.deleted[0]
+    return Change(action, state.mapper.local_table.name, values, previous)
+
+
+def flushed_changes(session):
+    changes = []
+    for action, objects in (('created', session.new), ('updated', session.dirty), ('deleted', session.deleted)):
+        for obj in objects:
+            if getattr(obj, '__tablename__', None) not in TRACKED_TABLES:
+                continue
+            if action == 'updated' and not session.is_modified(obj, include_collections=False):
+                continue
+            changes.append(_snapshot(action, obj))
+    return changes
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changes(session, flush_context):
+    session.info.setdefault('tracked_changes', []).extend(flushed_changes(session))
+
+
+@event.listens_for(Session, 'after_commit')
+def _dispatch_changes(session):
+    changes = session.info.pop('tracked_changes', None)
+    if not changes or not has_app_context():
+        return
+    app = current_app._get_current_object()
+    for callback in _subscribers:
+        try:
+            callback(app, changes)
+        except Exception:
+            logger.exception("Échec du traitement des modifications par %r", callback)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop('tracked_changes', None)
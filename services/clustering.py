@@ -0,0 +1,200 @@
+import itertools
+import logging
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+from sqlalchemy.exc import SQLAlchemyError
+
+from extensions import db
+from models.location import Location
+from services.change_events import subscribe
+from services.geo import lat_to_y, lng_to_x
+
+logger = logging.getLogger(__name__)
+
+ClusterLevel = namedtuple(
+    'ClusterLevel',
+    'cx cy count companies sum_lat sum_lng min_lat max_lat min_lng max_lng'
+)
+
+
+def _aggregate(cx, cy, count, companies, sum_lat, sum_lng, min_lat, max_lat, min_lng, max_lng):
+    keys = (cx.astype(np.int64) << 32) | cy.astype(np.int64)
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    size = len(unique_keys)
+
+    def total(values):
+        return np.bincount(inverse, weights=values, minlength=size)
+
+    def reduce(ufunc, values, initial):
+        out = np.full(size, initial, dtype=np.float64)
+        ufunc.at(out, inverse, values)
+        return out
+
+    return ClusterLevel(
+        cx=(unique_keys >> 32).astype(np.int64),
+        cy=(unique_keys & 0xFFFFFFFF).astype(np.int64),
+        count=total(count).astype(np.int64),
+        companies=total(companies).astype(np.int64),
+        sum_lat=total(sum_lat),
+        sum_lng=total(sum_lng),
+        min_lat=reduce(np.minimum, min_lat, np.inf),
+        max_lat=reduce(np.maximum, max_lat, -np.inf),
+        min_lng=reduce(np.minimum, min_lng, np.inf),
+        max_lng=reduce(np.maximum, max_lng, -np.inf)
+    )
+
+
+class ClusterPyramid:
+    # Grille de clusters par niveau de zoom, chaque niveau fusionnant les cellules du niveau inférieur
+    _generations = itertools.count(1)
+
+    def __init__(self, lats, lngs, is_company, max_zoom=14, cells_per_tile=4):
+        # generation distingue les pyramides successives (clé des tuiles de clusters en cache)
+        self.generation = next(self._generations)
+        self.max_zoom = max_zoom
+        self.cells_per_tile = cells_per_tile
+        self.levels = {}
+        lats = np.asarray(lats, dtype=np.float64)
+        lngs = np.asarray(lngs, dtype=np.float64)
+        scale = self._scale(max_zoom)
+        level = _aggregate(
+            np.floor(lng_to_x(lngs) * scale).astype(np.int64).clip(0, scale - 1),
+            np.floor(lat_to_y(lats) * scale).astype(np.int64).clip(0, scale - 1),
+            np.ones(len(lats)), np.asarray(is_company, dtype=np.float64),
+            lats, lngs, lats, lats, lngs, lngs
+        )
+        self.levels[max_zoom] = level
+        for zoom in range(max_zoom - 1, -1, -1):
+            level = _aggregate(level.cx >> 1, level.cy >> 1, level.count, level.companies,
+                               level.sum_lat, level.sum_lng, level.min_lat, level.max_lat,
+                               level.min_lng, level.max_lng)
+            self.levels[zoom] = level
+
+    def _scale(self, zoom):
+        return (2 ** zoom) * self.cells_per_tile
+
+    def tile_query(self, z, x, y):
+        # Les cellules sont alignées sur les tuiles : une tuile couvre cells_per_tile² cellules
+        k = self.cells_per_tile
+        return self._select(z, x * k, (x + 1) * k - 1, y * k, (y + 1) * k - 1)
+
+    def query(self, zoom, min_lat, max_lat, min_lng, max_lng):
+        zoom = min(max(zoom, 0), self.max_zoom)
+        scale = self._scale(zoom)
+        min_cx, max_cx = np.floor(lng_to_x([min_lng, max_lng]) * scale).astype(np.int64)
+        min_cy, max_cy = np.floor(lat_to_y([max_lat, min_lat]) * scale).astype(np.int64)
+        return self._select(zoom, min_cx, max_cx, min_cy, max_cy)
+
+    def _select(self, zoom, min_cx, max_cx, min_cy, max_cy):
+        level = self.levels[zoom]
+        mask = (level.cx >= min_cx) & (level.cx <= max_cx) & (level.cy >= min_cy) & (level.cy <= max_cy)
+        clusters = []
+        for i in np.flatnonzero(mask):
+            count = int(level.count[i])
+            companies = int(level.companies[i])
+            clusters.append({
+                'id': f"{zoom}/{level.cx[i]}/{level.cy[i]}",
+                'count': count,
+                'companies': companies,
+                'jobs': count - companies,
+                'centroid': {
+                    'lat': round(float(level.sum_lat[i]) / count, 6),
+                    'lng': round(float(level.sum_lng[i]) / count, 6)
+                },
+                'bbox': {
+                    'min_lat': float(level.min_lat[i]),
+                    'max_lat': float(level.max_lat[i]),
+                    'min_lng': float(level.min_lng[i]),
+                    'max_lng': float(level.max_lng[i])
+                }
+            })
+        return clusters
+
+
+_lock = threading.Lock()
+_rebuild_subscribers = []
+
+
+def _load_points(index):
+    if index is not None:
+        entries = index.snapshot()
+        return ([e.latitude for e in entries], [e.longitude for e in entries],
+                [e.entity_type == 'company' for e in entries])
+    rows = db.session.query(Location.entity_type, Location.latitude, Location.longitude).all()
+    return ([float(r.latitude) for r in rows], [float(r.longitude) for r in rows],
+            [r.entity_type == 'company' for r in rows])
+
+
+def _version(app, index):
+    # Sans index, les modifications de localisations faites par ce processus sont comptées par _mark_stale
+    return index.version if index is not None else app.extensions.get('cluster_changes', 0)
+
+
+def _fresh(app, cached, index):
+    version, built_at, _ = cached
+    if version != _version(app, index):
+        return False
+    return index is not None or time.monotonic() - built_at < app.config.get('MAP_CLUSTER_CACHE_SECONDS', 60.0)
+
+
+def _build(app, index):
+    # Version relevée avant la lecture : une modification pendant la construction laisse la pyramide périmée
+    version = _version(app, index)
+    pyramid = ClusterPyramid(*_load_points(index), max_zoom=app.config.get('MAP_CLUSTER_MAX_ZOOM', 14),
+                             cells_per_tile=app.config.get('MAP_CLUSTER_CELLS_PER_TILE', 4))
+    app.extensions['cluster_pyramid'] = (version, time.monotonic(), pyramid)
+    return pyramid
+
+
+def subscribe_rebuild(callback):
+    # callback(app) est appelé quand une pyramide reconstruite en arrière-plan remplace la précédente
+    if callback not in _rebuild_subscribers:
+        _rebuild_subscribers.append(callback)
+
+
+def _rebuild(app, index):
+    try:
+        with app.app_context():
+            _build(app, index)
+    except SQLAlchemyError as e:
+        logger.warning("Reconstruction de la pyramide de clusters impossible : %s", e)
+        return
+    for callback in _rebuild_subscribers:
+        try:
+            callback(app)
+        except Exception:
+            logger.exception("Échec du traitement de la nouvelle pyramide par %r", callback)
+
+
+def get_cluster_pyramid(app, index=None):
+    # La pyramide est mise en cache : reconstruite quand l'index ou les localisations changent, ou après
+    # expiration du TTL. Une pyramide périmée reste servie pendant sa reconstruction en arrière-plan,
+    # seule la toute première construction bloque les requêtes
+    cached = app.extensions.get('cluster_pyramid')
+    if cached is not None:
+        if not _fresh(app, cached, index):
+            with _lock:
+                thread = app.extensions.get('cluster_rebuild')
+                if thread is None or not thread.is_alive():
+                    thread = threading.Thread(target=_rebuild, args=(app, index),
+                                              name='cluster-pyramid', daemon=True)
+                    app.extensions['cluster_rebuild'] = thread
+                    thread.start()
+        return cached[2]
+    with _lock:
+        cached = app.extensions.get('cluster_pyramid')
+        if cached is not None:
+            return cached[2]
+        return _build(app, index)
+
+
+def _mark_stale(app, changes):
+    if any(change.table == 'locations' for change in changes):
+        with _lock:
+            app.extensions['cluster_changes'] = app.extensions.get('cluster_changes', 0) + 1
+
+
+subscribe(_mark_stale)
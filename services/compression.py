@@ -0,0 +1,109 @@
+import gzip
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/geo+json', 'application/x-ndjson')
+
+
+def _gzip(data, level):
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def _brotli(data, level):
+    return brotli.compress(data, quality=level)
+
+
+def _zstd(data, level):
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+CODECS = {'gzip': (_gzip, 'COMPRESSION_GZIP_LEVEL')}
+if brotli is not None:
+    CODECS['br'] = (_brotli, 'COMPRESSION_BROTLI_LEVEL')
+if zstandard is not None:
+    CODECS['zstd'] = (_zstd, 'COMPRESSION_ZSTD_LEVEL')
+
+
+def parse_accept_encoding(header):
+    accepted = {}
+    for part in (header or '').split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name] = quality
+    return accepted
+
+
+def negotiate(header, preferences):
+    # L'ordre de préférence est celui du serveur ; q=0 exclut un encodage, '*' couvre les autres
+    accepted = parse_accept_encoding(header)
+    for name in preferences:
+        if name not in CODECS:
+            continue
+        quality = accepted.get(name, accepted.get('*', 0.0))
+        if quality > 0:
+            return name
+    return None
+
+
+def compressible(response, min_size):
+    return (response.status_code == 200 and not response.direct_passthrough and not response.is_streamed
+            and 'Content-Encoding' not in response.headers and response.mimetype in COMPRESSIBLE_TYPES
+            and (response.content_length or 0) >= min_size)
+
+
+def choose_encoding(app, mimetype, size):
+    if not app.config.get('COMPRESSION_ENABLED', True) or mimetype not in COMPRESSIBLE_TYPES \
+            or size < app.config.get('COMPRESSION_MIN_SIZE', 1024):
+        return None
+    preferences = [name.strip() for name in app.config.get('COMPRESSION_ENCODINGS', 'gzip').split(',')]
+    return negotiate(request.headers.get('Accept-Encoding'), preferences)
+
+
+def compress(app, encoding, data):
+    codec, level_key = CODECS[encoding]
+    return codec(data, app.config[level_key])
+
+
+def set_encoded_body(response, encoding, data):
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    # Même contenu, autre codage : l'ETag devient faible (If-None-Match compare en mode faible)
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_compression(app):
+    @app.after_request
+    def compress_response(response):
+        if not app.config.get('COMPRESSION_ENABLED', True) or request.method == 'HEAD':
+            return response
+        if response.mimetype in COMPRESSIBLE_TYPES:
+            response.vary.add('Accept-Encoding')
+        if not compressible(response, app.config.get('COMPRESSION_MIN_SIZE', 1024)):
+            return response
+        encoding = choose_encoding(app, response.mimetype, response.content_length)
+        if encoding is None:
+            return response
+        return set_encoded_body(response, encoding, compress(app, encoding, response.get_data()))
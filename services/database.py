@@ -0,0 +1,221 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, inspect, text
+from sqlalchemy.exc import DBAPIError, SQLAlchemyError
+
+logger = logging.getLogger(__name__)
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+REPLICA_LAG_SQL = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() "
+    "THEN 0 ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+def engine_options(config, uri):
+    # SQLite (tests, dev) garde le pool choisi par Flask-SQLAlchemy
+    if not uri or uri.startswith('sqlite'):
+        return {}
+    options = {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+    if uri.startswith('postgresql'):
+        connect_args = {'connect_timeout': config['DB_CONNECT_TIMEOUT']}
+        if config['DB_STATEMENT_TIMEOUT_MS']:
+            connect_args['options'] = '-c statement_timeout=%d' % config['DB_STATEMENT_TIMEOUT_MS']
+        options['connect_args'] = connect_args
+    return options
+
+
+def configure_database(app):
+    # À appeler avant db.init_app : les options explicites de la config restent prioritaires
+    config = app.config
+    config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        **engine_options(config, config.get('SQLALCHEMY_DATABASE_URI')),
+        **config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+    }
+    replica_url = config.get('DATABASE_REPLICA_URL')
+    if replica_url:
+        binds = dict(config.get('SQLALCHEMY_BINDS') or {})
+        binds['replica'] = {'url': replica_url, **engine_options(config, replica_url)}
+        config['SQLALCHEMY_BINDS'] = binds
+
+
+class ReplicaRouter:
+    # Santé du réplica : vérifiée périodiquement, marquée en panne dès qu'une erreur de connexion survient
+    def __init__(self, engine, check_seconds=10.0, retry_seconds=30.0, max_lag_seconds=30.0):
+        self.engine = engine
+        self.check_seconds = check_seconds
+        self.retry_seconds = retry_seconds
+        self.max_lag_seconds = max_lag_seconds
+        self.healthy = True
+        self.checked_at = None
+        self.down_until = 0.0
+        self.fallbacks = 0
+        self.lock = threading.Lock()
+        event.listen(engine, 'handle_error', self._handle_error)
+
+    def _handle_error(self, context):
+        # Déconnexions seulement : une requête annulée par statement_timeout (OperationalError sous
+        # psycopg2) ne dit rien de la santé du réplica ; le reste est détecté par probe()
+        if context.is_disconnect:
+            self.mark_down(context.original_exception)
+
+    def mark_down(self, reason):
+        with self.lock:
+            if self.healthy:
+                logger.warning("Réplica indisponible, lectures redirigées vers le primaire : %s", reason)
+            self.healthy = False
+            self.down_until = time.monotonic() + self.retry_seconds
+
+    def probe(self):
+        try:
+            with self.engine.connect() as connection:
+                if self.engine.dialect.name == 'postgresql':
+                    lag = connection.execute(REPLICA_LAG_SQL).scalar() or 0
+                    if lag > self.max_lag_seconds:
+                        self.mark_down("retard de réplication de %.1f s" % lag)
+                        return False
+                else:
+                    connection.execute(text('SELECT 1'))
+        except DBAPIError as e:
+            self.mark_down(e)
+            return False
+        with self.lock:
+            if not self.healthy:
+                logger.info("Réplica de nouveau disponible")
+            self.healthy = True
+        return True
+
+    def read_engine(self):
+        now = time.monotonic()
+        with self.lock:
+            due = self.checked_at is None or now - self.checked_at >= self.check_seconds
+            due = due and (self.healthy or now >= self.down_until)
+            if due:
+                self.checked_at = now
+        if due:
+            self.probe()
+        if self.healthy:
+            return self.engine
+        with self.lock:
+            self.fallbacks += 1
+        return None
+
+
+class RoutingSession(Session):
+    # Les requêtes HTTP en lecture passent par le réplica ; les flush, la CLI et les lectures
+    # encadrées par use_primary restent sur le primaire
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and not self.info.get('use_primary')
+                and has_request_context() and request.method in READ_METHODS):
+            router = current_app.extensions.get('db_replica')
+            engine = router.read_engine() if router is not None else None
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+
+
+@contextmanager
+def use_primary(session):
+    # Lectures qui ne tolèrent pas le retard du réplica : journal map_changes, jetons de synchronisation.
+    # Une entrée validée sur le primaire mais pas encore rejouée serait sautée par le curseur
+    previous = session.info.get('use_primary', False)
+    session.info['use_primary'] = True
+    try:
+        yield session
+    finally:
+        session.info['use_primary'] = previous
+
+
+class PoolMonitor:
+    def __init__(self, ratio=0.9, log_seconds=60.0):
+        self.ratio = ratio
+        self.log_seconds = log_seconds
+        self.saturated = 0
+        self.logged_at = {}
+        self.lock = threading.Lock()
+
+    def watch(self, name, engine):
+        pool = engine.pool
+        if not hasattr(pool, 'size') or not hasattr(pool, '_max_overflow'):
+            return
+
+        @event.listens_for(engine, 'checkout')
+        def _checkout(dbapi_connection, connection_record, connection_proxy):
+            capacity = pool.size() + max(pool._max_overflow, 0)
+            in_use = pool.checkedout()
+            if pool._max_overflow < 0 or in_use < capacity * self.ratio:
+                return
+            now = time.monotonic()
+            with self.lock:
+                self.saturated += 1
+                if now - self.logged_at.get(name, -self.log_seconds) < self.log_seconds:
+                    return
+                self.logged_at[name] = now
+            logger.warning("Pool de connexions %s saturé : %d/%d connexions utilisées (%s)",
+                           name, in_use, capacity, pool.status())
+
+
+def cached_check(app, name, check, retry_seconds=30.0):
+    # Vérification de schéma (table installée, remplie...) : un succès est retenu pour la vie du processus,
+    # un échec est retenté au plus toutes les retry_seconds
+    checks = app.extensions.setdefault('db_checks', {})
+    state = checks.get(name)
+    if state is True:
+        return True
+    now = time.monotonic()
+    if state is not None and now - state < retry_seconds:
+        return False
+    try:
+        ok = bool(check())
+    except SQLAlchemyError as e:
+        logger.info("Vérification %s impossible : %s", name, e)
+        ok = False
+    checks[name] = True if ok else now
+    return ok
+
+
+def reset_check(app, name, failed=False):
+    # failed : la ressource vient de disparaître, pas de nouvelle vérification avant retry_seconds
+    checks = app.extensions.setdefault('db_checks', {})
+    if failed:
+        checks[name] = time.monotonic()
+    else:
+        checks.pop(name, None)
+
+
+def has_table(connection, name):
+    return inspect(connection).has_table(name)
+
+
+def init_database(app):
+    monitor = PoolMonitor(app.config.get('DB_POOL_SATURATION_RATIO', 0.9))
+    app.extensions['db_pool_monitor'] = monitor
+    extension = app.extensions['sqlalchemy']
+    # Le réplica partage le schéma du primaire : pas de MetaData à part pour create_all/drop_all
+    replica_metadata = extension.metadatas.get('replica')
+    if replica_metadata is not None and not replica_metadata.tables:
+        del extension.metadatas['replica']
+    with app.app_context():
+        engines = extension.engines
+        for key, engine in engines.items():
+            monitor.watch(key or 'primary', engine)
+        if 'replica' in engines:
+            app.extensions['db_replica'] = ReplicaRouter(
+                engines['replica'],
+                app.config.get('REPLICA_CHECK_SECONDS', 10.0),
+                app.config.get('REPLICA_RETRY_SECONDS', 30.0),
+                app.config.get('REPLICA_MAX_LAG_SECONDS', 30.0)
+            )
+    return monitor
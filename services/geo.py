@@ -0,0 +1,161 @@
+from math import atan, cos, degrees, pi, radians, sinh
+
+import numpy as np
+
+KM_PER_DEGREE = 111.0
+
+
+def bounding_box(center_lat, center_lng, radius_km):
+    lat_delta = radius_km / KM_PER_DEGREE
+    lng_delta = radius_km / (KM_PER_DEGREE * cos(radians(center_lat)))
+    return (
+        center_lat - lat_delta,
+        center_lat + lat_delta,
+        center_lng - lng_delta,
+        center_lng + lng_delta
+    )
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(center_lat, center_lng, lats, lngs):
+    lat1 = np.radians(center_lat)
+    lat2 = np.radians(lats)
+    dlat = lat2 - lat1
+    dlng = np.radians(lngs) - np.radians(center_lng)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def coordinates(candidates):
+    count = len(candidates)
+    lats = np.fromiter((float(c.latitude) for c in candidates), dtype=np.float64, count=count)
+    lngs = np.fromiter((float(c.longitude) for c in candidates), dtype=np.float64, count=count)
+    return lats, lngs
+
+
+def filter_by_radius(candidates, center_lat, center_lng, radius_km, sort_by_distance=False, limit=None):
+    # Filtre exact sur le grand cercle, calculé en un seul lot sur les candidats de la bbox
+    if not candidates:
+        return []
+    lats, lngs = coordinates(candidates)
+    distances = haversine_km(center_lat, center_lng, lats, lngs)
+    selected = np.flatnonzero(distances <= radius_km)
+    if sort_by_distance:
+        selected = selected[np.argsort(distances[selected], kind='stable')]
+    if limit is not None:
+        selected = selected[:limit]
+    return [(candidates[i], round(float(distances[i]), 3)) for i in selected]
+
+
+MAX_MERCATOR_LAT = 85.05112878
+
+
+def lng_to_x(lng):
+    return (np.asarray(lng, dtype=np.float64) + 180.0) / 360.0
+
+
+def lat_to_y(lat):
+    lat = np.radians(np.clip(np.asarray(lat, dtype=np.float64), -MAX_MERCATOR_LAT, MAX_MERCATOR_LAT))
+    return (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / np.pi) / 2.0
+
+
+def tile_bounds(z, x, y):
+    n = 2 ** z
+    min_lng = x / n * 360.0 - 180.0
+    max_lng = (x + 1) / n * 360.0 - 180.0
+    max_lat = degrees(atan(sinh(pi * (1 - 2 * y / n))))
+    min_lat = degrees(atan(sinh(pi * (1 - 2 * (y + 1) / n))))
+    return min_lat, max_lat, min_lng, max_lng
+
+
+def tiles_for_point(lat, lng, max_zoom):
+    x = float(lng_to_x(lng))
+    y = float(lat_to_y(lat))
+    tiles = []
+    for z in range(max_zoom + 1):
+        n = 2 ** z
+        tiles.append((z, min(int(x * n), n - 1), min(int(y * n), n - 1)))
+    return tiles
+
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9
+
+
+def geohash_encode(lat, lng, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        rng, coord = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if coord >= mid:
+            value = value * 2 + 1
+            rng[0] = mid
+        else:
+            value = value * 2
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+
+def geohash_cell_size(precision):
+    total_bits = 5 * precision
+    lat_bits = total_bits // 2
+    lng_bits = total_bits - lat_bits
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def geohash_prefixes(min_lat, max_lat, min_lng, max_lng, max_cells=16):
+    # Plus grande précision dont les cellules couvrent la bbox en au plus max_cells préfixes
+    best = None
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        height, width = geohash_cell_size(precision)
+        rows = int(max_lat // height) - int(min_lat // height) + 1
+        cols = int(max_lng // width) - int(min_lng // width) + 1
+        if rows * cols > max_cells:
+            break
+        best = (precision, height, width)
+    if best is None:
+        return ['']
+    precision, height, width = best
+    prefixes = set()
+    lat = (min_lat // height) * height + height / 2
+    while lat < max_lat + height / 2:
+        lng = (min_lng // width) * width + width / 2
+        while lng < max_lng + width / 2:
+            prefixes.add(geohash_encode(max(min(lat, 89.999999), -90.0),
+                                        max(min(lng, 179.999999), -180.0), precision))
+            lng += width
+        lat += height
+    return sorted(prefixes)
+
+
+def geohash_successor(prefix):
+    # Plus petite chaîne de l'alphabet geohash strictement après toutes celles qui commencent par prefix
+    while prefix:
+        position = GEOHASH_ALPHABET.index(prefix[-1])
+        if position + 1 < len(GEOHASH_ALPHABET):
+            return prefix[:-1] + GEOHASH_ALPHABET[position + 1]
+        prefix = prefix[:-1]
+    return None
+
+
+def geohash_ranges(prefixes):
+    ranges = []
+    for prefix in sorted(prefixes):
+        upper = geohash_successor(prefix)
+        if ranges and ranges[-1][1] == prefix:
+            ranges[-1] = (ranges[-1][0], upper)
+        else:
+            ranges.append((prefix, upper))
+    return ranges
@@ -0,0 +1,36 @@
+from sqlalchemy import Integer, cast, func
+
+from extensions import db
+from models.location import Location
+from services.map_filters import apply_filters
+from services.map_query import bbox_clause
+
+
+def cell_size(zoom, cells_per_tile):
+    return 360.0 / (2 ** zoom * cells_per_tile)
+
+
+def _bucket(column, origin, size, dialect):
+    # Les coordonnées sont décalées pour être positives : la troncature de SQLite vaut alors floor()
+    value = (column - origin) / size
+    if dialect == 'sqlite':
+        return cast(value, Integer)
+    return func.floor(value)
+
+
+def heatmap_cells(min_lat, max_lat, min_lng, max_lng, zoom, filters=None, cells_per_tile=8, max_prefixes=16):
+    size = cell_size(zoom, cells_per_tile)
+    dialect = db.session.get_bind().dialect.name
+    row = _bucket(Location.latitude, -90.0, size, dialect)
+    col = _bucket(Location.longitude, -180.0, size, dialect)
+    # Même filtre que les autres routes de la carte : les intervalles de geohash passent par l'index
+    query = db.session.query(row, col, func.count()).filter(
+        bbox_clause(min_lat, max_lat, min_lng, max_lng, max_prefixes)
+    )
+    query = apply_filters(query, filters)
+    cells = []
+    for r, c, count in query.group_by(row, col).all():
+        r, c = int(r), int(c)
+        cells.append([round(-90.0 + (r + 0.5) * size, 6), round(-180.0 + (c + 0.5) * size, 6), count])
+    cells.sort()
+    return cells, size
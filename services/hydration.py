@@ -0,0 +1,111 @@
+from sqlalchemy import and_
+
+from extensions import db
+from models.company import Company
+from models.job import Job
+from models.location import Location
+from services.serialization import select_payloads
+
+# Taille max des listes IN (...) pour rester sous la limite de paramètres des SGBD
+IN_CHUNK_SIZE = 1000
+
+
+def _chunks(ids):
+    ids = list(dict.fromkeys(ids))
+    for start in range(0, len(ids), IN_CHUNK_SIZE):
+        yield ids[start:start + IN_CHUNK_SIZE]
+
+
+def load_by_ids(model, ids):
+    rows = {}
+    for chunk in _chunks(ids):
+        for row in db.session.query(model).filter(model.id.in_(chunk)).all():
+            rows[row.id] = row
+    return rows
+
+
+def load_payloads(model, ids):
+    payloads = {}
+    for chunk in _chunks(ids):
+        for payload in select_payloads(model, model.id.in_(chunk)):
+            payloads[payload['id']] = payload
+    return payloads
+
+
+def load_locations(entity_type, entity_ids):
+    locations = {}
+    for chunk in _chunks(entity_ids):
+        query = Location.query.filter(
+            Location.entity_type == entity_type,
+            Location.entity_id.in_(chunk)
+        )
+        for location in query.all():
+            locations[location.entity_id] = location
+    return locations
+
+
+def location_payloads(entity_type, entity_ids):
+    locations = {}
+    for chunk in _chunks(entity_ids):
+        clause = and_(Location.entity_type == entity_type, Location.entity_id.in_(chunk))
+        for payload in select_payloads(Location, clause):
+            locations[payload['entity_id']] = payload
+    return locations
+
+
+def attach_locations(entity_type, ids, payloads):
+    locations = location_payloads(entity_type, ids)
+    for entity_id, payload in zip(ids, payloads):
+        payload['location'] = locations.get(str(entity_id))
+    return payloads
+
+
+def company_payloads(companies):
+    return attach_locations('company', [company.id for company in companies],
+                            [company.to_dict() for company in companies])
+
+
+def job_payloads(jobs, with_company=False):
+    result = attach_locations('job', [job.id for job in jobs], [job.to_dict() for job in jobs])
+    if with_company:
+        companies = load_by_ids(Company, [job.company_id for job in jobs])
+        for job, job_dict in zip(jobs, result):
+            company = companies.get(job.company_id)
+            job_dict['company_name'] = company.name if company else None
+            job_dict['company_image_url'] = company.image_url if company else None
+    return result
+
+
+def company_jobs(company_ids):
+    # Offres de plusieurs entreprises en une requête par lot d'ids, groupées par entreprise
+    jobs = {company_id: [] for company_id in company_ids}
+    for chunk in _chunks(company_ids):
+        for job in db.session.query(Job).filter(Job.company_id.in_(chunk)).all():
+            jobs[job.company_id].append(job.to_dict())
+    return jobs
+
+
+def located_payloads(locations, distances=None):
+    companies = load_payloads(Company, [l.entity_id for l in locations if l.entity_type == 'company'])
+    jobs = load_payloads(Job, [l.entity_id for l in locations if l.entity_type == 'job'])
+    result = []
+    for location in locations:
+        if location.entity_type == 'company':
+            entity_dict = companies.get(str(location.entity_id))
+        elif location.entity_type == 'job':
+            entity_dict = jobs.get(str(location.entity_id))
+        else:
+            continue
+        if entity_dict:
+            entity_dict = dict(entity_dict)
+            entity_dict['location'] = location.to_dict()
+            if distances is not None:
+                entity_dict['distance_km'] = distances.get(location.id)
+            result.append((location.entity_type, entity_dict))
+    return result
+
+
+def map_payloads(locations, distances=None):
+    payloads = located_payloads(locations, distances)
+    return ([d for t, d in payloads if t == 'company'],
+            [d for t, d in payloads if t == 'job'])
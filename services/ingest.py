@@ -0,0 +1,371 @@
+import csv
+import datetime
+import decimal
+import io
+import json
+import os
+import time
+import uuid
+
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from extensions import db
+from models.company import Company
+from models.job import JOB_TYPES, Job
+from models.location import Location
+from services.geo import geohash_encode
+from services.hydration import IN_CHUNK_SIZE
+from services.map_entities import refresh_entities
+from services.sync import ENTITY_TABLES, log_changes, upsert_rows
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+INGEST_NAMESPACE = uuid.UUID('6f1c1f0e-4f3b-4d52-9a57-0c7d2f3e8b11')
+ENTITY_TYPES = tuple(Location.__table__.c.entity_type.type.enums)
+
+
+def read_csv(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        for record_no, row in enumerate(csv.DictReader(f)):
+            yield record_no, {k.strip(): (v.strip() if v is not None else None) for k, v in row.items() if k}
+
+
+def _feature_record(feature):
+    record = dict(feature.get('properties') or {})
+    geometry = feature.get('geometry') or {}
+    if geometry.get('type') == 'Point':
+        coordinates = geometry.get('coordinates') or []
+        if len(coordinates) >= 2:
+            record['longitude'], record['latitude'] = coordinates[0], coordinates[1]
+    return record
+
+
+def read_geojson(path):
+    # Features lues une à une : un flux d'un million de lignes n'est jamais chargé en entier
+    if ijson is None:
+        raise RuntimeError("Le paquet ijson est requis pour importer du GeoJSON")
+    with open(path, 'rb') as f:
+        for record_no, feature in enumerate(ijson.items(f, 'features.item')):
+            yield record_no, _feature_record(feature)
+
+
+READERS = {'csv': read_csv, 'geojson': read_geojson}
+
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and value == '')
+
+
+def _uuid(record, key, required=True):
+    value = record.get(key)
+    if _blank(value):
+        if required:
+            raise ValueError(f"{key} manquant")
+        return None
+    try:
+        return value if isinstance(value, uuid.UUID) else uuid.UUID(str(value))
+    except ValueError:
+        raise ValueError(f"{key} n'est pas un UUID valide")
+
+
+def _text(record, key, max_length=None, required=False):
+    value = record.get(key)
+    if _blank(value):
+        if required:
+            raise ValueError(f"{key} manquant")
+        return None
+    value = str(value)
+    if max_length is not None and len(value) > max_length:
+        raise ValueError(f"{key} dépasse {max_length} caractères")
+    return value
+
+
+def _datetime(record, key):
+    value = record.get(key)
+    if _blank(value):
+        return None
+    try:
+        parsed = datetime.datetime.fromisoformat(str(value))
+    except ValueError:
+        raise ValueError(f"{key} n'est pas une date ISO 8601")
+    # Colonnes timestamp sans fuseau, en UTC : COPY ignorerait le décalage au lieu de le convertir
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _coordinates(record, required):
+    lat, lng = record.get('latitude'), record.get('longitude')
+    if _blank(lat) and _blank(lng):
+        if required:
+            raise ValueError("latitude et longitude manquantes")
+        return None
+    try:
+        lat, lng = float(lat), float(lng)
+    except (TypeError, ValueError):
+        raise ValueError("latitude/longitude invalides")
+    if not (-90.0 <= lat <= 90.0 and -180.0 <= lng <= 180.0):
+        raise ValueError("coordonnées hors limites")
+    return round(lat, 6), round(lng, 6)
+
+
+def _location_row(entity_type, entity_id, record, required=False):
+    coordinates = _coordinates(record, required)
+    if coordinates is None:
+        return None
+    lat, lng = coordinates
+    return {
+        'id': uuid.uuid5(INGEST_NAMESPACE, f"location:{entity_type}:{entity_id}"),
+        'entity_type': entity_type,
+        'entity_id': entity_id,
+        'latitude': lat,
+        'longitude': lng,
+        'address': _text(record, 'address'),
+        'cp': _text(record, 'cp'),
+        'created_at': _datetime(record, 'location_created_at'),
+        'geohash': geohash_encode(lat, lng)
+    }
+
+
+def _default_id(kind, source, record_no):
+    # Identifiant stable par enregistrement : rejouer un lot après reprise ne crée pas de doublon
+    return uuid.uuid5(INGEST_NAMESPACE, f"{kind}:{source}:{record_no}")
+
+
+def validate_company(record, source, record_no):
+    company_id = _uuid(record, 'id', required=False) or _default_id('company', source, record_no)
+    row = {
+        'id': company_id,
+        'user_id': _uuid(record, 'user_id'),
+        'name': _text(record, 'name', 100, required=True),
+        'description': _text(record, 'description'),
+        'website': _text(record, 'website', 255),
+        'created_at': _datetime(record, 'created_at'),
+        'image_url': _text(record, 'image_url', 255)
+    }
+    return row, _location_row('company', company_id, record)
+
+
+def validate_job(record, source, record_no):
+    job_id = _uuid(record, 'id', required=False) or _default_id('job', source, record_no)
+    job_type = _text(record, 'job_type', required=True)
+    if job_type not in JOB_TYPES:
+        raise ValueError(f"job_type doit valoir {', '.join(JOB_TYPES)}")
+    salary = record.get('salary')
+    if not _blank(salary):
+        try:
+            salary = decimal.Decimal(str(salary)).quantize(decimal.Decimal('0.01'))
+        except decimal.InvalidOperation:
+            raise ValueError("salary invalide")
+        if salary.copy_abs() >= decimal.Decimal('1e8'):
+            raise ValueError("salary hors limites")
+    else:
+        salary = None
+    row = {
+        'id': job_id,
+        'company_id': _uuid(record, 'company_id'),
+        'title': _text(record, 'title', 100, required=True),
+        'description': _text(record, 'description', required=True),
+        'salary': salary,
+        'job_type': job_type,
+        'posted_at': _datetime(record, 'posted_at'),
+        'image_url': _text(record, 'image_url', 255)
+    }
+    return row, _location_row('job', job_id, record)
+
+
+def validate_location(record, source, record_no):
+    entity_type = _text(record, 'entity_type', required=True)
+    if entity_type not in ENTITY_TYPES:
+        raise ValueError(f"entity_type doit valoir {', '.join(ENTITY_TYPES)}")
+    return None, _location_row(entity_type, _uuid(record, 'entity_id'), record, required=True)
+
+
+TIMESTAMP_COLUMNS = {'companies': 'created_at', 'jobs': 'posted_at', 'locations': 'created_at'}
+
+KINDS = {
+    'companies': (Company, validate_company),
+    'jobs': (Job, validate_job),
+    'locations': (Location, validate_location),
+}
+
+
+def _copy_upsert(table, rows, conflict_columns, update_columns):
+    # PostgreSQL : COPY dans une table temporaire puis INSERT ... ON CONFLICT en une seule requête
+    columns = list(rows[0])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(['\\N' if row[c] is None else (row[c].isoformat() if isinstance(row[c], datetime.datetime)
+                                                          else row[c]) for c in columns])
+    buffer.seek(0)
+    column_list = ', '.join(columns)
+    updates = ', '.join(f"{c} = EXCLUDED.{c}" for c in update_columns)
+    cursor = db.session.connection().connection.cursor()
+    try:
+        cursor.execute(f"CREATE TEMP TABLE IF NOT EXISTS ingest_{table.name} "
+                       f"(LIKE {table.name} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS")
+        # Vidée à chaque appel : plusieurs upserts par transaction (horodatages fournis ou non)
+        # ne doivent pas réappliquer les lignes du précédent
+        cursor.execute(f"TRUNCATE ingest_{table.name}")
+        cursor.copy_expert(f"COPY ingest_{table.name} ({column_list}) FROM STDIN "
+                           f"WITH (FORMAT csv, NULL '\\N')", buffer)
+        cursor.execute(f"INSERT INTO {table.name} ({column_list}) SELECT {column_list} FROM ingest_{table.name} "
+                       f"ON CONFLICT ({', '.join(conflict_columns)}) DO UPDATE SET {updates}")
+    finally:
+        cursor.close()
+
+
+def bulk_upsert(table, rows, conflict_columns, keep_columns=()):
+    # keep_columns : écrites à l'insertion seulement, jamais écrasées sur une ligne existante
+    if not rows:
+        return
+    update_columns = [c for c in rows[0] if c not in conflict_columns and c != 'id' and c not in keep_columns]
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        _copy_upsert(table, rows, conflict_columns, update_columns)
+        return
+    insert = sqlite_insert if dialect == 'sqlite' else postgresql_insert
+    statement = insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=conflict_columns,
+        set_={c: statement.excluded[c] for c in update_columns}
+    )
+    db.session.execute(statement, rows)
+
+
+def upsert_keeping_timestamps(table, rows, conflict_columns):
+    # Horodatage absent du flux : date d'import pour une nouvelle ligne, valeur existante conservée sinon
+    # (une réimportation ne doit pas déplacer les lignes dans la pagination ni les filtres par date)
+    column = TIMESTAMP_COLUMNS[table.name]
+    bulk_upsert(table, [row for row in rows if row[column] is not None], conflict_columns)
+    now = datetime.datetime.utcnow()
+    bulk_upsert(table, [dict(row, **{column: now}) for row in rows if row[column] is None],
+                conflict_columns, keep_columns=(column,))
+
+
+class Ingestor:
+    def __init__(self, kind, path, fmt, chunk_size=5000, rejects_path=None, echo=print):
+        self.kind = kind
+        self.model, self.validate = KINDS[kind]
+        self.path = path
+        if fmt == 'geojson' and ijson is None:
+            raise RuntimeError("Le paquet ijson est requis pour importer du GeoJSON")
+        self.reader = READERS[fmt]
+        self.chunk_size = chunk_size
+        self.rejects_path = rejects_path or path + '.rejects.ndjson'
+        self.checkpoint_path = path + '.checkpoint.json'
+        self.source = os.path.basename(path)
+        self.echo = echo
+        self.stats = {'records_done': 0, 'written': 0, 'rejected': 0}
+
+    def load_checkpoint(self):
+        if not os.path.exists(self.checkpoint_path):
+            return
+        with open(self.checkpoint_path) as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('kind') == self.kind:
+            self.stats.update({k: checkpoint[k] for k in self.stats})
+
+    def save_checkpoint(self):
+        with open(self.checkpoint_path + '.tmp', 'w') as f:
+            json.dump({'kind': self.kind, **self.stats}, f)
+        os.replace(self.checkpoint_path + '.tmp', self.checkpoint_path)
+
+    def _existing_companies(self, rows):
+        ids = {row['company_id'] for row in rows}
+        existing = set()
+        id_list = list(ids)
+        for start in range(0, len(id_list), IN_CHUNK_SIZE):
+            chunk = id_list[start:start + IN_CHUNK_SIZE]
+            existing.update(r.id for r in db.session.query(Company.id).filter(Company.id.in_(chunk)))
+        return existing
+
+    def _write_chunk(self, chunk):
+        # Renvoie les lignes de rejet du lot, écrites par l'appelant une fois le commit réussi : un lot
+        # en échec puis repris avec --resume ne doit pas les ajouter deux fois au fichier
+        rejected = []
+        entities = []
+        for record_no, record in chunk:
+            try:
+                entity, location = self.validate(record, self.source, record_no)
+            except ValueError as e:
+                rejected.append(json.dumps({'record': record_no, 'reason': str(e)}, ensure_ascii=False) + '\n')
+                continue
+            entities.append((record_no, entity, location))
+        if self.kind == 'jobs' and entities:
+            existing = self._existing_companies([e for _, e, _ in entities])
+            kept = []
+            for record_no, entity, location in entities:
+                if entity['company_id'] in existing:
+                    kept.append((record_no, entity, location))
+                else:
+                    rejected.append(json.dumps({'record': record_no, 'reason': "company_id inconnu"},
+                                               ensure_ascii=False) + '\n')
+            entities = kept
+        # Même entité plusieurs fois dans un lot : le dernier enregistrement gagne. Sous PostgreSQL,
+        # ON CONFLICT ne peut pas modifier deux fois la même ligne dans une requête
+        latest = {}
+        for item in entities:
+            _, entity, location = item
+            latest[entity['id'] if entity is not None else (location['entity_type'], location['entity_id'])] = item
+        entities = list(latest.values())
+        entity_rows = [e for _, e, _ in entities if e is not None]
+        location_rows = [l for _, _, l in entities if l is not None]
+        if entity_rows:
+            upsert_keeping_timestamps(self.model.__table__, entity_rows, ['id'])
+        upsert_keeping_timestamps(Location.__table__, location_rows, ['entity_type', 'entity_id'])
+        entity_type = ENTITY_TABLES.get(self.model.__tablename__)
+        log_changes(db.session.connection(), upsert_rows(entity_type, entity_rows, location_rows))
+        refresh_entities(db.session.connection(),
+                         [(entity_type, e['id']) for e in entity_rows]
+                         + [(l['entity_type'], l['entity_id']) for l in location_rows])
+        db.session.commit()
+        self.stats['written'] += len(entities)
+        return rejected
+
+    def run(self, resume=False):
+        if resume:
+            self.load_checkpoint()
+        skip = self.stats['records_done']
+        started = time.perf_counter()
+        processed = 0
+        mode = 'a' if resume else 'w'
+        with open(self.rejects_path, mode, encoding='utf-8') as rejects:
+            chunk = []
+            for record_no, record in self.reader(self.path):
+                if record_no < skip:
+                    continue
+                chunk.append((record_no, record))
+                if len(chunk) >= self.chunk_size:
+                    processed += self._flush(chunk, rejects, started, processed)
+                    chunk = []
+            if chunk:
+                processed += self._flush(chunk, rejects, started, processed)
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+        elapsed = time.perf_counter() - started
+        self.stats['seconds'] = round(elapsed, 3)
+        self.stats['rows_per_second'] = round(processed / elapsed, 1) if elapsed > 0 else None
+        return self.stats
+
+    def _flush(self, chunk, rejects, started, processed):
+        try:
+            rejected = self._write_chunk(chunk)
+        except Exception:
+            db.session.rollback()
+            raise
+        rejects.writelines(rejected)
+        rejects.flush()
+        self.stats['rejected'] += len(rejected)
+        self.stats['records_done'] = chunk[-1][0] + 1
+        self.save_checkpoint()
+        elapsed = time.perf_counter() - started
+        rate = (processed + len(chunk)) / elapsed if elapsed > 0 else 0
+        self.echo(f"{self.stats['records_done']} enregistrements traités, {self.stats['written']} écrits, "
+                  f"{self.stats['rejected']} rejetés ({rate:.0f} lignes/s)")
+        return len(chunk)
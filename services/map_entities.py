@@ -0,0 +1,367 @@
+import datetime
+import logging
+
+from flask import current_app, has_app_context
+from sqlalchemy import and_, delete, event, select, text
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from extensions import db
+from models.company import Company
+from models.job import Job
+from models.location import Location
+from models.map_entity import MapEntity
+from services.change_events import flushed_changes
+from services.database import cached_check, has_table, reset_check
+from services.geo import GEOHASH_PRECISION, filter_by_radius, geohash_encode
+from services.hydration import IN_CHUNK_SIZE
+from services.map_filters import job_only
+from services.map_query import bbox_clause, viewport_bbox
+from services.serialization import row_encoder
+from services.sync import ENTITY_TABLES, TRIGGER_TABLES
+
+logger = logging.getLogger(__name__)
+
+ENTITY_MODELS = {'company': Company, 'job': Job}
+
+# Table tenue à jour par PostgreSQL : capte aussi les écritures des autres services.
+# Payloads construits comme to_dict() (dates au format isoformat(), geohash identique à geohash_encode)
+TRIGGER_SQL = """
+CREATE OR REPLACE FUNCTION map_isoformat(value timestamp) RETURNS text AS $$
+    SELECT to_char(value, 'YYYY-MM-DD"T"HH24:MI:SS')
+        || CASE WHEN extract(microseconds FROM value)::bigint %% 1000000 = 0 THEN '' ELSE to_char(value, '.US') END
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION map_geohash(lat double precision, lng double precision) RETURNS text AS $$
+DECLARE
+    alphabet CONSTANT text := '0123456789bcdefghjkmnpqrstuvwxyz';
+    lat_min double precision := -90;
+    lat_max double precision := 90;
+    lng_min double precision := -180;
+    lng_max double precision := 180;
+    mid double precision;
+    result text := '';
+    bits integer := 0;
+    value integer := 0;
+    even boolean := true;
+BEGIN
+    WHILE length(result) < %(precision)d LOOP
+        IF even THEN
+            mid := (lng_min + lng_max) / 2;
+            IF lng >= mid THEN value := value * 2 + 1; lng_min := mid; ELSE value := value * 2; lng_max := mid; END IF;
+        ELSE
+            mid := (lat_min + lat_max) / 2;
+            IF lat >= mid THEN value := value * 2 + 1; lat_min := mid; ELSE value := value * 2; lat_max := mid; END IF;
+        END IF;
+        even := NOT even;
+        bits := bits + 1;
+        IF bits = 5 THEN
+            result := result || substr(alphabet, value + 1, 1);
+            bits := 0;
+            value := 0;
+        END IF;
+    END LOOP;
+    RETURN result;
+END
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION refresh_map_entity(kind text, key uuid) RETURNS void AS $$
+BEGIN
+    -- Upsert plutôt que DELETE + INSERT : deux écritures concurrentes sur la même entité ne se heurtent pas
+    -- à la contrainte unique
+    INSERT INTO map_entities (id, entity_type, entity_id, company_id, latitude, longitude, geohash,
+                              job_type, salary, posted_at, payload, updated_at)
+    SELECT l.id, kind, l.entity_id, COALESCE(j.company_id, c.id), l.latitude, l.longitude,
+           map_geohash(l.latitude::float8, l.longitude::float8),
+           j.job_type::text, j.salary, j.posted_at,
+           CASE WHEN kind = 'company' THEN json_build_object(
+               'id', c.id::text, 'user_id', c.user_id::text, 'name', c.name, 'description', c.description,
+               'website', c.website, 'created_at', map_isoformat(c.created_at), 'image_url', c.image_url,
+               'location', location.payload)
+           ELSE json_build_object(
+               'id', j.id::text, 'company_id', j.company_id::text, 'title', j.title,
+               'description', j.description, 'salary', j.salary::float8, 'job_type', j.job_type::text,
+               'posted_at', map_isoformat(j.posted_at), 'image_url', j.image_url,
+               'location', location.payload)
+           END,
+           now() AT TIME ZONE 'utc'
+    FROM locations l
+    LEFT JOIN companies c ON kind = 'company' AND c.id = l.entity_id
+    LEFT JOIN jobs j ON kind = 'job' AND j.id = l.entity_id
+    CROSS JOIN LATERAL (SELECT json_build_object(
+        'id', l.id::text, 'entity_type', l.entity_type::text, 'entity_id', l.entity_id::text,
+        'latitude', l.latitude::float8, 'longitude', l.longitude::float8, 'address', l.address, 'cp', l.cp,
+        'created_at', map_isoformat(l.created_at)) AS payload) location
+    WHERE l.entity_type::text = kind AND l.entity_id = key AND (c.id IS NOT NULL OR j.id IS NOT NULL)
+    ON CONFLICT (entity_type, entity_id) DO UPDATE SET
+        id = EXCLUDED.id, company_id = EXCLUDED.company_id, latitude = EXCLUDED.latitude,
+        longitude = EXCLUDED.longitude, geohash = EXCLUDED.geohash, job_type = EXCLUDED.job_type,
+        salary = EXCLUDED.salary, posted_at = EXCLUDED.posted_at, payload = EXCLUDED.payload,
+        updated_at = EXCLUDED.updated_at;
+    -- Entité ou localisation disparue : plus rien à afficher
+    IF NOT FOUND THEN
+        DELETE FROM map_entities WHERE entity_type = kind AND entity_id = key;
+    END IF;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION refresh_map_entities() RETURNS trigger AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'locations' THEN
+        IF TG_OP <> 'INSERT' THEN
+            PERFORM refresh_map_entity(OLD.entity_type::text, OLD.entity_id);
+        END IF;
+        IF TG_OP <> 'DELETE' THEN
+            PERFORM refresh_map_entity(NEW.entity_type::text, NEW.entity_id);
+        END IF;
+    ELSIF TG_OP = 'DELETE' THEN
+        -- Suppression d'une entreprise : ses offres déclenchent elles-mêmes ce trigger via ON DELETE CASCADE
+        PERFORM refresh_map_entity(TG_ARGV[0], OLD.id);
+    ELSE
+        PERFORM refresh_map_entity(TG_ARGV[0], NEW.id);
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+""" % {'precision': GEOHASH_PRECISION}
+
+
+def read_model_mode():
+    # off (défaut) : jointure sur locations ; session : tenue à jour par les écritures de ce service ;
+    # trigger : tenue à jour par les triggers PostgreSQL installés par flask map install
+    if not has_app_context():
+        return 'off'
+    return current_app.config.get('MAP_READ_MODEL', 'off')
+
+
+def _read_model_built():
+    # Table absente ou jamais remplie (déploiement sans flask map rebuild) : la jointure reste la source
+    try:
+        if db.session.query(MapEntity.id).limit(1).first() is not None:
+            return True
+        return db.session.query(Location.id).limit(1).first() is None
+    except SQLAlchemyError:
+        db.session.rollback()
+        raise
+
+
+def read_model_enabled():
+    if read_model_mode() == 'off':
+        return False
+    return cached_check(current_app, 'map_entities', _read_model_built)
+
+
+def read_model_failed(error):
+    # Table supprimée depuis la dernière vérification : retour à la jointure jusqu'à la prochaine
+    db.session.rollback()
+    reset_check(current_app, 'map_entities', failed=True)
+    logger.warning("Table map_entities illisible, lecture sur locations : %s", error)
+
+
+def _writes_enabled(connection):
+    if read_model_mode() != 'session':
+        return False
+    return cached_check(current_app, 'map_entities_table', lambda: has_table(connection, 'map_entities'))
+
+
+def _upsert(connection, rows):
+    insert = sqlite_insert if connection.dialect.name == 'sqlite' else postgresql_insert
+    statement = insert(MapEntity.__table__)
+    statement = statement.on_conflict_do_update(
+        index_elements=['entity_type', 'entity_id'],
+        set_={c.name: statement.excluded[c.name] for c in MapEntity.__table__.columns
+              if c.name not in ('entity_type', 'entity_id')}
+    )
+    connection.execute(statement, rows)
+
+
+def _encoded(connection, model, clause=None, query=None):
+    # Couples (ligne brute, payload de to_dict()) lus en Core sur la connexion de l'écriture
+    encoder = row_encoder(model)
+    if query is None:
+        query = select(*encoder.columns).where(clause)
+    rows = connection.execute(query).all()
+    return list(zip(rows, encoder.encode_many(rows)))
+
+
+def _entity_row(location, location_payload, entity, entity_payload, now):
+    row = {
+        'id': location.id,
+        'entity_type': location.entity_type,
+        'entity_id': location.entity_id,
+        # Pour une entreprise, son propre id : le filtre company_id devient une simple égalité
+        'company_id': entity.id if location.entity_type == 'company' else entity.company_id,
+        'latitude': location.latitude,
+        'longitude': location.longitude,
+        'geohash': geohash_encode(float(location.latitude), float(location.longitude)),
+        'job_type': None,
+        'salary': None,
+        'posted_at': None,
+        'payload': dict(entity_payload, location=location_payload),
+        'updated_at': now
+    }
+    if location.entity_type == 'job':
+        row.update(job_type=entity.job_type, salary=entity.salary, posted_at=entity.posted_at)
+    return row
+
+
+def entity_rows(connection, locations):
+    now = datetime.datetime.utcnow()
+    rows = []
+    for entity_type, model in ENTITY_MODELS.items():
+        located = [(location, payload) for location, payload in locations if location.entity_type == entity_type]
+        ids = list({location.entity_id for location, _ in located})
+        entities = {}
+        for start in range(0, len(ids), IN_CHUNK_SIZE):
+            for entity, payload in _encoded(connection, model, model.id.in_(ids[start:start + IN_CHUNK_SIZE])):
+                entities[entity.id] = (entity, payload)
+        # Localisation sans entité (ou entité sans localisation) : rien à afficher sur la carte
+        for location, location_payload in located:
+            if location.entity_id in entities:
+                rows.append(_entity_row(location, location_payload, *entities[location.entity_id], now))
+    return rows
+
+
+def affected_entities(changes):
+    keys = set()
+    deleted_companies = set()
+    for change in changes:
+        values = change.values
+        if change.table == 'locations':
+            for state in (values, {**values, **change.previous}):
+                keys.add((state['entity_type'], state['entity_id']))
+        elif change.table in ENTITY_TABLES:
+            keys.add((ENTITY_TABLES[change.table], values['id']))
+            if change.table == 'companies' and change.action == 'deleted':
+                deleted_companies.add(values['id'])
+    return keys, deleted_companies
+
+
+def refresh_entities(connection, keys, deleted_companies=()):
+    # Lignes des entités touchées supprimées puis reconstruites depuis les tables sources
+    if not _writes_enabled(connection):
+        return 0
+    keys = set(keys)
+    table = MapEntity.__table__
+    deleted_companies = list(deleted_companies)
+    for start in range(0, len(deleted_companies), IN_CHUNK_SIZE):
+        # Offres supprimées en cascade par la clé étrangère, sans passer par la session
+        keys.update(tuple(row) for row in connection.execute(select(table.c.entity_type, table.c.entity_id).where(
+            table.c.entity_type == 'job',
+            table.c.company_id.in_(deleted_companies[start:start + IN_CHUNK_SIZE])
+        )))
+    rows = []
+    for entity_type in ENTITY_MODELS:
+        ids = [entity_id for kind, entity_id in keys if kind == entity_type]
+        for start in range(0, len(ids), IN_CHUNK_SIZE):
+            chunk = ids[start:start + IN_CHUNK_SIZE]
+            connection.execute(delete(table).where(table.c.entity_type == entity_type, table.c.entity_id.in_(chunk)))
+            clause = and_(Location.entity_type == entity_type, Location.entity_id.in_(chunk))
+            rows.extend(entity_rows(connection, _encoded(connection, Location, clause)))
+    if rows:
+        _upsert(connection, rows)
+    return len(rows)
+
+
+@event.listens_for(Session, 'after_flush')
+def _refresh_map_entities(session, flush_context):
+    # Même transaction que l'écriture : la table de lecture suit les commits et les rollbacks
+    if read_model_mode() == 'session':
+        changes = flushed_changes(session)
+        if changes:
+            refresh_entities(session.connection(), *affected_entities(changes))
+
+
+def rebuild_entities(batch_size=5000, echo=None):
+    # Reconstruction complète en une transaction : les lecteurs voient l'ancienne table jusqu'au commit
+    MapEntity.__table__.create(db.engine, checkfirst=True)
+    connection = db.session.connection()
+    connection.execute(delete(MapEntity.__table__))
+    columns = row_encoder(Location).columns
+    total = 0
+    last_id = None
+    while True:
+        query = select(*columns).order_by(Location.id).limit(batch_size)
+        if last_id is not None:
+            query = query.where(Location.id > last_id)
+        locations = _encoded(connection, Location, query=query)
+        if not locations:
+            break
+        last_id = locations[-1][0].id
+        rows = entity_rows(connection, locations)
+        if rows:
+            # Upsert : une ligne écrite entre-temps par un trigger ne fait pas échouer la reconstruction
+            _upsert(connection, rows)
+        total += len(rows)
+        if echo is not None:
+            echo(f"{total} entités indexées")
+    db.session.commit()
+    for name in ('map_entities', 'map_entities_table'):
+        reset_check(current_app, name)
+    return total
+
+
+def install_entity_triggers():
+    MapEntity.__table__.create(db.engine, checkfirst=True)
+    if db.engine.dialect.name != 'postgresql':
+        return False
+    db.session.execute(text(TRIGGER_SQL))
+    for table, entity_type in TRIGGER_TABLES:
+        db.session.execute(text(f'DROP TRIGGER IF EXISTS map_entities_{table} ON {table}'))
+        db.session.execute(text(
+            f'CREATE TRIGGER map_entities_{table} AFTER INSERT OR UPDATE OR DELETE ON {table} '
+            f"FOR EACH ROW EXECUTE FUNCTION refresh_map_entities('{entity_type}')"
+        ))
+    db.session.commit()
+    return True
+
+
+def filter_clauses(filters):
+    if filters is None:
+        return []
+    clauses = []
+    entity_type = 'job' if job_only(filters) else filters.entity_type
+    if entity_type is not None:
+        clauses.append(MapEntity.entity_type == entity_type)
+    if filters.job_types:
+        clauses.append(MapEntity.job_type.in_(filters.job_types))
+    if filters.salary_min is not None:
+        clauses.append(MapEntity.salary >= filters.salary_min)
+    if filters.salary_max is not None:
+        clauses.append(MapEntity.salary <= filters.salary_max)
+    if filters.posted_after is not None:
+        clauses.append(MapEntity.posted_at >= filters.posted_after)
+    if filters.company_id is not None:
+        clauses.append(MapEntity.company_id == filters.company_id)
+    return clauses
+
+
+def normalized_payload(payload, distance):
+    # json_build_object (triggers) écrit un salaire ou une coordonnée entière sous la forme 10000 là où
+    # to_dict() écrit 10000.0 : les nombres sont ramenés en float pour un corps (et un ETag) identique
+    # quel que soit le chemin qui a écrit la ligne
+    payload = dict(payload, distance_km=distance)
+    if payload.get('salary') is not None:
+        payload['salary'] = float(payload['salary'])
+    location = payload.get('location')
+    if location is not None:
+        payload['location'] = dict(location, latitude=float(location['latitude']),
+                                   longitude=float(location['longitude']))
+    return payload
+
+
+def viewport_entities(viewport, filters=None, max_prefixes=16):
+    # Une seule requête sur map_entities : ni jointure ni rechargement des entités
+    query = select(MapEntity.id, MapEntity.entity_type, MapEntity.latitude, MapEntity.longitude,
+                   MapEntity.payload).where(bbox_clause(*viewport_bbox(viewport), max_prefixes, MapEntity),
+                                            *filter_clauses(filters))
+    candidates = db.session.execute(query).all()
+    selected = filter_by_radius(candidates, viewport.center_lat, viewport.center_lng, viewport.radius_km,
+                                sort_by_distance=viewport.sort == 'distance', limit=viewport.limit)
+    companies, jobs = [], []
+    for candidate, distance in selected:
+        payload = normalized_payload(candidate.payload, distance)
+        (companies if candidate.entity_type == 'company' else jobs).append(payload)
+    return companies, jobs
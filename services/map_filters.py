@@ -0,0 +1,87 @@
+import datetime
+import uuid
+from collections import namedtuple
+
+from sqlalchemy import and_, or_
+
+from models.job import JOB_TYPES, Job
+from models.location import Location
+
+MapFilters = namedtuple('MapFilters', 'entity_type job_types salary_min salary_max posted_after company_id')
+
+
+def _multi(values, key):
+    raw = values.getlist(key) if hasattr(values, 'getlist') else values.get(key)
+    if raw is None:
+        return []
+    if isinstance(raw, str):
+        raw = [raw]
+    return [value for item in raw for value in str(item).split(',') if value]
+
+
+def parse_filters(values):
+    def parse(key, kind):
+        value = values.get(key)
+        if value is None or value == '':
+            return None
+        try:
+            return kind(value)
+        except (TypeError, ValueError, AttributeError):
+            raise ValueError(f"{key} invalide")
+
+    entity_type = values.get('entity_type') or None
+    if entity_type not in (None, 'company', 'job'):
+        raise ValueError("entity_type doit valoir 'company' ou 'job'")
+    job_types = _multi(values, 'job_type')
+    unknown = [value for value in job_types if value not in JOB_TYPES]
+    if unknown:
+        raise ValueError('job_type inconnu : ' + ', '.join(unknown))
+    salary_min = parse('salary_min', float)
+    salary_max = parse('salary_max', float)
+    if salary_min is not None and salary_max is not None and salary_min > salary_max:
+        raise ValueError('salary_min doit être inférieur à salary_max')
+    posted_after = parse('posted_after', datetime.datetime.fromisoformat)
+    company_id = parse('company_id', uuid.UUID)
+    filters = MapFilters(entity_type, tuple(job_types), salary_min, salary_max, posted_after, company_id)
+    if job_only(filters) and entity_type == 'company':
+        raise ValueError("job_type, salary_min, salary_max et posted_after ne s'appliquent qu'aux offres")
+    if filters == MapFilters(None, (), None, None, None, None):
+        return None
+    return filters
+
+
+def job_only(filters):
+    return bool(filters.job_types) or any(
+        value is not None for value in (filters.salary_min, filters.salary_max, filters.posted_after)
+    )
+
+
+def apply_filters(query, filters):
+    # Filtres compilés dans la requête sur locations (jointure sur jobs), servis par les index de Job
+    if filters is None:
+        return query
+    entity_type = 'job' if job_only(filters) else filters.entity_type
+    if entity_type is not None:
+        query = query.filter(Location.entity_type == entity_type)
+    on_job = and_(Location.entity_type == 'job', Location.entity_id == Job.id)
+    if entity_type == 'job':
+        query = query.join(Job, on_job)
+    elif filters.company_id is not None and entity_type is None:
+        query = query.outerjoin(Job, on_job)
+    if filters.job_types:
+        query = query.filter(Job.job_type.in_(filters.job_types))
+    if filters.salary_min is not None:
+        query = query.filter(Job.salary >= filters.salary_min)
+    if filters.salary_max is not None:
+        query = query.filter(Job.salary <= filters.salary_max)
+    if filters.posted_after is not None:
+        query = query.filter(Job.posted_at >= filters.posted_after)
+    if filters.company_id is not None:
+        own = and_(Location.entity_type == 'company', Location.entity_id == filters.company_id)
+        if entity_type == 'company':
+            query = query.filter(own)
+        elif entity_type == 'job':
+            query = query.filter(Job.company_id == filters.company_id)
+        else:
+            query = query.filter(or_(own, Job.company_id == filters.company_id))
+    return query
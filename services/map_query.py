@@ -0,0 +1,157 @@
+from collections import namedtuple
+from math import cos, isfinite, radians
+
+from sqlalchemy import Float, and_, cast, func, or_
+
+from models.location import Location
+from services.geo import (
+    EARTH_RADIUS_KM, KM_PER_DEGREE, bounding_box, filter_by_radius, geohash_prefixes, geohash_ranges
+)
+from services.hydration import load_by_ids
+from services.map_filters import apply_filters
+
+Viewport = namedtuple('Viewport', 'center_lat center_lng radius_km zoom_level sort limit')
+
+
+def default_radius(zoom_level):
+    return 50.0 / (2 ** (zoom_level - 10))
+
+
+def parse_viewport(values):
+    def number(key, kind, default=None):
+        value = values.get(key)
+        if value is None or value == '':
+            return default
+        try:
+            value = kind(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{key} invalide")
+        # nan et inf passent float() mais n'ont pas de bbox ni de geohash
+        if not isfinite(value):
+            raise ValueError(f"{key} invalide")
+        return value
+
+    center_lat = number('center_lat', float)
+    center_lng = number('center_lng', float)
+    if center_lat is None or center_lng is None:
+        raise ValueError('center_lat et center_lng sont requis')
+    zoom_level = number('zoom_level', int, 12)
+    radius_km = number('radius_km', float) or default_radius(zoom_level)
+    sort = values.get('sort')
+    if sort not in (None, 'distance'):
+        raise ValueError("sort doit valoir 'distance'")
+    limit = number('limit', int)
+    if limit is not None and limit <= 0:
+        raise ValueError('limit doit être un entier positif')
+    return Viewport(center_lat, center_lng, radius_km, zoom_level, sort, limit)
+
+
+def geohash_filter(min_lat, max_lat, min_lng, max_lng, max_prefixes=16, model=Location):
+    # La bbox devient quelques intervalles de préfixes servis par ix_locations_geohash_entity_type ;
+    # les lignes pas encore rétro-remplies (geohash NULL, si la colonne l'autorise) restent visibles
+    prefixes = geohash_prefixes(min_lat, max_lat, min_lng, max_lng, max_prefixes)
+    if prefixes == ['']:
+        return None
+    clauses = [model.geohash.is_(None)] if model.__table__.c.geohash.nullable else []
+    for low, high in geohash_ranges(prefixes):
+        if high is None:
+            clauses.append(model.geohash >= low)
+        else:
+            clauses.append(and_(model.geohash >= low, model.geohash < high))
+    return or_(*clauses)
+
+
+def bbox_clause(min_lat, max_lat, min_lng, max_lng, max_prefixes=16, model=Location):
+    clause = and_(
+        model.latitude.between(min_lat, max_lat),
+        model.longitude.between(min_lng, max_lng)
+    )
+    prefix_filter = geohash_filter(min_lat, max_lat, min_lng, max_lng, max_prefixes, model)
+    return clause if prefix_filter is None else and_(clause, prefix_filter)
+
+
+def haversine_term(center_lat, center_lng, model=Location):
+    # Terme a de la formule de haversine_km : croissant avec la distance, il suffit pour trier
+    lat = func.radians(cast(model.latitude, Float))
+    dlat = lat - radians(center_lat)
+    dlng = func.radians(cast(model.longitude, Float)) - radians(center_lng)
+    return func.power(func.sin(dlat * 0.5), 2.0) \
+        + cos(radians(center_lat)) * func.cos(lat) * func.power(func.sin(dlng * 0.5), 2.0)
+
+
+def radius_clause(center_lat, center_lng, radius_km, model=Location):
+    # Même formule que haversine_km, évaluée par PostgreSQL sur les lignes déjà réduites par la bbox
+    a = haversine_term(center_lat, center_lng, model)
+    return 2 * EARTH_RADIUS_KM * func.asin(func.sqrt(func.least(a, 1.0))) <= float(radius_km)
+
+
+def bbox_candidates(index, min_lat, max_lat, min_lng, max_lng, max_prefixes=16, filters=None):
+    # L'index ne connaît que les coordonnées : avec des filtres on passe par SQL
+    if index is not None and filters is None:
+        return index.query(min_lat, max_lat, min_lng, max_lng)
+    query = Location.query.filter(bbox_clause(min_lat, max_lat, min_lng, max_lng, max_prefixes))
+    return apply_filters(query, filters).all()
+
+
+def union_candidates(index, bboxes, max_prefixes=16):
+    # Une seule requête pour l'union des bbox ; chaque localisation n'apparaît qu'une fois
+    if index is not None:
+        candidates = {}
+        for bbox in bboxes:
+            for entry in index.query(*bbox):
+                candidates[entry.id] = entry
+        return list(candidates.values())
+    if not bboxes:
+        return []
+    return Location.query.filter(or_(*[bbox_clause(*bbox, max_prefixes) for bbox in bboxes])).all()
+
+
+MAX_SEARCH_RADIUS_KM = 20038.0
+
+
+def search_bbox(center_lat, center_lng, radius_km):
+    # bbox contenant tout le cercle : l'écart en longitude est pris à la latitude la plus éloignée de l'équateur.
+    # None si elle passe un pôle ou l'antiméridien, que les intervalles de geohash ne savent pas couvrir
+    lat_delta = radius_km / KM_PER_DEGREE
+    if abs(center_lat) + lat_delta >= 90.0:
+        return None
+    lng_delta = radius_km / (KM_PER_DEGREE * cos(radians(abs(center_lat) + lat_delta)))
+    if abs(center_lng) + lng_delta > 180.0:
+        return None
+    return center_lat - lat_delta, center_lat + lat_delta, center_lng - lng_delta, center_lng + lng_delta
+
+
+def nearest_candidates(index, lat, lng, k, entity_type=None, start_km=5.0, max_km=2000.0, max_prefixes=16):
+    if index is not None:
+        return index.nearest(lat, lng, k, entity_type)
+    # Sans index : bbox élargie par paliers, chaque requête servie par les intervalles de geohash et
+    # limitée aux k plus proches. Le résultat est exact dès que le k-ième est dans le cercle couvert
+    query = Location.query
+    if entity_type is not None:
+        query = query.filter(Location.entity_type == entity_type)
+    order = (haversine_term(lat, lng), Location.id)
+    radius_km = start_km
+    while radius_km <= max_km:
+        bbox = search_bbox(lat, lng, radius_km)
+        if bbox is None:
+            break
+        rows = query.filter(bbox_clause(*bbox, max_prefixes)).order_by(*order).limit(k).all()
+        selected = filter_by_radius(rows, lat, lng, MAX_SEARCH_RADIUS_KM, sort_by_distance=True)
+        if len(selected) == k and selected[-1][1] <= radius_km:
+            return selected
+        radius_km *= 4
+    # Moins de k localisations à portée : dernière requête sur toute la table
+    rows = query.order_by(*order).limit(k).all()
+    return filter_by_radius(rows, lat, lng, MAX_SEARCH_RADIUS_KM, sort_by_distance=True)
+
+
+def viewport_bbox(viewport):
+    return bounding_box(viewport.center_lat, viewport.center_lng, viewport.radius_km)
+
+
+def candidate_locations(index, candidates):
+    # Les candidats de l'index ne portent que les coordonnées : on recharge les lignes par id
+    if index is None:
+        return list(candidates)
+    rows = load_by_ids(Location, [candidate.id for candidate in candidates])
+    return [rows[candidate.id] for candidate in candidates if candidate.id in rows]
@@ -0,0 +1,316 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from services.serialization import JSONProvider
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+ARCHIVE_FILE = 'archive.json'
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    escaped = ('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in pairs)
+    return '{' + ','.join(escaped) + '}'
+
+
+class Histogram:
+    def __init__(self, name, description, buckets, label_names):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.label_names = label_names
+        self.series = {}
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][i] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self, series):
+        lines = ['# HELP %s %s' % (self.name, self.description), '# TYPE %s histogram' % self.name]
+        for labels, (counts, total, count) in sorted(series.items()):
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append('%s_bucket%s %d' % (self.name, _format_labels(self.label_names, labels, ('le', bound)),
+                                                 bucket_count))
+            lines.append('%s_bucket%s %d' % (self.name, _format_labels(self.label_names, labels, ('le', '+Inf')),
+                                             count))
+            lines.append('%s_sum%s %r' % (self.name, _format_labels(self.label_names, labels), total))
+            lines.append('%s_count%s %d' % (self.name, _format_labels(self.label_names, labels), count))
+        return lines
+
+
+def merge_snapshots(snapshots):
+    # Additionne les compteurs de plusieurs processus (workers vivants et archive des workers terminés)
+    requests, histograms, counters = {}, {}, {}
+    for snapshot in snapshots:
+        for labels, count in snapshot.get('requests', ()):
+            key = tuple(labels)
+            requests[key] = requests.get(key, 0) + count
+        for name, series in snapshot.get('histograms', {}).items():
+            merged = histograms.setdefault(name, {})
+            for labels, counts, total, count in series:
+                current = merged.get(tuple(labels))
+                if current is None:
+                    merged[tuple(labels)] = [list(counts), total, count]
+                else:
+                    current[0] = [a + b for a, b in zip(current[0], counts)]
+                    current[1] += total
+                    current[2] += count
+        for name, (description, value) in snapshot.get('counters', {}).items():
+            counters[name] = [description, counters.get(name, [description, 0])[1] + value]
+    return {
+        'requests': [[list(labels), count] for labels, count in requests.items()],
+        'histograms': {name: [[list(labels), *values] for labels, values in series.items()]
+                       for name, series in histograms.items()},
+        'counters': counters,
+    }
+
+
+def _read_snapshot(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_snapshot(path, snapshot):
+    # Écriture dans un fichier temporaire puis renommage : un lecteur ne voit jamais un fichier à moitié écrit
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(tmp, path)
+
+
+def _worker_files(directory, prefix='worker-'):
+    return sorted(name for name in os.listdir(directory) if name.startswith(prefix) and name.endswith('.json'))
+
+
+def collect_directory(directory, exclude=None):
+    # L'archive est lue avant la liste des fichiers : un worker qu'elle contient déjà n'est pas compté deux fois
+    archive = _read_snapshot(os.path.join(directory, ARCHIVE_FILE)) or {}
+    skipped = set(archive.get('merged', ()))
+    snapshots = [archive]
+    for name in _worker_files(directory):
+        if name not in skipped and name != exclude:
+            snapshot = _read_snapshot(os.path.join(directory, name))
+            if snapshot is not None:
+                snapshots.append(snapshot)
+    return merge_snapshots(snapshots)
+
+
+def archive_worker(directory, pid):
+    # Exécuté par le maître gunicorn quand un worker se termine : ses compteurs rejoignent l'archive
+    # pour que les totaux ne reculent pas lors du recyclage des workers
+    path = os.path.join(directory, ARCHIVE_FILE)
+    archive = _read_snapshot(path) or {}
+    # Les fichiers fusionnés lors du passage précédent sont supprimés avant l'écriture de la nouvelle archive,
+    # qui ne les exclut plus
+    for name in archive.get('merged', ()):
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            pass
+    prefix = 'worker-%d-' % pid
+    names = _worker_files(directory, prefix)
+    snapshots = [_read_snapshot(os.path.join(directory, name)) for name in names]
+    merged = merge_snapshots([archive] + [s for s in snapshots if s is not None])
+    merged['merged'] = names
+    _write_snapshot(path, merged)
+    for name in os.listdir(directory):
+        if name.startswith(prefix) and name.endswith('.tmp'):
+            os.remove(os.path.join(directory, name))
+
+
+class Metrics:
+    def __init__(self, directory=None, flush_seconds=5.0, collect=None):
+        labels = ('endpoint', 'method')
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.histograms = [
+            Histogram('http_request_duration_seconds', 'Temps total de traitement de la requête.',
+                      DURATION_BUCKETS, labels),
+            Histogram('http_request_sql_queries', 'Nombre de requêtes SQL exécutées par requête HTTP.',
+                      QUERY_BUCKETS, labels),
+            Histogram('http_request_sql_duration_seconds', 'Temps passé dans les requêtes SQL.',
+                      DURATION_BUCKETS, labels),
+            Histogram('http_response_serialization_seconds', 'Temps de sérialisation JSON de la réponse.',
+                      DURATION_BUCKETS, labels),
+            Histogram('http_response_size_bytes', 'Taille du corps de la réponse.', SIZE_BUCKETS, labels),
+        ]
+        self.directory = directory
+        self.flush_seconds = flush_seconds
+        self.collect = collect or (lambda: ())
+        self.path = None
+        self.pid = None
+
+    def record(self, endpoint, method, status, values):
+        labels = (endpoint, method)
+        with self.lock:
+            if self.directory and self.pid != os.getpid():
+                self._start_flusher()
+            key = (endpoint, method, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            for histogram, value in zip(self.histograms, values):
+                if value is not None:
+                    histogram.observe(labels, value)
+
+    def _start_flusher(self):
+        # Chaque worker dépose ses compteurs dans son propre fichier, relu par celui qui sert /metrics
+        if self.pid is not None:
+            # Processus issu d'un fork : les séries héritées sont déjà dans le fichier du parent
+            self.requests = {}
+            for histogram in self.histograms:
+                histogram.series = {}
+        self.pid = os.getpid()
+        self.path = os.path.join(self.directory, 'worker-%d-%s.json' % (self.pid, uuid.uuid4().hex[:8]))
+        threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            self.flush()
+
+    def flush(self):
+        if self.path is None or self.pid != os.getpid():
+            return
+        try:
+            _write_snapshot(self.path, self.snapshot())
+        except OSError as e:
+            logger.warning("Écriture des métriques dans %s impossible : %s", self.path, e)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'requests': [[list(labels), count] for labels, count in self.requests.items()],
+                'histograms': {histogram.name: [[list(labels), list(counts), total, count]
+                                                for labels, (counts, total, count) in histogram.series.items()]
+                               for histogram in self.histograms},
+                'counters': {name: [description, value] for name, description, value in self.collect()},
+            }
+
+    def render(self):
+        snapshot = self.snapshot()
+        if self.directory:
+            own = os.path.basename(self.path) if self.path and self.pid == os.getpid() else None
+            snapshot = merge_snapshots([collect_directory(self.directory, exclude=own), snapshot])
+        else:
+            snapshot = merge_snapshots([snapshot])
+        lines = ['# HELP http_requests_total Nombre de requêtes HTTP traitées.',
+                 '# TYPE http_requests_total counter']
+        for labels, count in sorted(snapshot['requests']):
+            lines.append('http_requests_total%s %d' % (
+                _format_labels(('endpoint', 'method', 'status'), labels), count))
+        for histogram in self.histograms:
+            series = {tuple(labels): values for labels, *values in snapshot['histograms'].get(histogram.name, ())}
+            lines.extend(histogram.render(series))
+        for name, (description, value) in snapshot['counters'].items():
+            lines.extend(['# HELP %s %s' % (name, description), '# TYPE %s counter' % name,
+                          '%s %d' % (name, value)])
+        return '\n'.join(lines) + '\n'
+
+
+def process_counters(app):
+    counters = [('db_pool_saturated_checkouts_total', 'Connexions obtenues avec un pool presque plein.',
+                 app.extensions['db_pool_monitor'].saturated)]
+    if 'db_replica' in app.extensions:
+        counters.append(('db_replica_fallbacks_total', 'Requêtes de lecture redirigées vers le primaire.',
+                         app.extensions['db_replica'].fallbacks))
+    cache = app.extensions.get('response_cache')
+    if cache is not None:
+        stats = cache.snapshot()
+        counters += [('response_cache_%s_total' % name, 'Cache de réponses : %s.' % name, stats[name])
+                     for name in ('hits', 'misses', 'not_modified', 'invalidations')]
+    return counters
+
+
+class TimedJSONProvider(JSONProvider):
+    def response(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().response(*args, **kwargs)
+        finally:
+            if has_request_context() and 'metrics_serialization' in g:
+                g.metrics_serialization += time.perf_counter() - started
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('metrics_query_start')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    if has_request_context() and 'metrics_sql_count' in g:
+        g.metrics_sql_count += 1
+        g.metrics_sql_time += elapsed
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(context):
+    if context.connection is not None:
+        starts = context.connection.info.get('metrics_query_start')
+        if starts:
+            starts.pop()
+
+
+def init_metrics(app):
+    if not app.config.get('METRICS_ENABLED', True):
+        return None
+    directory = app.config.get('METRICS_MULTIPROC_DIR')
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    metrics = Metrics(directory, app.config.get('METRICS_FLUSH_SECONDS', 5.0), lambda: process_counters(app))
+    app.extensions['metrics'] = metrics
+    app.json = TimedJSONProvider(app)
+
+    @app.before_request
+    def start_metrics():
+        g.metrics_start = time.perf_counter()
+        g.metrics_sql_count = 0
+        g.metrics_sql_time = 0.0
+        g.metrics_serialization = 0.0
+
+    @app.after_request
+    def record_metrics(response):
+        if 'metrics_start' not in g:
+            return response
+        duration = time.perf_counter() - g.metrics_start
+        size = None if response.is_streamed else response.calculate_content_length()
+        endpoint = request.endpoint or 'unknown'
+        metrics.record(endpoint, request.method, response.status_code, (
+            duration, g.metrics_sql_count, g.metrics_sql_time, g.metrics_serialization, size
+        ))
+        response.headers['Server-Timing'] = 'db;dur=%.2f, json;dur=%.2f, total;dur=%.2f' % (
+            g.metrics_sql_time * 1000, g.metrics_serialization * 1000, duration * 1000)
+        if (duration * 1000 > app.config.get('METRICS_SLOW_REQUEST_MS', 500)
+                or g.metrics_sql_count > app.config.get('METRICS_MAX_QUERIES', 20)):
+            logger.warning("Requête lente %s %s : %.1f ms, %d requêtes SQL (%.1f ms)",
+                           request.method, request.full_path, duration * 1000,
+                           g.metrics_sql_count, g.metrics_sql_time * 1000)
+        return response
+
+    return metrics
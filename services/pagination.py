@@ -0,0 +1,108 @@
+import base64
+import datetime
+import json
+import uuid
+
+from sqlalchemy import and_, or_
+
+from extensions import db
+from services.serialization import row_encoder
+
+
+def encode_cursor(sort_value, row_id):
+    raw = json.dumps([sort_value.isoformat() if sort_value else None, str(row_id)])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return (datetime.datetime.fromisoformat(sort_value) if sort_value else None), uuid.UUID(row_id)
+    except (ValueError, TypeError, AttributeError):
+        raise ValueError('cursor invalide')
+
+
+def int_arg(args, key, default=None, minimum=1):
+    # Paramètre présent mais non entier ou trop petit : erreur, jamais remplacé par la valeur par défaut
+    if key not in args:
+        return default
+    value = args.get(key, type=int)
+    if value is None or value < minimum:
+        raise ValueError(f'{key} doit être un entier positif' + (' ou nul' if minimum == 0 else ''))
+    return value
+
+
+class ListQuery:
+    # Pagination par clé (sort_column, id) décroissante et projection des colonnes demandées
+    def __init__(self, model, sort_column, fields=None, limit=None, cursor=None):
+        self.model = model
+        self.sort_column = sort_column
+        self.columns = [column.key for column in model.__table__.columns]
+        self.fields = fields or self.columns + ['location']
+        self.limit = limit
+        self.cursor = cursor
+
+    @classmethod
+    def from_args(cls, model, sort_column, args, max_limit):
+        fields = None
+        if args.get('fields'):
+            fields = [f.strip() for f in args['fields'].split(',') if f.strip()]
+            allowed = [column.key for column in model.__table__.columns] + ['location']
+            unknown = [f for f in fields if f not in allowed]
+            if unknown:
+                raise ValueError('champs inconnus : ' + ', '.join(unknown))
+        limit = int_arg(args, 'limit')
+        if limit is not None:
+            limit = min(limit, max_limit)
+        cursor = decode_cursor(args['cursor']) if args.get('cursor') else None
+        return cls(model, sort_column, fields, limit, cursor)
+
+    @property
+    def with_location(self):
+        return 'location' in self.fields
+
+    def _selected_columns(self):
+        keys = [f for f in self.fields if f != 'location']
+        for key in ('id', self.sort_column.key):
+            if key not in keys:
+                keys.append(key)
+        return keys
+
+    def statement(self):
+        model = self.model
+        query = db.session.query(*[getattr(model, key) for key in self._selected_columns()])
+        if self.cursor is not None:
+            sort_value, row_id = self.cursor
+            if sort_value is None:
+                # Page terminée dans les lignes sans date : la suite de ces lignes, puis toutes les autres
+                query = query.filter(or_(
+                    and_(self.sort_column.is_(None), model.id < row_id),
+                    self.sort_column.isnot(None)
+                ))
+            else:
+                # Les lignes sans date, placées avant, ne vérifient jamais la comparaison
+                query = query.filter(or_(
+                    self.sort_column < sort_value,
+                    and_(self.sort_column == sort_value, model.id < row_id)
+                ))
+        # NULLS FIRST explicite : ordre par défaut de PostgreSQL en DESC (les index restent utilisables),
+        # que SQLite inverse sinon
+        return query.order_by(self.sort_column.desc().nulls_first(), model.id.desc())
+
+    def fetch(self):
+        query = self.statement()
+        if self.limit is None:
+            return query.all(), None
+        rows = query.limit(self.limit + 1).all()
+        next_cursor = None
+        if len(rows) > self.limit:
+            rows = rows[:self.limit]
+            last = rows[-1]
+            next_cursor = encode_cursor(getattr(last, self.sort_column.key), last.id)
+        return rows, next_cursor
+
+    def serialize(self, rows):
+        # Les premières colonnes sélectionnées sont exactement les champs demandés, dans l'ordre
+        keys = tuple(f for f in self.fields if f != 'location')
+        return row_encoder(self.model, keys).encode_many(rows)
@@ -0,0 +1,336 @@
+import functools
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from urllib.parse import urlencode
+
+from flask import current_app, request
+from sqlalchemy.exc import SQLAlchemyError
+
+from extensions import db
+from models.job import Job
+from services.change_events import subscribe
+from services.clustering import subscribe_rebuild
+from services.compression import choose_encoding, compress, set_encoded_body
+from services.hydration import IN_CHUNK_SIZE
+from services.sync import GROUPS, poll_change_log, subscribe_change_log
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# encodings : corps déjà compressés, par Content-Encoding
+CachedResponse = namedtuple('CachedResponse', 'body mimetype etag headers encodings', defaults=(None,))
+
+SKIPPED_HEADERS = ('Content-Type', 'Content-Length', 'ETag')
+
+
+def entry_bytes(entry):
+    return len(entry.body) + sum(len(data) for data in (entry.encodings or {}).values())
+
+
+class MemoryBackend:
+    # LRU en mémoire avec durée de vie et index tag -> clés pour l'invalidation ciblée, borné en nombre
+    # d'entrées et en octets (corps et versions compressées)
+    def __init__(self, max_size=2048, max_bytes=64 * 1024 * 1024):
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.entries = OrderedDict()
+        self.tags = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None:
+                return None
+            entry, expires_at, _ = item
+            if time.monotonic() > expires_at:
+                self._drop(key)
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry, ttl, tags):
+        with self.lock:
+            self._drop(key)
+            # Une réponse qui occuperait tout le budget n'est pas gardée : elle viderait le cache à chaque passage
+            if entry_bytes(entry) > self.max_bytes:
+                return
+            self.entries[key] = (entry, time.monotonic() + ttl, tags)
+            self.bytes += entry_bytes(entry)
+            for tag in tags:
+                self.tags.setdefault(tag, set()).add(key)
+            self._evict()
+
+    def _evict(self):
+        while len(self.entries) > self.max_size or self.bytes > self.max_bytes:
+            self._drop(next(iter(self.entries)))
+
+    def _drop(self, key):
+        item = self.entries.pop(key, None)
+        if item is None:
+            return
+        self.bytes -= entry_bytes(item[0])
+        for tag in item[2]:
+            keys = self.tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tags[tag]
+
+    def add_encoding(self, key, encoding, data):
+        with self.lock:
+            item = self.entries.get(key)
+            if item is not None:
+                entry, expires_at, tags = item
+                if encoding in (entry.encodings or {}):
+                    return
+                encodings = dict(entry.encodings or {}, **{encoding: data})
+                self.entries[key] = (entry._replace(encodings=encodings), expires_at, tags)
+                self.bytes += len(data)
+                self._evict()
+
+    def invalidate(self, tags):
+        with self.lock:
+            keys = set()
+            for tag in tags:
+                keys.update(self.tags.get(tag, ()))
+            for key in keys:
+                self._drop(key)
+            return len(keys)
+
+    def clear(self):
+        with self.lock:
+            count = len(self.entries)
+            self.entries.clear()
+            self.tags.clear()
+            self.bytes = 0
+            return count
+
+    def size(self):
+        return len(self.entries)
+
+
+class RedisBackend:
+    def __init__(self, url, prefix='cartographie:'):
+        if redis is None:
+            raise RuntimeError("Le paquet redis est requis pour RESPONSE_CACHE_BACKEND=redis")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        values = self.client.hgetall(self.prefix + key)
+        if b'body' not in values:
+            return None
+        encodings = {k[5:].decode('utf-8'): v for k, v in values.items() if k.startswith(b'body:')}
+        return CachedResponse(values[b'body'], values[b'mimetype'].decode('utf-8'),
+                              values[b'etag'].decode('utf-8'), json.loads(values[b'headers']), encodings)
+
+    def set(self, key, entry, ttl, tags):
+        pipe = self.client.pipeline()
+        pipe.hset(self.prefix + key, mapping={
+            'body': entry.body,
+            'mimetype': entry.mimetype,
+            'etag': entry.etag,
+            'headers': json.dumps(entry.headers),
+            **{'body:' + encoding: data for encoding, data in (entry.encodings or {}).items()}
+        })
+        pipe.expire(self.prefix + key, int(ttl))
+        for tag in tags:
+            pipe.sadd(self.prefix + 'tag:' + tag, key)
+            pipe.expire(self.prefix + 'tag:' + tag, int(ttl))
+        pipe.execute()
+
+    def add_encoding(self, key, encoding, data):
+        # hset conserve la durée de vie de la clé ; rien n'est écrit si elle a expiré entre-temps
+        if self.client.exists(self.prefix + key):
+            self.client.hset(self.prefix + key, 'body:' + encoding, data)
+
+    def invalidate(self, tags):
+        keys = set()
+        for tag in tags:
+            keys.update(k.decode('utf-8') for k in self.client.smembers(self.prefix + 'tag:' + tag))
+        if keys or tags:
+            self.client.delete(*[self.prefix + k for k in keys], *[self.prefix + 'tag:' + t for t in tags])
+        return len(keys)
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+        return len(keys)
+
+    def size(self):
+        return None
+
+
+class ResponseCache:
+    def __init__(self, backend, ttl=30.0):
+        self.backend = backend
+        self.ttl = ttl
+        self.stats = {'hits': 0, 'misses': 0, 'not_modified': 0, 'invalidations': 0}
+        self.lock = threading.Lock()
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.stats[name] += amount
+
+    def snapshot(self):
+        with self.lock:
+            stats = dict(self.stats)
+        stats['entries'] = self.backend.size()
+        return stats
+
+
+def init_response_cache(app):
+    name = app.config.get('RESPONSE_CACHE_BACKEND', 'memory')
+    if name == 'none':
+        return None
+    if name == 'redis':
+        backend = RedisBackend(app.config['RESPONSE_CACHE_REDIS_URL'])
+    else:
+        backend = MemoryBackend(app.config.get('RESPONSE_CACHE_SIZE', 2048),
+                                app.config.get('RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    cache = ResponseCache(backend, app.config.get('RESPONSE_CACHE_SECONDS', 30.0))
+    app.extensions['response_cache'] = cache
+    return cache
+
+
+def cache_key():
+    args = sorted(request.args.items(multi=True))
+    return request.path + '?' + urlencode(args)
+
+
+def cached(tags):
+    # tags(view_args, payload) renvoie les tags à purger quand les lignes sous-jacentes changent ;
+    # payload() décode le corps à la demande, seules les routes qui en ont besoin paient ce décodage
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            cache = current_app.extensions.get('response_cache')
+            if cache is None:
+                return view(*args, **kwargs)
+            poll_change_log(current_app)
+            key = cache_key()
+            entry = cache.backend.get(key)
+            if entry is not None:
+                cache.count('hits')
+                state = 'HIT'
+            else:
+                cache.count('misses')
+                state = 'MISS'
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                body = response.get_data()
+                headers = [(k, v) for k, v in response.headers.items() if k not in SKIPPED_HEADERS]
+                encoding = choose_encoding(current_app, response.mimetype, len(body))
+                encodings = {encoding: compress(current_app, encoding, body)} if encoding else {}
+                entry = CachedResponse(body, response.mimetype, hashlib.sha1(body).hexdigest(), headers, encodings)
+                cache.backend.set(key, entry, cache.ttl, set(tags(kwargs, lambda: json.loads(body))))
+            response = current_app.response_class(entry.body, mimetype=entry.mimetype, headers=entry.headers)
+            response.set_etag(entry.etag)
+            response.headers['X-Cache'] = state
+            response = response.make_conditional(request)
+            encoding = None
+            if response.status_code == 200:
+                encoding = choose_encoding(current_app, entry.mimetype, len(entry.body))
+            if encoding is not None:
+                # Corps compressé une seule fois par encodage puis servi tel quel depuis le cache
+                data = (entry.encodings or {}).get(encoding)
+                if data is None:
+                    data = compress(current_app, encoding, entry.body)
+                    cache.backend.add_encoding(key, encoding, data)
+                set_encoded_body(response, encoding, data)
+            if response.status_code == 304:
+                cache.count('not_modified')
+            return response
+        return wrapper
+    return decorator
+
+
+def change_tags(change):
+    values = change.values
+    previous = {**values, **change.previous}
+    if change.table == 'companies':
+        return {'company:%s' % values['id'], 'companies', 'map'}
+    if change.table == 'jobs':
+        return {'job:%s' % values['id'], 'company:%s' % values['company_id'],
+                'company:%s' % previous['company_id'], 'jobs', 'map'}
+    if change.table == 'locations':
+        tags = {'map'}
+        for state in (values, previous):
+            if state['entity_type'] == 'company':
+                tags.update(('company:%s' % state['entity_id'], 'companies'))
+            elif state['entity_type'] == 'job':
+                tags.update(('job:%s' % state['entity_id'], 'jobs'))
+        return tags
+    return set()
+
+
+def _invalidate_responses(app, changes):
+    cache = app.extensions.get('response_cache')
+    if cache is None:
+        return
+    tags = set()
+    for change in changes:
+        tags.update(change_tags(change))
+    if tags:
+        cache.count('invalidations', cache.backend.invalidate(tags))
+
+
+subscribe(_invalidate_responses)
+
+
+def log_tags(entries):
+    tags = {'map'}
+    jobs = []
+    for entry in entries:
+        tags.update(('%s:%s' % (entry.entity_type, entry.entity_id), GROUPS[entry.entity_type]))
+        if entry.entity_type == 'job' and entry.latitude is None:
+            jobs.append(entry.entity_id)
+    # La fiche entreprise liste ses offres : une offre créée ou rattachée ailleurs purge sa nouvelle entreprise,
+    # l'ancienne est purgée par le tag job:<id> posé sur la fiche
+    for start in range(0, len(jobs), IN_CHUNK_SIZE):
+        rows = db.session.query(Job.company_id).filter(Job.id.in_(jobs[start:start + IN_CHUNK_SIZE]))
+        tags.update('company:%s' % company_id for company_id, in rows)
+    return tags
+
+
+def _replay_responses(app, entries):
+    # Écritures faites hors de ce processus (autres workers, ingest, autres services)
+    cache = app.extensions.get('response_cache')
+    if cache is None:
+        return
+    if entries is None:
+        cache.count('invalidations', cache.backend.clear())
+        return
+    try:
+        tags = log_tags(entries)
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logger.warning("Offres modifiées illisibles, cache de réponses vidé : %s", e)
+        cache.count('invalidations', cache.backend.clear())
+        return
+    cache.count('invalidations', cache.backend.invalidate(tags))
+
+
+subscribe_change_log(_replay_responses)
+
+
+def _pyramid_rebuilt(app):
+    # Réponses en mode cluster calculées sur la pyramide précédente, servie pendant la reconstruction
+    cache = app.extensions.get('response_cache')
+    if cache is not None:
+        cache.count('invalidations', cache.backend.invalidate({'map'}))
+
+
+subscribe_rebuild(_pyramid_rebuilt)
@@ -0,0 +1,213 @@
+import logging
+import math
+import threading
+import time
+from collections import defaultdict
+
+from sqlalchemy import and_, literal_column, select, union
+from sqlalchemy.exc import SQLAlchemyError
+
+from extensions import db
+from models.company import Company
+from models.job import Job
+from models.location import Location
+from services.change_events import subscribe
+from services.geo import filter_by_radius
+from services.hydration import load_by_ids
+from services.map_query import bbox_candidates, bbox_clause, radius_clause, viewport_bbox
+from services.spatial_index import get_spatial_index
+from services.text_search import any_term_query, company_search_vector, job_search_vector, search_query, tokenize
+
+logger = logging.getLogger(__name__)
+
+# Même pondération que setweight() côté PostgreSQL : titre > entreprise > description
+TITLE_WEIGHT = 3.0
+COMPANY_WEIGHT = 2.0
+DESCRIPTION_WEIGHT = 1.0
+
+
+def _weights(*parts):
+    weights = defaultdict(float)
+    for text, weight in parts:
+        for token in tokenize(text):
+            weights[token] += weight
+    return weights
+
+
+class InvertedIndex:
+    # Index inversé en mémoire utilisé quand la base n'a pas de recherche plein texte (SQLite)
+    def __init__(self):
+        self.postings = defaultdict(dict)
+        self.documents = {}
+        self.company_names = {}
+        self.company_jobs = defaultdict(set)
+        self.last_refresh = None
+        self.lock = threading.RLock()
+
+    def _unpost(self, job_id):
+        for token in self.documents[job_id]['weights']:
+            posting = self.postings.get(token)
+            if posting is not None:
+                posting.pop(job_id, None)
+                if not posting:
+                    del self.postings[token]
+
+    def add_job(self, job_id, company_id, title, description):
+        with self.lock:
+            self.remove_job(job_id)
+            weights = _weights((title, TITLE_WEIGHT), (description, DESCRIPTION_WEIGHT),
+                               (self.company_names.get(company_id), COMPANY_WEIGHT))
+            self.documents[job_id] = {'company_id': company_id, 'title': title,
+                                      'description': description, 'weights': weights}
+            self.company_jobs[company_id].add(job_id)
+            for token, weight in weights.items():
+                self.postings[token][job_id] = weight
+
+    def remove_job(self, job_id):
+        with self.lock:
+            if job_id not in self.documents:
+                return
+            self._unpost(job_id)
+            document = self.documents.pop(job_id)
+            self.company_jobs[document['company_id']].discard(job_id)
+
+    def set_company(self, company_id, name):
+        with self.lock:
+            if self.company_names.get(company_id) == name:
+                return
+            self.company_names[company_id] = name
+            for job_id in list(self.company_jobs.get(company_id, ())):
+                document = self.documents[job_id]
+                self.add_job(job_id, company_id, document['title'], document['description'])
+
+    def remove_company(self, company_id):
+        with self.lock:
+            self.company_names.pop(company_id, None)
+            for job_id in list(self.company_jobs.pop(company_id, ())):
+                self.remove_job(job_id)
+
+    def rebuild(self):
+        companies = db.session.execute(select(Company.id, Company.name)).all()
+        jobs = db.session.execute(select(Job.id, Job.company_id, Job.title, Job.description)).all()
+        with self.lock:
+            self.postings.clear()
+            self.documents.clear()
+            self.company_jobs.clear()
+            self.company_names = {row.id: row.name for row in companies}
+            for row in jobs:
+                self.add_job(row.id, row.company_id, row.title, row.description)
+            self.last_refresh = time.monotonic()
+        return len(jobs)
+
+    def search(self, text, job_ids=None):
+        # Tous les termes doivent être présents ; score = somme des poids pondérés par l'idf
+        terms = set(tokenize(text))
+        with self.lock:
+            postings = [self.postings.get(term) for term in terms]
+            if not postings or not all(postings):
+                return []
+            postings.sort(key=len)
+            matches = set(postings[0])
+            for posting in postings[1:]:
+                matches.intersection_update(posting)
+            if job_ids is not None:
+                matches.intersection_update(job_ids)
+            total = len(self.documents)
+            idf = [math.log(1 + total / len(posting)) for posting in postings]
+            scored = [(sum(posting[job_id] * w for posting, w in zip(postings, idf)), job_id)
+                      for job_id in matches]
+        scored.sort(key=lambda item: (-item[0], str(item[1])))
+        return [(job_id, round(score, 6)) for score, job_id in scored]
+
+
+def full_text_available():
+    return db.session.get_bind().dialect.name == 'postgresql'
+
+
+def get_search_index(app):
+    index = app.extensions.get('search_index')
+    if index is None:
+        index = app.extensions['search_index'] = InvertedIndex()
+    interval = app.config.get('SEARCH_INDEX_REFRESH_SECONDS', 300.0)
+    # Reconstruction périodique pour les écritures faites hors de cette application
+    if index.last_refresh is None or time.monotonic() - index.last_refresh >= interval:
+        try:
+            loaded = index.rebuild()
+            logger.info("Index de recherche construit : %d offres", loaded)
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logger.warning("Construction de l'index de recherche impossible : %s", e)
+    return index
+
+
+def _sql_search(text, limit, offset, viewport, max_prefixes):
+    query = search_query(text)
+    # Vecteur combiné offre + entreprise : tous les termes doivent apparaître dans l'un ou l'autre,
+    # comme dans InvertedIndex (titre, description et nom d'entreprise réunis)
+    document = job_search_vector(Job.title, Job.description).op('||')(
+        db.func.setweight(company_search_vector(Company.name), literal_column("'B'")))
+    rank = db.func.ts_rank(document, query)
+    statement = db.session.query(Job, rank.label('score')).join(Company, Company.id == Job.company_id) \
+        .filter(document.op('@@')(query))
+    candidates = any_term_query(text)
+    if candidates is not None:
+        # Un index ne peut pas couvrir deux tables : les offres contenant au moins un terme sont d'abord
+        # trouvées par ix_jobs_search et ix_companies_name_search, le vecteur combiné n'est calculé que sur elles
+        matching = union(
+            select(Job.id).where(job_search_vector(Job.title, Job.description).op('@@')(candidates)),
+            select(Job.id).join(Company, Company.id == Job.company_id)
+            .where(company_search_vector(Company.name).op('@@')(candidates))
+        ).subquery()
+        statement = statement.filter(Job.id.in_(select(matching.c.id)))
+    if viewport is not None:
+        # Restriction au viewport dans la même requête : bbox par préfixes geohash puis cercle exact
+        statement = statement.join(Location, and_(Location.entity_type == 'job', Location.entity_id == Job.id)) \
+            .filter(bbox_clause(*viewport_bbox(viewport), max_prefixes),
+                    radius_clause(viewport.center_lat, viewport.center_lng, viewport.radius_km))
+    rows = statement.order_by(rank.desc(), Job.id).offset(offset).limit(limit + 1).all()
+    return [job for job, _ in rows], {job.id: round(float(score), 6) for job, score in rows}
+
+
+def _viewport_job_ids(app, viewport, max_prefixes):
+    candidates = bbox_candidates(get_spatial_index(app), *viewport_bbox(viewport), max_prefixes)
+    selected = filter_by_radius(candidates, viewport.center_lat, viewport.center_lng, viewport.radius_km)
+    return {candidate.entity_id for candidate, _ in selected if candidate.entity_type == 'job'}
+
+
+def search_jobs(app, text, limit, offset=0, viewport=None, max_prefixes=16):
+    if full_text_available():
+        jobs, scores = _sql_search(text, limit, offset, viewport, max_prefixes)
+    else:
+        job_ids = None if viewport is None else _viewport_job_ids(app, viewport, max_prefixes)
+        if job_ids is not None and not job_ids:
+            return [], {}, None
+        ranked = get_search_index(app).search(text, job_ids)[offset:offset + limit + 1]
+        rows = load_by_ids(Job, [job_id for job_id, _ in ranked])
+        jobs = [rows[job_id] for job_id, _ in ranked if job_id in rows]
+        scores = dict(ranked)
+    next_offset = None
+    if len(jobs) > limit:
+        jobs = jobs[:limit]
+        next_offset = offset + limit
+    return jobs, scores, next_offset
+
+
+def _apply_search_changes(app, changes):
+    index = app.extensions.get('search_index')
+    if index is None:
+        return
+    for change in changes:
+        values = change.values
+        if change.table == 'companies':
+            if change.action == 'deleted':
+                index.remove_company(values['id'])
+            else:
+                index.set_company(values['id'], values['name'])
+        elif change.table == 'jobs':
+            if change.action == 'deleted':
+                index.remove_job(values['id'])
+            else:
+                index.add_job(values['id'], values['company_id'], values['title'], values['description'])
+
+
+subscribe(_apply_search_changes)
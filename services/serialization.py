@@ -0,0 +1,109 @@
+import functools
+
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import DateTime, Numeric, select
+from sqlalchemy.dialects.postgresql import UUID
+
+from extensions import db
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Colonnes internes absentes de to_dict()
+HIDDEN_COLUMNS = {'locations': ('geohash',)}
+
+# Types que orjson sérialiserait autrement que Flask : renvoyés vers json.dumps
+ORJSON_OPTIONS = orjson and (orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+                             | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_PASSTHROUGH_SUBCLASS)
+
+
+def _orjson_floats_safe(obj):
+    # orjson écrit autrement que repr() les flottants en notation exponentielle (0.00001 au lieu de 1e-05,
+    # 1e16 au lieu de 1e+16) et les non finis (null au lieu de NaN) : on vérifie les valeurs, pas le texte
+    # encodé où les UUID contiennent souvent « 1e2 »
+    stack = [obj]
+    while stack:
+        value = stack.pop()
+        kind = type(value)
+        if kind is float:
+            if value and not 1e-4 <= abs(value) < 1e16:
+                return False
+        elif kind is dict:
+            stack.extend(value.values())
+        elif kind is list or kind is tuple:
+            stack.extend(value)
+    return True
+
+
+def _as_str(value):
+    return None if value is None else str(value)
+
+
+def _as_float(value):
+    return None if value is None else float(value)
+
+
+def _as_isoformat(value):
+    return None if value is None else value.isoformat()
+
+
+def column_converter(column):
+    if isinstance(column.type, UUID):
+        return _as_str
+    if isinstance(column.type, Numeric):
+        return _as_float
+    if isinstance(column.type, DateTime):
+        return _as_isoformat
+    return None
+
+
+def serialized_fields(model):
+    hidden = HIDDEN_COLUMNS.get(model.__tablename__, ())
+    return tuple(column.key for column in model.__table__.columns if column.key not in hidden)
+
+
+class RowEncoder:
+    # Conversions résolues une fois par modèle et par liste de champs, appliquées aux tuples de colonnes
+    def __init__(self, model, fields):
+        self.fields = tuple(fields)
+        self.columns = [getattr(model, key) for key in self.fields]
+        self.converters = [column_converter(model.__table__.c[key]) for key in self.fields]
+
+    def encode_many(self, rows):
+        fields, converters = self.fields, self.converters
+        return [{key: value if convert is None else convert(value)
+                 for key, convert, value in zip(fields, converters, row)}
+                for row in rows]
+
+
+@functools.lru_cache(maxsize=None)
+def row_encoder(model, fields=None):
+    return RowEncoder(model, fields if fields is not None else serialized_fields(model))
+
+
+def select_payloads(model, clause, fields=None):
+    # Core select : pas d'instances ORM ni d'identity map, seulement des tuples
+    encoder = row_encoder(model, fields)
+    rows = db.session.execute(select(*encoder.columns).where(clause))
+    return encoder.encode_many(rows)
+
+
+class JSONProvider(DefaultJSONProvider):
+    # Backend orjson optionnel, sortie identique octet pour octet à json.dumps : sinon on y revient
+    def __init__(self, app):
+        super().__init__(app)
+        self.ensure_ascii = app.config.get('JSON_ENSURE_ASCII', True)
+
+    def dumps(self, obj, **kwargs):
+        if orjson is not None and kwargs == {'separators': (',', ':')} \
+                and self._app.config.get('JSON_BACKEND') == 'orjson':
+            try:
+                encoded = orjson.dumps(obj, option=ORJSON_OPTIONS) if _orjson_floats_safe(obj) else None
+            except TypeError:
+                encoded = None
+            # Échapper les caractères non ASCII en Python coûte plus que ce qu'orjson fait gagner
+            if encoded is not None and (not self.ensure_ascii or encoded.isascii()):
+                return encoded.decode('utf-8')
+        return super().dumps(obj, **kwargs)
@@ -0,0 +1,86 @@
+import gc
+import logging
+import time
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import configure_mappers
+
+from extensions import db
+from services.clustering import get_cluster_pyramid
+from services.spatial_index import get_spatial_index
+
+logger = logging.getLogger(__name__)
+
+
+def preload_shared_state(app):
+    # Exécuté une fois dans le processus maître (preload) : les workers héritent de l'index spatial
+    # et des tableaux numpy de la pyramide par copie sur écriture au lieu de les reconstruire chacun
+    with app.app_context():
+        try:
+            index = get_spatial_index(app)
+            # Sans index, la pyramide expire après MAP_CLUSTER_CACHE_SECONDS : inutile de la partager
+            if index is not None:
+                get_cluster_pyramid(app, index)
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logger.warning("Préchargement des données de la carte impossible : %s", e)
+        finally:
+            db.session.remove()
+        # Aucune connexion ouverte par le maître ne doit être partagée avec les workers
+        for engine in db.engines.values():
+            engine.dispose()
+    # Les objets déjà créés sortent du ramasse-miettes : ses passages n'écrivent plus dans leurs pages,
+    # qui restent donc partagées entre les workers
+    gc.freeze()
+
+
+def after_fork(app):
+    # Le pool hérité du maître est abandonné sans fermer ses connexions, qui ne lui appartiennent plus
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+def prime_connections(app, count):
+    # Connexions ouvertes ensemble puis rendues au pool : les premières requêtes n'attendent pas le réseau
+    primed = 0
+    for engine in db.engines.values():
+        size = engine.pool.size() if hasattr(engine.pool, 'size') else 1
+        connections = []
+        try:
+            for _ in range(min(count, size)):
+                connection = engine.connect()
+                connections.append(connection)
+                connection.execute(text('SELECT 1'))
+                primed += 1
+        finally:
+            for connection in connections:
+                connection.close()
+    return primed
+
+
+def warm_up(app):
+    # Phase optionnelle (WARMUP_ENABLED) avant de se déclarer prêt : /health/ready répond 503 jusqu'à la fin
+    started = time.perf_counter()
+    configure_mappers()
+    with app.app_context():
+        try:
+            primed = prime_connections(app, app.config.get('WARMUP_CONNECTIONS', 2))
+            index = get_spatial_index(app)
+            if index is not None:
+                get_cluster_pyramid(app, index)
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            primed = 0
+            logger.warning("Warm-up de la base impossible : %s", e)
+        finally:
+            db.session.remove()
+    # Premières réponses calculées (et mises en cache) avant l'arrivée du trafic
+    client = app.test_client()
+    for path in app.config.get('WARMUP_PATHS', '').split():
+        status = client.get(path).status_code
+        if status >= 400:
+            logger.warning("Warm-up : %s a répondu %d", path, status)
+    app.extensions['warmed_up'] = True
+    logger.info("Warm-up terminé en %.0f ms (%d connexions ouvertes)", (time.perf_counter() - started) * 1000, primed)
@@ -0,0 +1,265 @@
+import heapq
+import logging
+import threading
+import time
+from collections import namedtuple
+from math import asin, cos, floor, radians, sin
+
+from sqlalchemy import func
+from sqlalchemy.exc import SQLAlchemyError
+
+from extensions import db
+from models.location import Location
+from models.map_change import MapChange
+from services.change_events import subscribe
+from services.database import use_primary
+from services.geo import EARTH_RADIUS_KM, haversine_km
+from services.hydration import load_locations
+from services.sync import change_log_ready
+
+logger = logging.getLogger(__name__)
+
+IndexedLocation = namedtuple('IndexedLocation', 'id entity_type entity_id latitude longitude')
+
+
+class GridIndex:
+    # Grille uniforme en degrés : chaque cellule contient les localisations qui y tombent
+    def __init__(self, cell_size=0.05):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.entries = {}
+        self.last_sync = None
+        self.last_refresh = None
+        self.change_seq = None
+        self.version = 0
+        self.bounds = None
+        self.lock = threading.Lock()
+        self.sync_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _cell(self, lat, lng):
+        return (floor(lat / self.cell_size), floor(lng / self.cell_size))
+
+    def _discard(self, location_id):
+        old = self.entries.pop(location_id, None)
+        if old is not None:
+            cell = self.cells.get(self._cell(old.latitude, old.longitude))
+            if cell is not None:
+                cell.pop(location_id, None)
+
+    def add(self, entry):
+        with self.lock:
+            if self.entries.get(entry.id) == entry:
+                return
+            self.version += 1
+            self._discard(entry.id)
+            self.entries[entry.id] = entry
+            i, j = self._cell(entry.latitude, entry.longitude)
+            self.cells.setdefault((i, j), {})[entry.id] = entry
+            if self.bounds is None:
+                self.bounds = [i, i, j, j]
+            else:
+                self.bounds = [min(self.bounds[0], i), max(self.bounds[1], i),
+                               min(self.bounds[2], j), max(self.bounds[3], j)]
+
+    def remove(self, location_id):
+        with self.lock:
+            if location_id in self.entries:
+                self.version += 1
+                self._discard(location_id)
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.entries.values())
+
+    def query(self, min_lat, max_lat, min_lng, max_lng):
+        min_i, min_j = self._cell(min_lat, min_lng)
+        max_i, max_j = self._cell(max_lat, max_lng)
+        result = []
+        with self.lock:
+            if (max_i - min_i + 1) * (max_j - min_j + 1) > len(self.cells):
+                cells = (cell for key, cell in self.cells.items()
+                         if min_i <= key[0] <= max_i and min_j <= key[1] <= max_j)
+            else:
+                cells = (self.cells.get((i, j)) for i in range(min_i, max_i + 1)
+                         for j in range(min_j, max_j + 1))
+            for cell in cells:
+                if not cell:
+                    continue
+                for entry in cell.values():
+                    if min_lat <= entry.latitude <= max_lat and min_lng <= entry.longitude <= max_lng:
+                        result.append(entry)
+        return result
+
+    def _ring(self, ci, cj, ring):
+        if ring == 0:
+            yield ci, cj
+            return
+        for j in range(cj - ring, cj + ring + 1):
+            yield ci - ring, j
+            yield ci + ring, j
+        for i in range(ci - ring + 1, ci + ring):
+            yield i, cj - ring
+            yield i, cj + ring
+
+    def _outside_bound_km(self, lat, lng, ci, cj, ring):
+        # Distance minimale entre le point et toute localisation hors du carré de cellules déjà parcouru
+        size = self.cell_size
+        lat_gap = min(lat - (ci - ring) * size, (ci + ring + 1) * size - lat)
+        lng_gap = min(lng - (cj - ring) * size, (cj + ring + 1) * size - lng)
+        lat_km = radians(lat_gap) * EARTH_RADIUS_KM
+        lng_km = EARTH_RADIUS_KM * asin(min(1.0, sin(radians(min(lng_gap, 90.0))) * cos(radians(lat))))
+        return min(lat_km, lng_km)
+
+    def nearest(self, lat, lng, k, entity_type=None):
+        # Parcours par anneaux de cellules autour du point, arrêté dès que les k meilleurs
+        # sont plus proches que tout ce qui reste hors des anneaux visités
+        ci, cj = self._cell(lat, lng)
+        heap = []
+        seen = 0
+        with self.lock:
+            if self.bounds is None:
+                return []
+            min_i, max_i, min_j, max_j = self.bounds
+            max_ring = max(ci - min_i, max_i - ci, cj - min_j, max_j - cj, 0)
+            ring = 0
+            while ring <= max_ring:
+                entries = []
+                for key in self._ring(ci, cj, ring):
+                    cell = self.cells.get(key)
+                    if cell:
+                        entries.extend(e for e in cell.values()
+                                       if entity_type is None or e.entity_type == entity_type)
+                if entries:
+                    distances = haversine_km(lat, lng, [e.latitude for e in entries],
+                                             [e.longitude for e in entries])
+                    for distance, entry in zip(distances.tolist(), entries):
+                        seen += 1
+                        if len(heap) < k:
+                            heapq.heappush(heap, (-distance, seen, entry))
+                        elif distance < -heap[0][0]:
+                            heapq.heapreplace(heap, (-distance, seen, entry))
+                if len(heap) >= k and -heap[0][0] <= self._outside_bound_km(lat, lng, ci, cj, ring):
+                    break
+                ring += 1
+        best = sorted((-d, n, entry) for d, n, entry in heap)
+        return [(entry, round(distance, 3)) for distance, _, entry in best]
+
+    def sync(self):
+        # Rechargement incrémental : seules les lignes créées depuis la dernière synchro
+        with use_primary(db.session):
+            replay = change_log_ready()
+            if replay and self.change_seq is None:
+                self.change_seq = db.session.query(func.max(MapChange.id)).scalar() or 0
+            elif replay:
+                self.replay_changes()
+        query = db.session.query(
+            Location.id, Location.entity_type, Location.entity_id,
+            Location.latitude, Location.longitude, Location.created_at
+        )
+        if self.last_sync is not None:
+            query = query.filter(Location.created_at >= self.last_sync)
+        last_sync = self.last_sync
+        count = 0
+        for row in query.all():
+            self.add(IndexedLocation(row.id, row.entity_type, row.entity_id,
+                                     float(row.latitude), float(row.longitude)))
+            if row.created_at is not None and (last_sync is None or row.created_at > last_sync):
+                last_sync = row.created_at
+            count += 1
+        self.last_sync = last_sync
+        self.last_refresh = time.monotonic()
+        return count
+
+    def replay_changes(self):
+        # Déplacements et suppressions faits par les autres processus (workers, ingest), invisibles
+        # via created_at : relus dans map_changes depuis la dernière synchro
+        rows = db.session.query(
+            MapChange.id, MapChange.entity_type, MapChange.entity_id, MapChange.latitude, MapChange.longitude,
+            MapChange.prev_latitude, MapChange.prev_longitude
+        ).filter(MapChange.id > self.change_seq, MapChange.latitude.isnot(None)).order_by(MapChange.id).all()
+        self.change_seq = max([row.id for row in rows] + [self.change_seq])
+        if not rows:
+            return 0
+        keys = {(row.entity_type, row.entity_id) for row in rows}
+        current = {}
+        for entity_type in ('company', 'job'):
+            for location in load_locations(entity_type, [i for t, i in keys if t == entity_type]).values():
+                current[location.id] = IndexedLocation(location.id, location.entity_type, location.entity_id,
+                                                       float(location.latitude), float(location.longitude))
+        stale = set()
+        with self.lock:
+            for row in rows:
+                for lat, lng in ((row.latitude, row.longitude), (row.prev_latitude, row.prev_longitude)):
+                    if lat is None:
+                        continue
+                    for entry in self.cells.get(self._cell(float(lat), float(lng)), {}).values():
+                        if (entry.entity_type, entry.entity_id) in keys and current.get(entry.id) != entry:
+                            stale.add(entry.id)
+        for location_id in stale:
+            self.remove(location_id)
+        for entry in current.values():
+            self.add(entry)
+        return len(rows)
+
+
+def init_spatial_index(app):
+    if not app.config.get('SPATIAL_INDEX_ENABLED'):
+        return None
+    # Aucune requête au démarrage : l'index est construit à la première lecture (ou par le warm-up)
+    index = GridIndex(app.config.get('SPATIAL_INDEX_CELL_DEG', 0.05))
+    app.extensions['spatial_index'] = index
+    return index
+
+
+def get_spatial_index(app):
+    index = app.extensions.get('spatial_index')
+    if index is None:
+        return None
+    interval = app.config.get('SPATIAL_INDEX_REFRESH_SECONDS', 5.0)
+
+    def due():
+        return index.last_refresh is None or time.monotonic() - index.last_refresh >= interval
+
+    if not due():
+        return index
+    first = index.last_refresh is None
+    # Un seul thread rafraîchit l'index, les autres servent son état courant ; seule la première
+    # construction est attendue, un index vide fausserait les réponses
+    if not index.sync_lock.acquire(blocking=first):
+        return index
+    try:
+        if not due():
+            return index
+        loaded = index.sync()
+        if first:
+            logger.info("Index spatial construit : %d localisations", loaded)
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logger.warning("Rafraîchissement de l'index spatial impossible : %s", e)
+        return None
+    finally:
+        index.sync_lock.release()
+    return index
+
+
+def _apply_location_changes(app, changes):
+    # Les mises à jour et suppressions ne sont pas visibles via created_at : on les applique au commit
+    index = app.extensions.get('spatial_index')
+    if index is None:
+        return
+    for change in changes:
+        if change.table != 'locations':
+            continue
+        values = change.values
+        if change.action == 'deleted':
+            index.remove(values['id'])
+        elif None not in (values['id'], values['entity_type'], values['entity_id'],
+                          values['latitude'], values['longitude']):
+            index.add(IndexedLocation(values['id'], values['entity_type'], values['entity_id'],
+                                      float(values['latitude']), float(values['longitude'])))
+
+
+subscribe(_apply_location_changes)
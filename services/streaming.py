@@ -0,0 +1,45 @@
+from flask import current_app
+
+from services.hydration import attach_locations
+
+STREAM_FORMATS = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson'
+}
+
+
+def iter_batches(query, batch_size):
+    # yield_per active un curseur côté serveur : les lignes arrivent par lots sans tout charger
+    batch = []
+    for row in query.yield_per(batch_size):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def stream_list(page, entity_type, fmt, batch_size):
+    query = page.statement()
+    if page.limit is not None:
+        query = query.limit(page.limit)
+    first = True
+    if fmt == 'json':
+        yield '['
+    for rows in iter_batches(query, batch_size):
+        payloads = page.serialize(rows)
+        if page.with_location:
+            attach_locations(entity_type, [row.id for row in rows], payloads)
+        chunk = []
+        for payload in payloads:
+            # Même encodeur que jsonify (clés triées, backend configuré) : mêmes documents qu'en mode non streamé
+            encoded = current_app.json.dumps(payload, separators=(',', ':'))
+            if fmt == 'ndjson':
+                chunk.append(encoded + '\n')
+            else:
+                chunk.append(encoded if first else ',' + encoded)
+            first = False
+        yield ''.join(chunk)
+    if fmt == 'json':
+        yield ']'
@@ -0,0 +1,359 @@
+import datetime
+import logging
+import math
+import threading
+import time
+from collections import namedtuple
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, insert, or_, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from extensions import db
+from models.location import Location
+from models.map_change import MapChange
+from services.change_events import flushed_changes
+from services.database import cached_check, has_table, reset_check, use_primary
+from services.geo import filter_by_radius
+from services.hydration import IN_CHUNK_SIZE, load_locations, located_payloads
+from services.map_filters import apply_filters
+from services.map_query import bbox_clause, viewport_bbox
+
+logger = logging.getLogger(__name__)
+
+SyncToken = namedtuple('SyncToken', 'seq timestamp')
+
+ENTITY_TABLES = {'companies': 'company', 'jobs': 'job'}
+GROUPS = {'company': 'companies', 'job': 'jobs'}
+
+# Journal alimenté directement par PostgreSQL : capte aussi les écritures des autres services.
+# clock_timestamp() et non now() (début de transaction) : changed_at borne la fenêtre de relecture
+TRIGGER_SQL = """
+CREATE OR REPLACE FUNCTION log_map_change() RETURNS trigger AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'locations' THEN
+        IF TG_OP = 'DELETE' THEN
+            INSERT INTO map_changes (entity_type, entity_id, action, latitude, longitude, changed_at)
+            VALUES (OLD.entity_type::text, OLD.entity_id, 'deleted', OLD.latitude, OLD.longitude,
+                    clock_timestamp() AT TIME ZONE 'utc');
+            RETURN OLD;
+        END IF;
+        INSERT INTO map_changes (entity_type, entity_id, action, latitude, longitude,
+                                 prev_latitude, prev_longitude, changed_at)
+        VALUES (NEW.entity_type::text, NEW.entity_id,
+                CASE TG_OP WHEN 'INSERT' THEN 'created' ELSE 'updated' END,
+                NEW.latitude, NEW.longitude,
+                CASE TG_OP WHEN 'UPDATE' THEN OLD.latitude END,
+                CASE TG_OP WHEN 'UPDATE' THEN OLD.longitude END,
+                clock_timestamp() AT TIME ZONE 'utc');
+        RETURN NEW;
+    END IF;
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO map_changes (entity_type, entity_id, action, changed_at)
+        VALUES (TG_ARGV[0], OLD.id, 'deleted', clock_timestamp() AT TIME ZONE 'utc');
+        RETURN OLD;
+    END IF;
+    INSERT INTO map_changes (entity_type, entity_id, action, changed_at)
+    VALUES (TG_ARGV[0], NEW.id, CASE TG_OP WHEN 'INSERT' THEN 'created' ELSE 'updated' END,
+            clock_timestamp() AT TIME ZONE 'utc');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+TRIGGER_TABLES = (('locations', 'location'), ('companies', 'company'), ('jobs', 'job'))
+
+_log_subscribers = []
+
+
+def encode_token(token):
+    # Arrondi à la milliseconde supérieure : l'entrée la plus récente du jeton reste hors fenêtre
+    millis = math.ceil(token.timestamp.replace(tzinfo=datetime.timezone.utc).timestamp() * 1000)
+    return '%d.%d' % (token.seq, millis)
+
+
+def decode_token(raw):
+    try:
+        seq, millis = raw.split('.')
+        timestamp = datetime.datetime.fromtimestamp(int(millis) / 1000, datetime.timezone.utc)
+        return SyncToken(int(seq), timestamp.replace(tzinfo=None))
+    except (ValueError, OverflowError, OSError):
+        raise ValueError('since invalide')
+
+
+def change_log_ready(connection=None):
+    # Table créée par flask sync install : sans elle, ni journal ni jetons, la carte reste servie en entier
+    if not has_app_context() or current_app.config.get('MAP_SYNC_CHANGE_LOG', 'session') == 'off':
+        return False
+    return cached_check(current_app, 'map_changes',
+                        lambda: has_table(connection or db.session.connection(), 'map_changes'))
+
+
+def log_position():
+    # Curseur et horizon lus ensemble, dans l'instantané de la base qui sert les données : sur un réplica
+    # en retard, le jeton décrit ce qu'il a rejoué et non l'horloge de l'application
+    seq, last_change = db.session.query(func.max(MapChange.id), func.max(MapChange.changed_at)).one()
+    return SyncToken(seq or 0, last_change or datetime.datetime.utcnow())
+
+
+def current_token():
+    # Pris avant la lecture des données. Les id sont attribués avant le commit : une transaction encore
+    # ouverte peut valider plus tard un id inférieur à seq, d'où la fenêtre de relecture de viewport_delta
+    if not change_log_ready():
+        return None
+    try:
+        return log_position()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        reset_check(current_app, 'map_changes', failed=True)
+        logger.warning("Journal map_changes illisible, synchronisation incrémentale désactivée : %s", e)
+        return None
+
+
+def _row(entity_type, entity_id, action, now, latitude=None, longitude=None,
+         prev_latitude=None, prev_longitude=None):
+    return {
+        'entity_type': entity_type,
+        'entity_id': entity_id,
+        'action': action,
+        'latitude': latitude,
+        'longitude': longitude,
+        'prev_latitude': prev_latitude,
+        'prev_longitude': prev_longitude,
+        'changed_at': now
+    }
+
+
+def change_rows(changes):
+    now = datetime.datetime.utcnow()
+    rows = []
+    for change in changes:
+        values = change.values
+        if change.table == 'locations':
+            moved = change.action == 'updated'
+            rows.append(_row(values['entity_type'], values['entity_id'], change.action, now,
+                             values['latitude'], values['longitude'],
+                             change.previous.get('latitude', values['latitude']) if moved else None,
+                             change.previous.get('longitude', values['longitude']) if moved else None))
+        elif change.table in ENTITY_TABLES:
+            rows.append(_row(ENTITY_TABLES[change.table], values['id'], change.action, now))
+    return rows
+
+
+def upsert_rows(entity_type, entity_rows, location_rows):
+    # Écritures en masse (ingest) : on ne sait pas distinguer création et mise à jour
+    now = datetime.datetime.utcnow()
+    located = set()
+    rows = []
+    for location in location_rows:
+        located.add((location['entity_type'], location['entity_id']))
+        rows.append(_row(location['entity_type'], location['entity_id'], 'updated', now,
+                         location['latitude'], location['longitude']))
+    for entity in entity_rows:
+        if (entity_type, entity['id']) not in located:
+            rows.append(_row(entity_type, entity['id'], 'updated', now))
+    return rows
+
+
+def log_enabled(connection):
+    return (has_app_context() and current_app.config.get('MAP_SYNC_CHANGE_LOG') == 'session'
+            and change_log_ready(connection))
+
+
+def log_changes(connection, rows):
+    if rows and log_enabled(connection):
+        connection.execute(insert(MapChange.__table__), rows)
+
+
+@event.listens_for(Session, 'after_flush')
+def _log_map_changes(session, flush_context):
+    # Écrit dans la même transaction que la modification : sert aussi de tombstone
+    if has_app_context() and current_app.config.get('MAP_SYNC_CHANGE_LOG') == 'session':
+        log_changes(session.connection(), change_rows(flushed_changes(session)))
+
+
+def install_change_log():
+    MapChange.__table__.create(db.engine, checkfirst=True)
+    if db.engine.dialect.name != 'postgresql':
+        return False
+    db.session.execute(text(TRIGGER_SQL))
+    for table, entity_type in TRIGGER_TABLES:
+        db.session.execute(text(f'DROP TRIGGER IF EXISTS map_changes_{table} ON {table}'))
+        db.session.execute(text(
+            f'CREATE TRIGGER map_changes_{table} AFTER INSERT OR UPDATE OR DELETE ON {table} '
+            f"FOR EACH ROW EXECUTE FUNCTION log_map_change('{entity_type}')"
+        ))
+    db.session.commit()
+    return True
+
+
+def prune_changes(older_than):
+    # Garde toujours la dernière entrée pour que les jetons trop anciens restent détectables
+    last = db.session.query(func.max(MapChange.id)).scalar()
+    if last is None:
+        return 0
+    deleted = MapChange.query.filter(
+        MapChange.changed_at < older_than,
+        MapChange.id < last
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
+def _in_bbox(latitude, longitude, bbox):
+    min_lat, max_lat, min_lng, max_lng = bbox
+    return min_lat <= float(latitude) <= max_lat and min_lng <= float(longitude) <= max_lng
+
+
+def _was_visible(entry, bbox):
+    if _in_bbox(entry.latitude, entry.longitude, bbox):
+        return True
+    return entry.prev_latitude is not None and _in_bbox(entry.prev_latitude, entry.prev_longitude, bbox)
+
+
+def viewport_delta(viewport, since, max_changes, max_prefixes=16, filters=None, window_seconds=10.0):
+    # Journal et localisations relus sur le primaire : une entrée pas encore rejouée par le réplica
+    # serait sous le nouveau jeton sans jamais avoir été envoyée
+    with use_primary(db.session):
+        return _viewport_delta(viewport, since, max_changes, max_prefixes, filters, window_seconds)
+
+
+def _viewport_delta(viewport, since, max_changes, max_prefixes, filters, window_seconds):
+    token = current_token()
+    if token is None:
+        return None, None
+    first = db.session.query(func.min(MapChange.id)).scalar()
+    if first is not None and since.seq + 1 < first:
+        return token, None
+    # Entrées validées après le jeton avec un id inférieur à since.seq : relues via changed_at sur la fenêtre,
+    # qui doit couvrir la plus longue transaction d'écriture. Les modifications de la fenêtre déjà vues
+    # par le client lui sont renvoyées, sans effet de son côté
+    horizon = since.timestamp - datetime.timedelta(seconds=window_seconds)
+    entries = MapChange.query.filter(or_(MapChange.id > since.seq, MapChange.changed_at > horizon)) \
+        .order_by(MapChange.id).limit(max_changes + 1).all()
+    if len(entries) > max_changes:
+        return token, None
+    bbox = viewport_bbox(viewport)
+    affected = {}
+    for entry in entries:
+        state = affected.setdefault((entry.entity_type, entry.entity_id),
+                                    {'created': False, 'located': False, 'visible': False})
+        state['created'] = state['created'] or entry.action == 'created'
+        if entry.latitude is not None:
+            state['located'] = True
+            state['visible'] = state['visible'] or _was_visible(entry, bbox)
+    # Écritures hors journal : les nouvelles localisations restent repérables par created_at
+    recent = db.session.query(Location.entity_type, Location.entity_id).filter(
+        bbox_clause(*bbox, max_prefixes=max_prefixes),
+        Location.created_at > horizon
+    )
+    for entity_type, entity_id in recent:
+        affected.setdefault((entity_type, entity_id), {'created': True, 'located': True, 'visible': True})
+    locations = []
+    for entity_type in GROUPS:
+        current = load_locations(entity_type, [i for t, i in affected if t == entity_type])
+        for entity_id, location in current.items():
+            state = affected[(entity_type, entity_id)]
+            # Localisation inchangée depuis le jeton : sa position actuelle était déjà celle du client
+            if not state['located']:
+                state['visible'] = _in_bbox(location.latitude, location.longitude, bbox)
+        locations.extend(current.values())
+    if filters is not None:
+        # Une entité qui ne correspond plus aux filtres sort du viewport du client
+        matching = set()
+        ids = [location.id for location in locations]
+        for start in range(0, len(ids), IN_CHUNK_SIZE):
+            chunk = ids[start:start + IN_CHUNK_SIZE]
+            query = db.session.query(Location.id).filter(Location.id.in_(chunk))
+            matching.update(row.id for row in apply_filters(query, filters))
+        locations = [location for location in locations if location.id in matching]
+    selected = filter_by_radius(locations, viewport.center_lat, viewport.center_lng, viewport.radius_km)
+    distances = {location.id: distance for location, distance in selected}
+    states = {(t, str(i)): state for (t, i), state in affected.items()}
+    delta = {key: {'companies': [], 'jobs': []} for key in ('added', 'updated', 'removed')}
+    present = set()
+    for entity_type, payload in located_payloads([location for location, _ in selected], distances):
+        present.add((entity_type, payload['id']))
+        bucket = 'added' if states[(entity_type, payload['id'])]['created'] else 'updated'
+        delta[bucket][GROUPS[entity_type]].append(payload)
+    for (entity_type, entity_id), state in sorted(states.items()):
+        if state['visible'] and (entity_type, entity_id) not in present:
+            delta['removed'][GROUPS[entity_type]].append(entity_id)
+    return token, delta
+
+
+class ChangeLogPoller:
+    # Curseur de relecture de map_changes : les caches locaux au processus y voient les écritures
+    # des autres workers, de l'ingest et des autres services
+    def __init__(self, interval=1.0, window_seconds=10.0, max_changes=5000):
+        self.interval = interval
+        self.window_seconds = window_seconds
+        self.max_changes = max_changes
+        self.seq = None
+        self.since = None
+        self.seen = {}
+        self.last_poll = None
+        self.lock = threading.Lock()
+
+    def fetch(self):
+        if self.seq is None:
+            self.seq, self.since = log_position()
+            return []
+        # Même fenêtre que viewport_delta pour les transactions validées après la lecture précédente,
+        # comptée depuis la dernière entrée lue et non depuis l'horloge de l'application
+        horizon = self.since - datetime.timedelta(seconds=self.window_seconds)
+        entries = MapChange.query.filter(or_(MapChange.id > self.seq, MapChange.changed_at >= horizon)) \
+            .order_by(MapChange.id).limit(self.max_changes + 1).all()
+        self.since = max([entry.changed_at for entry in entries if entry.changed_at is not None] + [self.since])
+        if len(entries) > self.max_changes:
+            self.seq = max(entry.id for entry in entries)
+            self.seen = {}
+            return None
+        fresh = [entry for entry in entries if entry.id not in self.seen]
+        self.seq = max([entry.id for entry in entries] + [self.seq])
+        self.seen = {entry.id: entry.changed_at for entry in entries if entry.changed_at >= horizon}
+        return fresh
+
+
+def subscribe_change_log(callback):
+    # callback(app, entries) reçoit les nouvelles entrées de map_changes, ou None s'il y en a trop
+    if callback not in _log_subscribers:
+        _log_subscribers.append(callback)
+
+
+def init_change_log_poller(app):
+    poller = ChangeLogPoller(app.config.get('MAP_CHANGE_POLL_SECONDS', 1.0),
+                             app.config.get('MAP_SYNC_WINDOW_SECONDS', 10.0),
+                             app.config.get('MAP_SYNC_MAX_CHANGES', 5000))
+    app.extensions['change_log_poller'] = poller
+    return poller
+
+
+def poll_change_log(app):
+    poller = app.extensions.get('change_log_poller')
+    if poller is None or time.monotonic() - (poller.last_poll or float('-inf')) < poller.interval:
+        return
+    # Un seul thread relit le journal, les autres servent le cache tel quel
+    if not poller.lock.acquire(blocking=False):
+        return
+    try:
+        poller.last_poll = time.monotonic()
+        # Sur le primaire : le curseur avance sur ce qui y est validé, pas sur ce que le réplica a rejoué
+        with use_primary(db.session):
+            if not change_log_ready():
+                return
+            entries = poller.fetch()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logger.warning("Relecture du journal map_changes impossible : %s", e)
+        return
+    finally:
+        poller.lock.release()
+    if entries == []:
+        return
+    for callback in _log_subscribers:
+        try:
+            callback(app, entries)
+        except Exception:
+            logger.exception("Échec du traitement du journal par %r", callback)
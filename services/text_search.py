@@ -0,0 +1,59 @@
+import re
+import unicodedata
+
+from sqlalchemy import func, literal_column
+
+# Configuration PostgreSQL : doit rester identique entre les index et les requêtes
+SEARCH_CONFIG = literal_column("'french'")
+
+STOP_WORDS = frozenset((
+    'au', 'aux', 'avec', 'ce', 'ces', 'dan', 'de', 'des', 'du', 'en', 'et', 'il', 'la', 'le', 'les',
+    'leur', 'ne', 'nou', 'ou', 'par', 'pas', 'pour', 'qui', 'que', 'sa', 'se', 'son', 'sur', 'un',
+    'une', 'vou', 'the', 'and', 'of', 'to', 'in', 'for', 'with'
+))
+
+_WORD = re.compile(r'[^\W_]+')
+
+
+def _text(value):
+    return func.coalesce(value, literal_column("''"))
+
+
+def _weighted(value, weight):
+    return func.setweight(func.to_tsvector(SEARCH_CONFIG, _text(value)), literal_column(f"'{weight}'"))
+
+
+def job_search_vector(title, description):
+    return _weighted(title, 'A').op('||')(_weighted(description, 'C'))
+
+
+def company_search_vector(name):
+    return func.to_tsvector(SEARCH_CONFIG, _text(name))
+
+
+def search_query(text):
+    return func.websearch_to_tsquery(SEARCH_CONFIG, text)
+
+
+def any_term_query(text):
+    # Au moins un des termes positifs de la recherche : préfiltre large servi par les index GIN de chaque table,
+    # None si la recherche n'a que des exclusions
+    words = [word for word in text.replace('"', ' ').split() if not word.startswith('-') and word.lower() != 'or']
+    if not words:
+        return None
+    return func.websearch_to_tsquery(SEARCH_CONFIG, ' or '.join(words))
+
+
+def tokenize(text):
+    # Équivalent approché de la configuration 'french' : minuscules, sans accents, pluriels simples
+    if not text:
+        return []
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    tokens = []
+    for word in _WORD.findall(text):
+        if len(word) > 3 and word[-1] in 'sx':
+            word = word[:-1]
+        if len(word) > 1 and word not in STOP_WORDS:
+            tokens.append(word)
+    return tokens
@@ -0,0 +1,231 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+
+from extensions import db
+from models.company import Company
+from models.job import Job
+from models.location import Location
+from services.change_events import subscribe
+from services.clustering import get_cluster_pyramid
+from services.geo import tile_bounds, tiles_for_point
+from services.hydration import IN_CHUNK_SIZE, load_by_ids
+from services.sync import poll_change_log, subscribe_change_log
+from services.map_query import bbox_candidates
+
+logger = logging.getLogger(__name__)
+
+MAX_TILE_ZOOM = 22
+ENTITY_TYPES = {'companies': 'company', 'jobs': 'job'}
+
+
+class TileCache:
+    # LRU avec durée de vie : les entrées sont (corps, etag, date de création)
+    def __init__(self, max_size=1024, ttl=300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[2] > self.ttl:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[0], entry[1]
+
+    def set(self, key, body, etag):
+        with self.lock:
+            self.entries[key] = (body, etag, time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+def valid_tile(z, x, y):
+    return 0 <= z <= MAX_TILE_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def _point(lat, lng):
+    return {'type': 'Point', 'coordinates': [round(float(lng), 6), round(float(lat), 6)]}
+
+
+def _entity_features(candidates):
+    companies = load_by_ids(Company, [c.entity_id for c in candidates if c.entity_type == 'company'])
+    jobs = load_by_ids(Job, [c.entity_id for c in candidates if c.entity_type == 'job'])
+    features = []
+    for candidate in candidates:
+        if candidate.entity_type == 'company':
+            company = companies.get(candidate.entity_id)
+            if company is None:
+                continue
+            properties = {
+                'type': 'company',
+                'id': str(company.id),
+                'name': company.name,
+                'image_url': company.image_url
+            }
+        else:
+            job = jobs.get(candidate.entity_id)
+            if job is None:
+                continue
+            properties = {
+                'type': 'job',
+                'id': str(job.id),
+                'company_id': str(job.company_id),
+                'title': job.title,
+                'job_type': job.job_type,
+                'salary': float(job.salary) if job.salary is not None else None
+            }
+        features.append({
+            'type': 'Feature',
+            'geometry': _point(candidate.latitude, candidate.longitude),
+            'properties': properties
+        })
+    return features
+
+
+def _cluster_features(clusters):
+    return [{
+        'type': 'Feature',
+        'geometry': _point(cluster['centroid']['lat'], cluster['centroid']['lng']),
+        'properties': {
+            'type': 'cluster',
+            'id': cluster['id'],
+            'count': cluster['count'],
+            'companies': cluster['companies'],
+            'jobs': cluster['jobs'],
+            'bbox': [cluster['bbox']['min_lng'], cluster['bbox']['min_lat'],
+                     cluster['bbox']['max_lng'], cluster['bbox']['max_lat']]
+        }
+    } for cluster in clusters]
+
+
+def render_tile(app, index, z, x, y):
+    poll_change_log(app)
+    cache = app.extensions['tile_cache']
+    pyramid = None
+    key = (z, x, y)
+    if z <= app.config['MAP_CLUSTER_MAX_ZOOM']:
+        # La pyramide est reconstruite en arrière-plan : une tuile de clusters vaut pour la pyramide
+        # qui l'a produite et se renouvelle dès que la suivante la remplace
+        pyramid = get_cluster_pyramid(app, index)
+        key = (z, x, y, pyramid.generation)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    if pyramid is not None:
+        features = _cluster_features(pyramid.tile_query(z, x, y))
+    else:
+        candidates = bbox_candidates(index, *tile_bounds(z, x, y),
+                                     app.config.get('MAP_GEOHASH_MAX_PREFIXES', 16))
+        features = _entity_features(candidates)
+    body = json.dumps({'type': 'FeatureCollection', 'features': features},
+                      separators=(',', ':')).encode('utf-8')
+    etag = hashlib.sha1(body).hexdigest()
+    cache.set(key, body, etag)
+    return body, etag
+
+
+def init_tile_cache(app):
+    cache = TileCache(app.config.get('MAP_TILE_CACHE_SIZE', 1024),
+                      app.config.get('MAP_TILE_CACHE_SECONDS', 300.0))
+    app.extensions['tile_cache'] = cache
+    return cache
+
+
+def _entity_positions(entities):
+    # Le commit est terminé : la session ne peut plus émettre de SQL, une connexion dédiée lit les positions
+    positions = []
+    with db.engine.connect() as connection:
+        for entity_type, ids in entities.items():
+            ids = list(ids)
+            for start in range(0, len(ids), IN_CHUNK_SIZE):
+                positions += connection.execute(select(Location.latitude, Location.longitude).where(
+                    Location.entity_type == entity_type,
+                    Location.entity_id.in_(ids[start:start + IN_CHUNK_SIZE])
+                )).all()
+    return positions
+
+
+def _purge(app, cache, points, entities):
+    # Seules les tuiles contenant l'ancienne ou la nouvelle position d'une localisation sont purgées
+    keys = set()
+    for lat, lng in points:
+        keys.update(tiles_for_point(float(lat), float(lng), MAX_TILE_ZOOM))
+    if entities:
+        try:
+            positions = _entity_positions(entities)
+        except SQLAlchemyError as e:
+            logger.warning("Positions des entités modifiées illisibles, cache des tuiles vidé : %s", e)
+            cache.clear()
+            return
+        # Les tuiles de clusters ne contiennent que des comptages, inchangés par ces modifications
+        cluster_zoom = app.config['MAP_CLUSTER_MAX_ZOOM']
+        for lat, lng in positions:
+            keys.update(key for key in tiles_for_point(float(lat), float(lng), MAX_TILE_ZOOM) if key[0] > cluster_zoom)
+    cache.invalidate(keys)
+
+
+def _invalidate_tiles(app, changes):
+    cache = app.extensions.get('tile_cache')
+    if cache is None:
+        return
+    points = []
+    entities = {}
+    for change in changes:
+        if change.table in ENTITY_TYPES:
+            # Les tuiles détaillées affichent nom, titre, type de contrat et salaire de l'entité
+            entities.setdefault(ENTITY_TYPES[change.table], set()).add(change.values['id'])
+        elif change.table == 'locations':
+            for state in (change.values, {**change.values, **change.previous}):
+                if state.get('latitude') is not None and state.get('longitude') is not None:
+                    points.append((state['latitude'], state['longitude']))
+    _purge(app, cache, points, entities)
+
+
+def _replay_tile_changes(app, entries):
+    # Écritures faites hors de ce processus, relues dans map_changes avant de servir le cache
+    cache = app.extensions.get('tile_cache')
+    if cache is None:
+        return
+    if entries is None:
+        cache.clear()
+        return
+    points = []
+    entities = {}
+    for entry in entries:
+        if entry.latitude is None:
+            entities.setdefault(entry.entity_type, set()).add(entry.entity_id)
+            continue
+        if entry.action == 'updated' and entry.prev_latitude is None:
+            # Écriture en masse (ingest) : l'ancienne position est inconnue
+            cache.clear()
+            return
+        points.append((entry.latitude, entry.longitude))
+        if entry.prev_latitude is not None:
+            points.append((entry.prev_latitude, entry.prev_longitude))
+    _purge(app, cache, points, entities)
+
+
+subscribe(_invalidate_tiles)
+subscribe_change_log(_replay_tile_changes)
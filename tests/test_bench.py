@@ -0,0 +1,36 @@
+import json
+from app import create_app, db
+from bench.compare import compare
+from bench.generate import generate
+from bench.run import main
+from models.company import Company
+from models.job import Job
+from models.location import Location
+
+def test_generate_is_seeded_and_clustered():
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    with app.app_context():
+        db.create_all()
+        company_ids, job_ids = generate(200, seed=7)
+        assert Company.query.count() == 20 and Job.query.count() == 200
+        assert Location.query.count() == 220
+        assert Location.query.filter(Location.geohash.is_(None)).count() == 0
+        in_paris = Location.query.filter(Location.latitude.between(48.5, 49.2),
+                                         Location.longitude.between(1.8, 2.9)).count()
+        assert in_paris > 30
+        db.drop_all()
+        db.create_all()
+        assert generate(200, seed=7)[1] == job_ids
+        db.drop_all()
+
+def test_run_writes_report_and_compare_flags_regressions(tmp_path):
+    output = tmp_path / 'report.json'
+    main(['--sizes', '100', '--repeat', '2', '--warmup', '0', '--only', 'home', 'map_city_center',
+          '--output', str(output)])
+    report = json.loads(output.read_text())
+    assert set(report['results']['100']['scenarios']) == {'home', 'map_city_center'}
+    slower = json.loads(output.read_text())
+    slower['results']['100']['scenarios']['home']['p50_ms'] *= 2
+    rows, regressions = compare(report, slower)
+    assert len(rows) == 2
+    assert [(size, name) for size, name, _ in regressions] == [('100', 'home')]
@@ -0,0 +1,81 @@
+import pytest
+from app import create_app, db
+from models.company import Company
+from models.job import Job
+from models.location import Location
+from services.clustering import ClusterPyramid
+import uuid
+
+@pytest.fixture
+def client():
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'MAP_CLUSTER_MAX_ZOOM': 12,
+    })
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+        yield client
+        with app.app_context():
+            db.drop_all()
+
+def add_entity(client, entity_type, lat, lng):
+    if entity_type == 'company':
+        entity = Company(id=uuid.uuid4(), user_id=uuid.uuid4(), name="C",
+                         description="desc", website="https://test.com")
+    else:
+        entity = Job(id=uuid.uuid4(), company_id=uuid.uuid4(), title="J",
+                     description="desc", salary=10000, job_type="full_time")
+    location = Location(entity_type=entity_type, entity_id=entity.id,
+                        latitude=lat, longitude=lng, address="Paris", cp="75000")
+    with client.application.app_context():
+        db.session.add(entity)
+        db.session.add(location)
+        db.session.commit()
+
+def test_pyramid_merges_cells_at_lower_zoom():
+    pyramid = ClusterPyramid([48.85, 48.86, 43.30], [2.35, 2.36, 5.37], [True, False, True], max_zoom=10)
+    clusters = pyramid.query(10, 48.0, 49.0, 2.0, 3.0)
+    assert sum(c['count'] for c in clusters) == 2
+    assert pyramid.query(0, -85, 85, -180, 180)[0]['count'] == 3
+    world = pyramid.query(0, -85, 85, -180, 180)[0]
+    assert world['companies'] == 2 and world['jobs'] == 1
+    assert world['bbox'] == {'min_lat': 43.3, 'max_lat': 48.86, 'min_lng': 2.35, 'max_lng': 5.37}
+
+def test_map_entities_cluster_mode(client):
+    add_entity(client, 'company', 48.85, 2.35)
+    add_entity(client, 'job', 48.851, 2.351)
+    response = client.get('/map/entities?center_lat=48.85&center_lng=2.35&zoom_level=8&cluster=true')
+    assert response.status_code == 200
+    assert "companies" not in response.json
+    assert len(response.json["clusters"]) == 1
+    cluster = response.json["clusters"][0]
+    assert cluster["count"] == 2 and cluster["companies"] == 1 and cluster["jobs"] == 1
+    assert abs(cluster["centroid"]["lat"] - 48.8505) < 1e-6
+    assert response.json["total_entities"] == 2
+
+def test_map_entities_cluster_above_max_zoom_returns_entities(client):
+    add_entity(client, 'company', 48.85, 2.35)
+    response = client.get('/map/entities?center_lat=48.85&center_lng=2.35&zoom_level=13&cluster=true')
+    assert len(response.json["companies"]) == 1
+    assert "clusters" not in response.json
+
+def test_cluster_pyramid_is_cached(client):
+    add_entity(client, 'company', 48.85, 2.35)
+    client.get('/map/entities?center_lat=48.85&center_lng=2.35&zoom_level=8&cluster=true')
+    pyramid = client.application.extensions['cluster_pyramid'][2]
+    client.get('/map/entities?center_lat=48.9&center_lng=2.4&zoom_level=8&cluster=true')
+    assert client.application.extensions['cluster_pyramid'][2] is pyramid
+
+def test_stale_pyramid_is_served_while_rebuilding(client):
+    url = '/map/entities?center_lat=48.85&center_lng=2.35&zoom_level=8&cluster=true'
+    add_entity(client, 'company', 48.85, 2.35)
+    client.get(url)
+    pyramid = client.application.extensions['cluster_pyramid'][2]
+    add_entity(client, 'job', 48.851, 2.351)
+    # La modification ne bloque pas la requête suivante : l'ancienne pyramide répond pendant la reconstruction
+    assert client.get(url).json["total_entities"] == 1
+    client.application.extensions['cluster_rebuild'].join()
+    assert client.application.extensions['cluster_pyramid'][2] is not pyramid
+    assert client.get(url).json["total_entities"] == 2
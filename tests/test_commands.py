@@ -0,0 +1,199 @@
+import pytest
+from app import create_app, db
+from models.location import Location
+import uuid
+
+@pytest.fixture
+def app():
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+    })
+    with app.app_context():
+        db.create_all()
+    yield app
+    with app.app_context():
+        db.drop_all()
+
+def add_location(app, lat, lng):
+    with app.app_context():
+        location = Location(entity_type='job', entity_id=uuid.uuid4(), latitude=lat,
+                            longitude=lng, address="Paris", cp="75000")
+        db.session.add(location)
+        db.session.commit()
+        return location.id
+
+def test_geohash_set_on_insert_and_update(app):
+    location_id = add_location(app, 48.8566, 2.3522)
+    with app.app_context():
+        location = db.session.get(Location, location_id)
+        assert location.geohash == 'u09tvw0f6'
+        location.latitude = 57.64911
+        location.longitude = 10.40744
+        db.session.commit()
+        assert db.session.get(Location, location_id).geohash.startswith('u4pruydqq')
+
+def test_backfill_geohash_command(app):
+    for i in range(5):
+        add_location(app, 48.85 + i / 100, 2.35)
+    with app.app_context():
+        db.session.execute(Location.__table__.update().values(geohash=None))
+        db.session.commit()
+    result = app.test_cli_runner().invoke(args=['locations', 'backfill-geohash', '--batch-size', '2'])
+    assert result.exit_code == 0, result.output
+    assert "5 localisations rétro-remplies" in result.output
+    with app.app_context():
+        assert Location.query.filter(Location.geohash.is_(None)).count() == 0
+        assert all(l.geohash.startswith('u09') for l in Location.query.all())
+
+def write(tmp_path, name, content):
+    path = tmp_path / name
+    path.write_text(content, encoding='utf-8')
+    return str(path)
+
+def test_ingest_companies_csv_with_locations(app, tmp_path):
+    from models.company import Company
+    user_id = uuid.uuid4()
+    path = write(tmp_path, 'companies.csv',
+                 "name,user_id,website,latitude,longitude,address,cp\n"
+                 f"Acme,{user_id},https://acme.fr,48.85,2.35,Paris,75000\n"
+                 f"Nowhere,{user_id},,,,,\n"
+                 f"BadCoords,{user_id},,123,2.35,,\n"
+                 "NoUser,,,,,,\n")
+    result = app.test_cli_runner().invoke(args=['ingest', 'companies', path, '--chunk-size', '2'])
+    assert result.exit_code == 0, result.output
+    assert "2 écrits, 2 rejetés" in result.output
+    with app.app_context():
+        assert sorted(c.name for c in Company.query.all()) == ["Acme", "Nowhere"]
+        location = Location.query.one()
+        assert location.entity_type == 'company' and location.geohash.startswith('u09')
+    rejects = open(path + '.rejects.ndjson').read()
+    assert "coordonnées hors limites" in rejects and "user_id manquant" in rejects
+
+def test_ingest_jobs_geojson_upserts_locations(app, tmp_path):
+    import json
+    from models.company import Company
+    from models.job import Job
+    with app.app_context():
+        company = Company(id=uuid.uuid4(), user_id=uuid.uuid4(), name="Owner",
+                          description="desc", website="https://owner.fr")
+        db.session.add(company)
+        db.session.commit()
+        company_id = str(company.id)
+    job_id = str(uuid.uuid4())
+    def feature(lng, lat, **properties):
+        return {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [lng, lat]},
+                'properties': properties}
+    collection = {'type': 'FeatureCollection', 'features': [
+        feature(2.35, 48.85, id=job_id, company_id=company_id, title="Dev", description="desc",
+                salary="42000.5", job_type="full_time"),
+        feature(2.35, 48.85, company_id=company_id, title="Bad", description="desc", job_type="freelance"),
+        feature(2.35, 48.85, company_id=str(uuid.uuid4()), title="Orphan", description="desc",
+                job_type="contract"),
+    ]}
+    path = write(tmp_path, 'jobs.geojson', json.dumps(collection))
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['ingest', 'jobs', path])
+    assert "1 écrits, 2 rejetés" in result.output
+    collection['features'] = [feature(5.37, 43.30, id=job_id, company_id=company_id, title="Dev",
+                                      description="desc", job_type="full_time")]
+    path = write(tmp_path, 'jobs2.geojson', json.dumps(collection))
+    result = runner.invoke(args=['ingest', 'jobs', path])
+    assert result.exit_code == 0, result.output
+    with app.app_context():
+        assert Job.query.count() == 1
+        location = Location.query.one()
+        assert float(location.latitude) == 43.30 and location.geohash.startswith('spey')
+
+def test_ingest_geojson_requires_ijson(app, tmp_path, monkeypatch):
+    from services import ingest
+    monkeypatch.setattr(ingest, 'ijson', None)
+    path = write(tmp_path, 'jobs.geojson', '{"type": "FeatureCollection", "features": []}')
+    result = app.test_cli_runner().invoke(args=['ingest', 'jobs', path])
+    assert result.exit_code != 0
+    assert "ijson est requis" in result.output
+
+def test_ingest_resumes_after_failure(app, tmp_path, monkeypatch):
+    from models.company import Company
+    from services import ingest
+    user_id = uuid.uuid4()
+    path = write(tmp_path, 'companies.csv',
+                 "name,user_id\n" + "".join(f"C{i},{user_id if i != 3 else ''}\n" for i in range(6)))
+    calls = {'count': 0}
+    original = ingest.bulk_upsert
+    def failing_upsert(table, rows, conflict_columns, **kwargs):
+        if table.name == 'companies' and rows:
+            calls['count'] += 1
+            if calls['count'] == 2:
+                raise RuntimeError("panne")
+        return original(table, rows, conflict_columns, **kwargs)
+    monkeypatch.setattr(ingest, 'bulk_upsert', failing_upsert)
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['ingest', 'companies', path, '--chunk-size', '2'])
+    assert result.exit_code != 0
+    with app.app_context():
+        assert Company.query.count() == 2
+    result = runner.invoke(args=['ingest', 'companies', path, '--chunk-size', '2', '--resume'])
+    assert result.exit_code == 0, result.output
+    assert "5 écrits, 1 rejetés" in result.output
+    with app.app_context():
+        assert Company.query.count() == 5
+    # Le rejet du lot en échec n'est écrit qu'au commit de sa reprise
+    assert len(open(path + '.rejects.ndjson').read().splitlines()) == 1
+
+def test_ingest_reimport_keeps_timestamps(app, tmp_path):
+    import datetime
+    from models.company import Company
+    company_id, user_id = uuid.uuid4(), uuid.uuid4()
+    path = write(tmp_path, 'companies.csv', "id,name,user_id,latitude,longitude\n"
+                                            f"{company_id},Acme,{user_id},48.85,2.35\n")
+    runner = app.test_cli_runner()
+    assert runner.invoke(args=['ingest', 'companies', path]).exit_code == 0
+    with app.app_context():
+        db.session.execute(Company.__table__.update().values(created_at=datetime.datetime(2020, 1, 1)))
+        db.session.execute(Location.__table__.update().values(created_at=datetime.datetime(2020, 1, 1)))
+        db.session.commit()
+    path = write(tmp_path, 'companies2.csv', "id,name,user_id,latitude,longitude\n"
+                                             f"{company_id},Acme SA,{user_id},48.86,2.35\n")
+    assert runner.invoke(args=['ingest', 'companies', path]).exit_code == 0
+    with app.app_context():
+        company = db.session.get(Company, company_id)
+        assert company.name == "Acme SA" and company.created_at == datetime.datetime(2020, 1, 1)
+        location = Location.query.one()
+        assert float(location.latitude) == 48.86 and location.created_at == datetime.datetime(2020, 1, 1)
+    path = write(tmp_path, 'companies3.csv', "id,name,user_id,created_at\n"
+                                             f"{company_id},Acme SA,{user_id},2021-06-01T00:00:00\n")
+    assert runner.invoke(args=['ingest', 'companies', path]).exit_code == 0
+    with app.app_context():
+        assert db.session.get(Company, company_id).created_at == datetime.datetime(2021, 6, 1)
+    path = write(tmp_path, 'companies4.csv', "id,name,user_id,created_at\n"
+                                             f"{company_id},Acme SA,{user_id},2021-06-01T02:30:00+02:00\n")
+    assert runner.invoke(args=['ingest', 'companies', path]).exit_code == 0
+    with app.app_context():
+        assert db.session.get(Company, company_id).created_at == datetime.datetime(2021, 6, 1, 0, 30)
+
+def test_ingest_duplicate_ids_in_chunk_last_wins(app, tmp_path):
+    from models.company import Company
+    company_id, user_id = uuid.uuid4(), uuid.uuid4()
+    path = write(tmp_path, 'companies.csv',
+                 "id,name,user_id,latitude,longitude\n"
+                 f"{company_id},Premier,{user_id},48.85,2.35\n"
+                 f"{uuid.uuid4()},Autre,{user_id},,\n"
+                 f"{company_id},Dernier,{user_id},43.30,5.37\n")
+    result = app.test_cli_runner().invoke(args=['ingest', 'companies', path])
+    assert result.exit_code == 0, result.output
+    with app.app_context():
+        assert db.session.get(Company, company_id).name == "Dernier"
+        assert Company.query.count() == 2
+        assert float(Location.query.one().latitude) == 43.30
+
+def test_create_job_indexes_command(app):
+    with app.app_context():
+        db.session.execute(db.text('DROP INDEX ix_jobs_job_type_salary'))
+        db.session.commit()
+    result = app.test_cli_runner().invoke(args=['jobs', 'create-indexes'])
+    assert result.exit_code == 0, result.output
+    assert "Index ix_jobs_job_type_salary créé" in result.output
+    with app.app_context():
+        names = {index['name'] for index in db.inspect(db.engine).get_indexes('jobs')}
+    assert {'ix_jobs_company_id_posted_at', 'ix_jobs_job_type_posted_at', 'ix_jobs_job_type_salary'} <= names
@@ -150,4 +150,74 @@ def test_get_companies_multiple(client):
     response = client.get('/companies')
     assert response.status_code == 200
     names = [c["name"] for c in response.json]
-    assert "C1" in names and "C2" in names 
\ No newline at end of file
+    assert "C1" in names and "C2" in names 
+
+def test_get_companies_keyset_pagination(client):
+    import datetime
+    with client.application.app_context():
+        for i in range(5):
+            db.session.add(Company(
+                id=uuid.uuid4(),
+                user_id=uuid.uuid4(),
+                name=f"C{i}",
+                description="desc",
+                website="https://test.com",
+                created_at=datetime.datetime(2024, 1, 1 + i)
+            ))
+        db.session.commit()
+    response = client.get('/companies?limit=2')
+    assert [c["name"] for c in response.json] == ["C4", "C3"]
+    cursor = response.headers['X-Next-Cursor']
+    response = client.get(f'/companies?limit=2&cursor={cursor}')
+    assert [c["name"] for c in response.json] == ["C2", "C1"]
+    cursor = response.headers['X-Next-Cursor']
+    response = client.get(f'/companies?limit=2&cursor={cursor}')
+    assert [c["name"] for c in response.json] == ["C0"]
+    assert 'X-Next-Cursor' not in response.headers
+
+def test_get_companies_pagination_across_null_dates(client):
+    import datetime
+    with client.application.app_context():
+        for i in range(4):
+            db.session.add(Company(id=uuid.UUID("a%031x" % (i + 1)), user_id=uuid.uuid4(), name=f"C{i}",
+                                   description="desc", website="https://test.com",
+                                   created_at=datetime.datetime(2024, 1, 1 + i)))
+        db.session.commit()
+        for company in Company.query.filter(Company.name.in_(["C0", "C2"])):
+            company.created_at = None
+        db.session.commit()
+    names = []
+    response = client.get('/companies?limit=1&fields=name')
+    while True:
+        names += [c["name"] for c in response.json]
+        cursor = response.headers.get('X-Next-Cursor')
+        if cursor is None:
+            break
+        response = client.get(f'/companies?limit=1&fields=name&cursor={cursor}')
+    assert names == ["C2", "C0", "C3", "C1"]
+
+def test_get_companies_fields_projection(client):
+    company = Company(
+        id=uuid.uuid4(),
+        user_id=uuid.uuid4(),
+        name="Projected",
+        description="long text",
+        website="https://test.com"
+    )
+    with client.application.app_context():
+        db.session.add(company)
+        db.session.commit()
+        company_id = company.id
+    response = client.get('/companies?fields=id,name')
+    assert response.json == [{"id": str(company_id), "name": "Projected"}]
+    # Seule la localisation : aucune colonne, pas même celles sélectionnées pour le curseur
+    assert client.get('/companies?fields=location').json == [{"location": None}]
+    response = client.get('/companies?fields=location&format=ndjson')
+    assert response.get_data(as_text=True) == '{"location":null}\n'
+
+def test_get_companies_invalid_params(client):
+    assert client.get('/companies?fields=name,secret').status_code == 400
+    assert client.get('/companies?limit=0').status_code == 400
+    assert client.get('/companies?cursor=notacursor').status_code == 400
+    # JSON valide mais id non textuel : [null, 5]
+    assert client.get('/companies?cursor=W251bGwsIDVd').status_code == 400
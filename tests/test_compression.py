@@ -0,0 +1,85 @@
+import gzip
+import pytest
+from app import create_app, db
+from models.company import Company
+from models.location import Location
+import services.compression as compression
+import services.response_cache as response_cache
+from services.compression import negotiate
+import uuid
+
+@pytest.fixture
+def client():
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'COMPRESSION_MIN_SIZE': 500,
+    })
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+        yield client
+        with app.app_context():
+            db.drop_all()
+
+def seed(client, count=20):
+    with client.application.app_context():
+        for i in range(count):
+            company = Company(id=uuid.uuid4(), user_id=uuid.uuid4(), name=f"Entreprise {i}",
+                              description="Une description assez répétitive " * 5, website="https://test.com")
+            db.session.add(company)
+            db.session.add(Location(entity_type='company', entity_id=company.id, latitude=48.85,
+                                    longitude=2.35, address="Paris", cp="75000"))
+        db.session.commit()
+
+@pytest.mark.parametrize('header, expected', [
+    ('gzip, deflate', 'gzip'),
+    ('gzip;q=0', None),
+    ('*', 'gzip'),
+    ('*;q=0.5, gzip;q=0', None),
+    ('identity', None),
+    ('', None),
+    (None, None),
+])
+def test_negotiate(header, expected, monkeypatch):
+    # Seul gzip est toujours disponible : brotli et zstandard sont optionnels
+    monkeypatch.setattr(compression, 'CODECS', {'gzip': compression.CODECS['gzip']})
+    assert negotiate(header, ['zstd', 'br', 'gzip']) == expected
+
+def test_cached_listing_is_served_precompressed(client, monkeypatch):
+    seed(client)
+    plain = client.get('/companies', headers={'Accept-Encoding': 'identity'})
+    assert 'Content-Encoding' not in plain.headers
+    assert 'Accept-Encoding' in plain.headers['Vary']
+    calls = []
+    original = response_cache.compress
+    monkeypatch.setattr(response_cache, 'compress', lambda *args: calls.append(args) or original(*args))
+    for _ in range(3):
+        response = client.get('/companies', headers={'Accept-Encoding': 'gzip'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert response.headers['X-Cache'] == 'HIT'
+        assert gzip.decompress(response.get_data()) == plain.get_data()
+        assert int(response.headers['Content-Length']) < len(plain.get_data())
+    assert len(calls) == 1
+    etag = response.headers['ETag']
+    assert etag.startswith('W/')
+    response = client.get('/companies', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert response.status_code == 304
+
+def test_uncached_route_is_compressed_after_request(client):
+    seed(client)
+    response = client.post('/map/entities/batch', headers={'Accept-Encoding': 'gzip'},
+                           json={'viewports': [{'center_lat': 48.85, 'center_lng': 2.35, 'radius_km': 1}]})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert len(gzip.decompress(response.get_data())) > 500
+
+def test_small_responses_and_disabled_compression(client):
+    seed(client)
+    client.application.config['COMPRESSION_MIN_SIZE'] = 10 ** 6
+    response = client.get('/companies', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+    assert response.headers['X-Cache'] == 'MISS'
+    client.application.config['COMPRESSION_MIN_SIZE'] = 500
+    client.application.config['COMPRESSION_ENABLED'] = False
+    response = client.get('/jobs', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
@@ -0,0 +1,91 @@
+import logging
+import pytest
+from app import create_app, db
+from models.company import Company
+from services.database import engine_options, use_primary
+import uuid
+
+def make_app(tmp_path, **config):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path}/primary.db',
+        'RESPONSE_CACHE_BACKEND': 'none',
+        **config
+    })
+    with app.app_context():
+        db.create_all()
+    return app
+
+def add_company(app, name, bind_key=None):
+    with app.app_context():
+        engine = db.engines[bind_key]
+        with engine.begin() as connection:
+            connection.execute(Company.__table__.insert(), [{
+                'id': uuid.uuid4(), 'user_id': uuid.uuid4(), 'name': name,
+                'description': 'desc', 'website': 'https://test.com'
+            }])
+
+def names(client):
+    response = client.get('/companies')
+    assert response.status_code == 200
+    return [company['name'] for company in response.json]
+
+def test_engine_options():
+    from config import Config
+    config = {key: getattr(Config, key) for key in dir(Config) if key.isupper()}
+    config['DB_STATEMENT_TIMEOUT_MS'] = 5000
+    assert engine_options(config, 'sqlite:///:memory:') == {}
+    options = engine_options(config, 'postgresql://user@host/db')
+    assert options['pool_size'] == Config.DB_POOL_SIZE and options['pool_pre_ping'] is True
+    assert options['connect_args']['options'] == '-c statement_timeout=5000'
+
+def test_get_routes_read_from_replica(tmp_path):
+    app = make_app(tmp_path, DATABASE_REPLICA_URL=f'sqlite:///{tmp_path}/replica.db')
+    with app.app_context():
+        db.metadata.create_all(db.engines['replica'])
+    add_company(app, "Primaire")
+    add_company(app, "Réplica", 'replica')
+    assert names(app.test_client()) == ["Réplica"]
+    with app.app_context():
+        assert [c.name for c in Company.query.all()] == ["Primaire"]
+
+def test_use_primary_pins_get_reads(tmp_path):
+    app = make_app(tmp_path, DATABASE_REPLICA_URL=f'sqlite:///{tmp_path}/replica.db')
+    with app.app_context():
+        db.metadata.create_all(db.engines['replica'])
+    add_company(app, "Primaire")
+    add_company(app, "Réplica", 'replica')
+    with app.test_request_context('/companies', method='GET'):
+        with use_primary(db.session):
+            assert [c.name for c in Company.query.all()] == ["Primaire"]
+        assert [c.name for c in Company.query.all()] == ["Réplica"]
+
+def test_unhealthy_replica_falls_back_to_primary(tmp_path, caplog):
+    app = make_app(tmp_path, DATABASE_REPLICA_URL=f'sqlite:///{tmp_path}/missing/replica.db')
+    add_company(app, "Primaire")
+    client = app.test_client()
+    with caplog.at_level(logging.WARNING, logger='services.database'):
+        assert names(client) == ["Primaire"]
+    assert "Réplica indisponible" in caplog.text
+    router = app.extensions['db_replica']
+    assert router.healthy is False and router.fallbacks >= 1
+    assert 'db_replica_fallbacks_total' in client.get('/metrics').get_data(as_text=True)
+
+def test_query_error_keeps_replica_healthy(tmp_path):
+    app = make_app(tmp_path, DATABASE_REPLICA_URL=f'sqlite:///{tmp_path}/replica.db')
+    router = app.extensions['db_replica']
+    with app.app_context():
+        # OperationalError sans déconnexion (comme une annulation par statement_timeout sous psycopg2)
+        with pytest.raises(db.exc.OperationalError):
+            with db.engines['replica'].connect() as connection:
+                connection.execute(db.text('SELECT * FROM table_absente'))
+    assert router.healthy is True
+
+def test_pool_saturation_is_logged(tmp_path, caplog):
+    app = make_app(tmp_path, SQLALCHEMY_ENGINE_OPTIONS={'pool_size': 1, 'max_overflow': 0})
+    with app.app_context():
+        with caplog.at_level(logging.WARNING, logger='services.database'):
+            with db.engine.connect():
+                pass
+    assert "Pool de connexions primary saturé : 1/1" in caplog.text
+    assert app.extensions['db_pool_monitor'].saturated >= 1
@@ -0,0 +1,85 @@
+import json
+import pytest
+from app import create_app, db
+from bench import startup
+from models.company import Company
+from services.server import prime_connections, warm_up
+import uuid
+
+@pytest.fixture
+def client():
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+        yield client
+        with app.app_context():
+            db.drop_all()
+
+def test_liveness(client):
+    response = client.get('/health/live')
+    assert response.status_code == 200
+    assert response.json == {'status': 'ok'}
+
+def test_readiness_ok_without_warmup(client):
+    response = client.get('/health/ready')
+    assert response.status_code == 200
+    assert response.json == {'status': 'ok', 'database': True, 'warmed_up': True}
+
+def test_readiness_waits_for_warmup(client):
+    app = client.application
+    app.config['WARMUP_ENABLED'] = True
+    response = client.get('/health/ready')
+    assert response.status_code == 503
+    assert response.json['warmed_up'] is False
+    warm_up(app)
+    response = client.get('/health/ready')
+    assert response.status_code == 200
+    assert response.json['warmed_up'] is True
+
+def test_readiness_reports_unreachable_database(tmp_path):
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///%s' % (tmp_path / 'absent' / 'x.db')})
+    response = app.test_client().get('/health/ready')
+    assert response.status_code == 503
+    assert response.json == {'status': 'unavailable', 'database': False, 'warmed_up': True}
+    assert app.test_client().get('/health/live').status_code == 200
+
+def test_create_app_does_not_connect(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///%s' % (tmp_path / 'absent' / 'x.db'),
+        'SPATIAL_INDEX_ENABLED': True,
+    })
+    with app.app_context():
+        assert all(engine.pool.checkedin() == 0 for engine in db.engines.values())
+    assert app.extensions['spatial_index'].last_refresh is None
+
+def test_warm_up_primes_connections_and_caches(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///%s' % (tmp_path / 'warm.db'),
+        'SQLALCHEMY_ENGINE_OPTIONS': {'pool_size': 3},
+        'SPATIAL_INDEX_ENABLED': True,
+        'WARMUP_PATHS': '/companies?limit=1',
+    })
+    with app.app_context():
+        db.create_all()
+        db.session.add(Company(id=uuid.uuid4(), user_id=uuid.uuid4(), name="Warm", description="d"))
+        db.session.commit()
+        assert prime_connections(app, 5) == 3
+        db.engine.dispose()
+    warm_up(app)
+    assert app.extensions['warmed_up'] is True
+    assert app.extensions['spatial_index'].last_refresh is not None
+    with app.app_context():
+        assert db.engine.pool.checkedin() == 2
+    response = app.test_client().get('/companies?limit=1')
+    assert response.headers['X-Cache'] == 'HIT'
+
+def test_startup_benchmark_report(tmp_path):
+    output = tmp_path / 'startup.json'
+    startup.main(['--sizes', '20', '--repeat', '1', '--output', str(output)])
+    report = json.loads(output.read_text())
+    scenarios = report['results']['20']['scenarios']
+    assert {'import', 'create_app', 'warm_up', 'first_request', 'second_request', 'total'} <= set(scenarios)
+    assert scenarios['total']['p50_ms'] >= scenarios['import']['p50_ms']
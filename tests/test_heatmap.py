@@ -0,0 +1,83 @@
+import pytest
+from sqlalchemy import event
+from app import create_app, db
+from models.company import Company
+from models.job import Job
+from models.location import Location
+import uuid
+
+@pytest.fixture
+def client():
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+    })
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+        yield client
+        with app.app_context():
+            db.drop_all()
+
+def add_entity(client, entity_type, lat, lng, job_type='full_time'):
+    if entity_type == 'company':
+        entity = Company(id=uuid.uuid4(), user_id=uuid.uuid4(), name="C",
+                         description="desc", website="https://test.com")
+    else:
+        entity = Job(id=uuid.uuid4(), company_id=uuid.uuid4(), title="J",
+                     description="desc", salary=10000, job_type=job_type)
+    with client.application.app_context():
+        db.session.add(entity)
+        db.session.add(Location(entity_type=entity_type, entity_id=entity.id, latitude=lat,
+                                longitude=lng, address="Paris", cp="75000"))
+        db.session.commit()
+
+FRANCE = 'min_lat=42&max_lat=51&min_lng=-5&max_lng=8'
+
+def test_heatmap_counts_per_cell(client):
+    add_entity(client, 'job', 48.85, 2.35)
+    add_entity(client, 'job', 48.86, 2.36, job_type='internship')
+    add_entity(client, 'company', 48.85, 2.35)
+    add_entity(client, 'job', 43.30, 5.37)
+    add_entity(client, 'job', 10.0, 10.0)
+    response = client.get(f'/map/heatmap?{FRANCE}&zoom=5')
+    assert response.status_code == 200
+    assert response.json["fields"] == ['lat', 'lng', 'count']
+    cells = response.json["cells"]
+    assert [cell[2] for cell in cells] == [1, 3]
+    assert response.json["total"] == 4 and response.json["max"] == 3
+    size = response.json["cell_size_deg"]
+    assert abs(cells[1][0] - 48.85) <= size / 2 and abs(cells[1][1] - 2.35) <= size / 2
+
+def test_heatmap_uses_geohash_ranges(client):
+    add_entity(client, 'job', 48.85, 2.35)
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if 'FROM locations' in statement:
+            statements.append(statement)
+    with client.application.app_context():
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            assert client.get(f'/map/heatmap?{FRANCE}&zoom=5').json["total"] == 1
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+    assert len(statements) == 1 and 'locations.geohash >=' in statements[0]
+
+def test_heatmap_filters(client):
+    add_entity(client, 'job', 48.85, 2.35)
+    add_entity(client, 'job', 48.86, 2.36, job_type='internship')
+    add_entity(client, 'company', 48.85, 2.35)
+    response = client.get(f'/map/heatmap?{FRANCE}&zoom=5&entity_type=company')
+    assert response.json["total"] == 1
+    response = client.get(f'/map/heatmap?{FRANCE}&zoom=5&job_type=internship,contract')
+    assert response.json["total"] == 1
+    response = client.get(f'/map/heatmap?{FRANCE}&zoom=5&job_type=full_time&job_type=internship')
+    assert response.json["total"] == 2
+
+def test_heatmap_validation(client):
+    assert client.get('/map/heatmap?min_lat=42').status_code == 400
+    assert client.get('/map/heatmap?min_lat=nan&max_lat=51&min_lng=-5&max_lng=8').status_code == 400
+    assert client.get('/map/heatmap?min_lat=42&max_lat=inf&min_lng=-5&max_lng=8').status_code == 400
+    assert client.get(f'/map/heatmap?{FRANCE}&job_type=freelance').status_code == 400
+    assert client.get(f'/map/heatmap?{FRANCE}&entity_type=company&job_type=contract').status_code == 400
+    assert client.get('/map/heatmap?min_lat=-90&max_lat=90&min_lng=-180&max_lng=180&zoom=12').status_code == 400
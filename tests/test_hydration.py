@@ -0,0 +1,86 @@
+import pytest
+from sqlalchemy import event
+from app import create_app, db
+from models.company import Company
+from models.job import Job
+from models.location import Location
+import uuid
+
+@pytest.fixture
+def client():
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        # Requêtes des routes seules, sans la relecture périodique de map_changes par le cache
+        'RESPONSE_CACHE_BACKEND': 'none',
+    })
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+        yield client
+        with app.app_context():
+            db.drop_all()
+
+def seed(client, count):
+    with client.application.app_context():
+        for i in range(count):
+            company = Company(
+                id=uuid.uuid4(),
+                user_id=uuid.uuid4(),
+                name=f"C{i}",
+                description="desc",
+                website="https://test.com"
+            )
+            job = Job(
+                id=uuid.uuid4(),
+                company_id=company.id,
+                title=f"J{i}",
+                description="desc job",
+                salary=10000,
+                job_type="full_time"
+            )
+            db.session.add(company)
+            db.session.add(job)
+            db.session.add(Location(entity_type='company', entity_id=company.id,
+                                    latitude=48.85, longitude=2.35, address="Paris", cp="75000"))
+            db.session.add(Location(entity_type='job', entity_id=job.id,
+                                    latitude=48.85, longitude=2.35, address="Paris", cp="75000"))
+        db.session.commit()
+
+def count_queries(client, url):
+    statements = []
+    with client.application.app_context():
+        engine = db.engine
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    assert response.status_code == 200
+    return len(statements), response
+
+@pytest.mark.parametrize('url', [
+    '/companies',
+    '/jobs',
+    '/map/entities?center_lat=48.85&center_lng=2.35&radius_km=1',
+])
+def test_query_count_is_flat(client, url):
+    seed(client, 3)
+    small, _ = count_queries(client, url)
+    seed(client, 30)
+    large, response = count_queries(client, url)
+    assert large == small
+    payload = response.json if isinstance(response.json, list) else response.json['jobs']
+    assert len(payload) == 33 and payload[0]['location'] is not None
+
+def test_get_job_hydrates_company(client):
+    seed(client, 1)
+    with client.application.app_context():
+        job = Job.query.first()
+        job_id = job.id
+    queries, response = count_queries(client, f'/jobs/{job_id}')
+    assert queries <= 3
+    assert response.json['company_name'] == "C0"
+    assert response.json['location']['address'] == "Paris"
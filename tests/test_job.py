@@ -146,4 +146,73 @@ def test_get_jobs_multiple(client):
     response = client.get('/jobs')
     assert response.status_code == 200
     titles = [j["title"] for j in response.json]
-    assert "J1" in titles and "J2" in titles 
\ No newline at end of file
+    assert "J1" in titles and "J2" in titles 
+
+def test_get_jobs_projection_skips_heavy_columns(client):
+    from sqlalchemy import event
+    job = Job(
+        id=uuid.uuid4(),
+        company_id=uuid.uuid4(),
+        title="Light",
+        description="very long description",
+        salary=10000,
+        job_type="full_time"
+    )
+    with client.application.app_context():
+        db.session.add(job)
+        db.session.commit()
+        engine = db.engine
+    statements = []
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = client.get('/jobs?fields=id,title,salary,location&limit=10')
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    assert response.json[0]["title"] == "Light"
+    assert response.json[0]["salary"] == 10000.0
+    assert response.json[0]["location"] is None
+    assert "description" not in response.json[0]
+    assert not any("jobs.description" in s for s in statements)
+
+def test_get_jobs_streamed_json_and_ndjson(client):
+    import json
+    client.application.config['STREAM_BATCH_SIZE'] = 2
+    with client.application.app_context():
+        for i in range(5):
+            job = Job(
+                id=uuid.uuid4(),
+                company_id=uuid.uuid4(),
+                title=f"S{i}",
+                description="desc",
+                salary=10000,
+                job_type="full_time"
+            )
+            db.session.add(job)
+            if i == 0:
+                db.session.add(Location(entity_type='job', entity_id=job.id, latitude=48.85,
+                                        longitude=2.35, address="Paris", cp="75000"))
+        db.session.commit()
+    response = client.get('/jobs?stream=true')
+    assert response.is_streamed
+    assert response.mimetype == 'application/json'
+    jobs = json.loads(response.get_data(as_text=True))
+    assert sorted(j["title"] for j in jobs) == ["S0", "S1", "S2", "S3", "S4"]
+    assert [j["location"]["address"] for j in jobs if j["title"] == "S0"] == ["Paris"]
+    response = client.get('/jobs?format=ndjson&fields=title&limit=3')
+    assert response.mimetype == 'application/x-ndjson'
+    lines = response.get_data(as_text=True).splitlines()
+    assert len(lines) == 3 and set(json.loads(lines[0])) == {"title"}
+    plain = client.get('/jobs?fields=title,id,salary&limit=2').get_data(as_text=True)
+    streamed = client.get('/jobs?fields=title,id,salary&limit=2&stream=true').get_data(as_text=True)
+    assert streamed == plain.strip()
+    response = client.get('/jobs?fields=location&stream=true')
+    jobs = json.loads(response.get_data(as_text=True))
+    assert all(set(j) == {"location"} for j in jobs) and len(jobs) == 5
+    assert [j["location"]["address"] for j in client.get('/jobs?fields=location').json if j["location"]] == ["Paris"]
+
+def test_get_jobs_stream_empty_and_bad_format(client):
+    response = client.get('/jobs?stream=true')
+    assert response.get_data(as_text=True) == '[]'
+    assert client.get('/jobs?format=xml').status_code == 400
@@ -0,0 +1,97 @@
+import pytest
+from sqlalchemy import event
+from app import create_app, db
+from models.company import Company
+from models.job import Job
+from models.location import Location
+import uuid
+
+@pytest.fixture
+def client():
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'LOOKUP_MAX_IDS': 100,
+    })
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+        yield client
+        with app.app_context():
+            db.drop_all()
+
+def seed(client, count):
+    company_ids, job_ids = [], []
+    with client.application.app_context():
+        for i in range(count):
+            company = Company(id=uuid.uuid4(), user_id=uuid.uuid4(), name=f"C{i}", description="desc",
+                              website="https://test.com")
+            jobs = [Job(id=uuid.uuid4(), company_id=company.id, title=f"J{i}-{j}", description="desc job",
+                        salary=10000, job_type="full_time") for j in range(2)]
+            db.session.add_all([company, *jobs])
+            db.session.add(Location(entity_type='company', entity_id=company.id, latitude=48.85,
+                                    longitude=2.35, address="Paris", cp="75000"))
+            db.session.add(Location(entity_type='job', entity_id=jobs[0].id, latitude=48.85,
+                                    longitude=2.35, address="Paris", cp="75000"))
+            company_ids.append(str(company.id))
+            job_ids.extend(str(job.id) for job in jobs)
+        db.session.commit()
+    return company_ids, job_ids
+
+def lookup(client, url, ids):
+    statements = []
+    with client.application.app_context():
+        engine = db.engine
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = client.post(url, json={'ids': ids})
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    assert response.status_code == 200
+    return len(statements), response.json
+
+def test_jobs_lookup_matches_detail_route(client):
+    _, job_ids = seed(client, 20)
+    unknown = str(uuid.uuid4())
+    small, _ = lookup(client, '/jobs/lookup', job_ids[:2])
+    queries, result = lookup(client, '/jobs/lookup', [job_ids[5], unknown] + job_ids + [job_ids[5]])
+    assert queries == small == 3
+    assert [job['id'] for job in result['jobs']] == [job_ids[5]] + [i for i in job_ids if i != job_ids[5]]
+    assert result['missing'] == [unknown]
+    for job in result['jobs'][:4]:
+        assert job == client.get('/jobs/%s' % job['id']).json
+    assert result['jobs'][0]['company_name'] == "C2"
+
+def test_companies_lookup_matches_detail_route(client):
+    company_ids, _ = seed(client, 20)
+    unknown = str(uuid.uuid4())
+    small, _ = lookup(client, '/companies/lookup', company_ids[:1])
+    queries, result = lookup(client, '/companies/lookup', [unknown] + company_ids[::-1])
+    assert queries == small == 3
+    assert [company['id'] for company in result['companies']] == company_ids[::-1]
+    assert result['missing'] == [unknown]
+    for company in result['companies'][:3]:
+        expected = client.get('/companies/%s' % company['id']).json
+        assert sorted(company.pop('jobs'), key=lambda j: j['id']) == sorted(expected.pop('jobs'),
+                                                                          key=lambda j: j['id'])
+        assert company == expected
+
+@pytest.mark.parametrize('payload, error', [
+    (None, 'ids doit être une liste'),
+    ({'ids': 'abc'}, 'ids doit être une liste'),
+    ([str(uuid.uuid4())], 'ids doit être une liste'),
+    ({'ids': [str(uuid.uuid4()), 'abc']}, "ids[1] n'est pas un UUID valide"),
+    ({'ids': [12]}, "ids[0] n'est pas un UUID valide"),
+    ({'ids': [str(uuid.uuid4())] * 101}, "Trop d'ids (max 100)"),
+])
+def test_lookup_rejects_invalid_ids(client, payload, error):
+    for url in ('/jobs/lookup', '/companies/lookup'):
+        response = client.post(url, json=payload)
+        assert response.status_code == 400
+        assert response.json['error'] == error
+
+def test_lookup_empty_list(client):
+    response = client.post('/jobs/lookup', json={'ids': []})
+    assert response.json == {'jobs': [], 'missing': []}
@@ -3,6 +3,7 @@ from app import create_app, db
 from models.company import Company
 from models.job import Job
 from models.location import Location
+import datetime
 import uuid
 
 @pytest.fixture
@@ -150,4 +151,183 @@ def test_get_map_entities_with_multiple_entities(client):
     response = client.get('/map/entities?center_lat=48.85&center_lng=2.35&radius_km=1')
     assert response.status_code == 200
     assert len(response.json["companies"]) == 1
-    assert len(response.json["jobs"]) == 1 
\ No newline at end of file
+    assert len(response.json["jobs"]) == 1 
+
+def add_map_company(client, name, lat, lng):
+    company = Company(
+        id=uuid.uuid4(),
+        user_id=uuid.uuid4(),
+        name=name,
+        description="desc",
+        website="https://test.com"
+    )
+    location = Location(
+        entity_type='company',
+        entity_id=company.id,
+        latitude=lat,
+        longitude=lng,
+        address="Paris",
+        cp="75000"
+    )
+    with client.application.app_context():
+        db.session.add(company)
+        db.session.add(location)
+        db.session.commit()
+
+def test_get_map_entities_drops_bbox_corners(client):
+    add_map_company(client, "Center", 48.85, 2.35)
+    # Dans la bbox de 10 km mais à ~13 km du centre
+    add_map_company(client, "Corner", 48.85 + 0.085, 2.35 + 0.125)
+    response = client.get('/map/entities?center_lat=48.85&center_lng=2.35&radius_km=10')
+    assert response.status_code == 200
+    assert [c["name"] for c in response.json["companies"]] == ["Center"]
+    assert response.json["companies"][0]["distance_km"] == 0.0
+
+def test_get_map_entities_sort_by_distance_and_limit(client):
+    add_map_company(client, "Far", 48.90, 2.35)
+    add_map_company(client, "Near", 48.86, 2.35)
+    add_map_company(client, "Mid", 48.88, 2.35)
+    response = client.get('/map/entities?center_lat=48.85&center_lng=2.35&radius_km=10&sort=distance')
+    names = [c["name"] for c in response.json["companies"]]
+    assert names == ["Near", "Mid", "Far"]
+    distances = [c["distance_km"] for c in response.json["companies"]]
+    assert distances == sorted(distances)
+    assert abs(distances[0] - 1.112) < 0.01
+    response = client.get('/map/entities?center_lat=48.85&center_lng=2.35&radius_km=10&sort=distance&limit=2')
+    assert [c["name"] for c in response.json["companies"]] == ["Near", "Mid"]
+    assert response.json["total_entities"] == 2
+
+def test_get_map_entities_invalid_sort_or_limit(client):
+    response = client.get('/map/entities?center_lat=48.85&center_lng=2.35&sort=name')
+    assert response.status_code == 400
+    response = client.get('/map/entities?center_lat=48.85&center_lng=2.35&limit=0')
+    assert response.status_code == 400
+
+@pytest.mark.parametrize('query', ['radius_km=inf', 'radius_km=nan', 'center_lat=nan&center_lng=2.35',
+                                   'center_lat=48.85&center_lng=-inf'])
+def test_get_map_entities_non_finite_params(client, query):
+    if 'center_lat' not in query:
+        query = 'center_lat=48.85&center_lng=2.35&' + query
+    response = client.get(f'/map/entities?{query}')
+    assert response.status_code == 400
+
+def test_get_map_entities_finds_rows_without_geohash(client):
+    add_map_company(client, "NotBackfilled", 48.85, 2.35)
+    with client.application.app_context():
+        db.session.execute(Location.__table__.update().values(geohash=None))
+        db.session.commit()
+    response = client.get('/map/entities?center_lat=48.85&center_lng=2.35&radius_km=1')
+    assert [c["name"] for c in response.json["companies"]] == ["NotBackfilled"]
+
+def test_geohash_filter_uses_prefix_ranges():
+    from services.map_query import geohash_filter
+    clause = str(geohash_filter(48.8, 48.9, 2.3, 2.4).compile(compile_kwargs={'literal_binds': True}))
+    assert "locations.geohash IS NULL" in clause
+    assert "locations.geohash >= 'u09" in clause
+
+def test_batch_viewports_share_one_query_and_dedupe(client):
+    from sqlalchemy import event
+    add_map_company(client, "Paris", 48.85, 2.35)
+    add_map_company(client, "Overlap", 48.86, 2.36)
+    add_map_company(client, "Lyon", 45.76, 4.83)
+    with client.application.app_context():
+        engine = db.engine
+    statements = []
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = client.post('/map/entities/batch', json={'viewports': [
+            {'id': 'main', 'center_lat': 48.85, 'center_lng': 2.35, 'radius_km': 5, 'sort': 'distance'},
+            {'id': 'mini', 'center_lat': 48.86, 'center_lng': 2.36, 'radius_km': 1},
+            {'id': 'lyon', 'center_lat': 45.76, 'center_lng': 4.83, 'radius_km': 1},
+        ]})
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    assert response.status_code == 200
+    assert sum('FROM locations' in s for s in statements) == 1
+    assert sorted(c["name"] for c in response.json["companies"]) == ["Lyon", "Overlap", "Paris"]
+    main, mini, lyon = response.json["viewports"]
+    names = {c["id"]: c["name"] for c in response.json["companies"]}
+    assert main["id"] == 'main' and [names[c["id"]] for c in main["companies"]] == ["Paris", "Overlap"]
+    assert [names[c["id"]] for c in mini["companies"]] == ["Overlap"]
+    assert mini["companies"][0]["distance_km"] == 0.0
+    assert [names[c["id"]] for c in lyon["companies"]] == ["Lyon"]
+
+def test_batch_viewports_validation(client):
+    assert client.post('/map/entities/batch', json={}).status_code == 400
+    assert client.post('/map/entities/batch', json=["x"]).status_code == 400
+    response = client.post('/map/entities/batch', json={'viewports': [{'center_lat': 1}]})
+    assert response.status_code == 400
+    assert 'viewport 0' in response.json['error']
+    response = client.post('/map/entities/batch',
+                           json={'viewports': [{'center_lat': 48.85, 'center_lng': 2.35, 'radius_km': 'inf'}]})
+    assert response.status_code == 400
+    client.application.config['MAP_BATCH_MAX_VIEWPORTS'] = 1
+    viewport = {'center_lat': 48.85, 'center_lng': 2.35}
+    response = client.post('/map/entities/batch', json={'viewports': [viewport, viewport]})
+    assert response.status_code == 400
+
+def seed_filterable(client):
+    with client.application.app_context():
+        companies = []
+        for name in ("Alpha", "Beta"):
+            company = Company(id=uuid.uuid4(), user_id=uuid.uuid4(), name=name,
+                              description="desc", website="https://test.com")
+            db.session.add(company)
+            db.session.add(Location(entity_type='company', entity_id=company.id, latitude=48.85,
+                                    longitude=2.35, address="Paris", cp="75000"))
+            companies.append(company)
+        specs = [
+            (companies[0], "Stage", 800, 'internship', datetime.datetime(2024, 1, 10)),
+            (companies[0], "CDI", 45000, 'full_time', datetime.datetime(2024, 3, 1)),
+            (companies[1], "Mission", 60000, 'contract', datetime.datetime(2024, 2, 1)),
+        ]
+        for company, title, salary, job_type, posted_at in specs:
+            job = Job(id=uuid.uuid4(), company_id=company.id, title=title, description="desc",
+                      salary=salary, job_type=job_type, posted_at=posted_at)
+            db.session.add(job)
+            db.session.add(Location(entity_type='job', entity_id=job.id, latitude=48.851,
+                                    longitude=2.351, address="Paris", cp="75000"))
+        db.session.commit()
+        return [str(company.id) for company in companies]
+
+@pytest.mark.parametrize('query, companies, jobs', [
+    ('entity_type=company', ["Alpha", "Beta"], []),
+    ('entity_type=job', [], ["CDI", "Mission", "Stage"]),
+    ('job_type=internship,contract', [], ["Mission", "Stage"]),
+    ('job_type=internship&job_type=full_time', [], ["CDI", "Stage"]),
+    ('salary_min=1000&salary_max=50000', [], ["CDI"]),
+    ('posted_after=2024-01-15', [], ["CDI", "Mission"]),
+])
+def test_get_map_entities_filters(client, query, companies, jobs):
+    seed_filterable(client)
+    response = client.get(f'/map/entities?center_lat=48.85&center_lng=2.35&radius_km=1&{query}')
+    assert response.status_code == 200
+    assert sorted(c['name'] for c in response.json['companies']) == companies
+    assert sorted(j['title'] for j in response.json['jobs']) == jobs
+
+def test_get_map_entities_filter_company_id(client):
+    alpha, _ = seed_filterable(client)
+    url = f'/map/entities?center_lat=48.85&center_lng=2.35&radius_km=1&company_id={alpha}'
+    response = client.get(url)
+    assert [c['name'] for c in response.json['companies']] == ["Alpha"]
+    assert sorted(j['title'] for j in response.json['jobs']) == ["CDI", "Stage"]
+    response = client.get(url + '&job_type=full_time')
+    assert response.json['companies'] == []
+    assert [j['title'] for j in response.json['jobs']] == ["CDI"]
+
+@pytest.mark.parametrize('query', [
+    'entity_type=place',
+    'job_type=freelance',
+    'salary_min=abc',
+    'salary_min=5000&salary_max=100',
+    'posted_after=hier',
+    'company_id=42',
+    'entity_type=company&salary_min=1000',
+    'cluster=true&job_type=contract',
+])
+def test_get_map_entities_invalid_filters(client, query):
+    response = client.get(f'/map/entities?center_lat=48.85&center_lng=2.35&{query}')
+    assert response.status_code == 400
+    assert 'error' in response.json
@@ -0,0 +1,157 @@
+import pytest
+from app import create_app, db
+from models.company import Company
+from models.job import Job
+from models.location import Location
+from models.map_entity import MapEntity
+from services import map_entities
+import datetime
+import re
+import uuid
+
+@pytest.fixture
+def client():
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'RESPONSE_CACHE_BACKEND': 'none',
+        'MAP_READ_MODEL': 'session',
+    })
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+        yield client
+        with app.app_context():
+            db.drop_all()
+
+def seed(client):
+    with client.application.app_context():
+        company = Company(id=uuid.uuid4(), user_id=uuid.uuid4(), name="Acme", description="desc",
+                          website="https://acme.fr")
+        jobs = [Job(id=uuid.uuid4(), company_id=company.id, title=f"Offre {i}", description="desc",
+                    salary=30000 + 10000 * i, job_type='full_time' if i % 2 else 'internship',
+                    posted_at=datetime.datetime(2024, 1, 1 + i)) for i in range(4)]
+        db.session.add_all([company, *jobs])
+        db.session.add(Location(entity_type='company', entity_id=company.id, latitude=48.85,
+                                longitude=2.35, address="Paris", cp="75000"))
+        for i, job in enumerate(jobs):
+            db.session.add(Location(entity_type='job', entity_id=job.id, latitude=48.85 + i * 0.001,
+                                    longitude=2.35, address="Paris", cp="75000"))
+        # Localisation d'une entité inexistante : jamais affichée
+        db.session.add(Location(entity_type='job', entity_id=uuid.uuid4(), latitude=48.85, longitude=2.35))
+        db.session.commit()
+        return company.id, [job.id for job in jobs]
+
+def entities(client, query=''):
+    response = client.get('/map/entities?center_lat=48.85&center_lng=2.35&radius_km=2&sort=distance' + query)
+    assert response.status_code == 200
+    return {key: response.json[key] for key in ('companies', 'jobs')}
+
+@pytest.mark.parametrize('query', ['', '&job_type=full_time&salary_min=35000', '&entity_type=company',
+                                   '&posted_after=2024-01-03', '&limit=2'])
+def test_read_model_matches_join(client, query):
+    company_id, _ = seed(client)
+    with client.application.app_context():
+        assert MapEntity.query.count() == 5
+    expected = entities(client, query + '&company_id=%s' % company_id)
+    client.application.config['MAP_READ_MODEL'] = 'off'
+    assert entities(client, query + '&company_id=%s' % company_id) == expected
+    assert expected['companies'] or expected['jobs']
+
+def test_trigger_written_payload_serializes_like_join(client):
+    seed(client)
+    with client.application.app_context():
+        # Forme produite par json_build_object : salaire entier sans partie décimale
+        for row in MapEntity.query.filter_by(entity_type='job').all():
+            db.session.execute(MapEntity.__table__.update().where(MapEntity.id == row.id)
+                               .values(payload=dict(row.payload, salary=int(row.payload['salary']))))
+        db.session.commit()
+    url = '/map/entities?center_lat=48.85&center_lng=2.35&radius_km=2&sort=distance'
+    def body():
+        # Le jeton de synchronisation change à chaque appel
+        return re.sub(rb'"sync_token":\s*"[^"]*"', b'', client.get(url).get_data())
+    expected = body()
+    assert b'"salary":30000.0' in expected.replace(b' ', b'')
+    client.application.config['MAP_READ_MODEL'] = 'off'
+    assert body() == expected
+
+def test_read_model_follows_writes(client):
+    company_id, job_ids = seed(client)
+    with client.application.app_context():
+        job = db.session.get(Job, job_ids[0])
+        job.title = "Nouveau titre"
+        location = Location.query.filter_by(entity_type='job', entity_id=job_ids[1]).one()
+        location.latitude = 10.0
+        db.session.commit()
+        db.session.delete(Location.query.filter_by(entity_type='company', entity_id=company_id).one())
+        db.session.commit()
+        db.session.add(Location(entity_type='job', entity_id=job_ids[2], latitude=0, longitude=0))
+        with pytest.raises(Exception):
+            db.session.commit()
+        db.session.rollback()
+    result = entities(client)
+    assert result['companies'] == []
+    assert [job['title'] for job in result['jobs']] == ["Nouveau titre", "Offre 2", "Offre 3"]
+    assert result['jobs'][0]['distance_km'] == 0.0
+    with client.application.app_context():
+        # ON DELETE CASCADE côté base (non appliqué par SQLite ici) : les offres partent sans la session
+        db.session.execute(Job.__table__.delete())
+        db.session.delete(db.session.get(Company, company_id))
+        db.session.commit()
+        assert MapEntity.query.count() == 0
+
+def test_rebuild_command_covers_external_writes(client):
+    _, job_ids = seed(client)
+    with client.application.app_context():
+        db.session.execute(Location.__table__.update().values(latitude=48.86))
+        db.session.commit()
+    assert {job['location']['latitude'] for job in entities(client)['jobs']} == {48.85, 48.851, 48.852, 48.853}
+    result = client.application.test_cli_runner().invoke(args=['map', 'rebuild', '--batch-size', '2'])
+    assert result.exit_code == 0, result.output
+    assert "5 entités dans map_entities" in result.output
+    result = entities(client)
+    assert len(result['jobs']) == 4 and len(result['companies']) == 1
+    assert {job['location']['latitude'] for job in result['jobs']} == {48.86}
+
+def test_read_model_off_by_default():
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    with app.app_context():
+        db.create_all()
+        assert not map_entities.read_model_enabled()
+        db.drop_all()
+
+def test_unbuilt_read_model_falls_back_to_locations(client):
+    seed(client)
+    with client.application.app_context():
+        db.session.execute(MapEntity.__table__.delete())
+        # Écritures d'un autre service, hors session : la table de lecture ne les voit pas
+        company_id = uuid.uuid4()
+        db.session.execute(Company.__table__.insert().values(id=company_id, user_id=uuid.uuid4(), name="Externe",
+                                                             created_at=datetime.datetime(2024, 1, 1)))
+        db.session.execute(Location.__table__.insert().values(
+            id=uuid.uuid4(), entity_type='company', entity_id=company_id, latitude=48.85, longitude=2.35,
+            created_at=datetime.datetime(2024, 1, 1)))
+        db.session.commit()
+    result = entities(client)
+    assert sorted(c['name'] for c in result['companies']) == ["Acme", "Externe"]
+    assert len(result['jobs']) == 4
+
+def test_missing_read_model_table_falls_back_to_locations(client):
+    seed(client)
+    assert len(entities(client)['jobs']) == 4
+    with client.application.app_context():
+        MapEntity.__table__.drop(db.engine)
+    assert len(entities(client)['jobs']) == 4
+    with client.application.app_context():
+        assert not map_entities.read_model_enabled()
+
+def test_install_command_without_postgresql(client):
+    seed(client)
+    with client.application.app_context():
+        MapEntity.__table__.drop(db.engine)
+    result = client.application.test_cli_runner().invoke(args=['map', 'install'])
+    assert result.exit_code == 0, result.output
+    assert "5 entités dans map_entities" in result.output
+    assert "MAP_READ_MODEL=session" in result.output
+    with client.application.app_context():
+        assert map_entities.read_model_enabled()
@@ -0,0 +1,83 @@
+import logging
+import os
+import pytest
+from app import create_app, db
+from models.company import Company
+from services.metrics import archive_worker
+import uuid
+
+@pytest.fixture
+def client():
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'RESPONSE_CACHE_BACKEND': 'none',
+    })
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+        yield client
+        with app.app_context():
+            db.drop_all()
+
+def test_metrics_endpoint_exposes_histograms(client):
+    client.get('/companies')
+    client.get('/companies')
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    body = response.get_data(as_text=True)
+    assert 'http_requests_total{endpoint="get_companies",method="GET",status="200"} 2' in body
+    assert 'http_request_sql_queries_count{endpoint="get_companies",method="GET"} 2' in body
+    assert 'http_request_duration_seconds_bucket{endpoint="get_companies",method="GET",le="+Inf"} 2' in body
+    assert '# TYPE http_response_size_bytes histogram' in body
+
+def test_server_timing_header(client):
+    response = client.get('/companies')
+    assert response.headers['Server-Timing'].startswith('db;dur=')
+
+def test_query_threshold_logs_request(client, caplog):
+    client.application.config['METRICS_MAX_QUERIES'] = 1
+    with client.application.app_context():
+        db.session.add(Company(id=uuid.uuid4(), user_id=uuid.uuid4(), name="C",
+                               description="desc", website="https://test.com"))
+        db.session.commit()
+    with caplog.at_level(logging.WARNING, logger='services.metrics'):
+        client.get('/companies')
+    assert any('Requête lente GET /companies' in record.getMessage() for record in caplog.records)
+
+def test_metrics_disabled():
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+                      'METRICS_ENABLED': False})
+    assert app.test_client().get('/metrics').status_code == 404
+
+def test_metrics_aggregated_across_workers(tmp_path):
+    config = {'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', 'RESPONSE_CACHE_BACKEND': 'none',
+              'METRICS_MULTIPROC_DIR': str(tmp_path), 'METRICS_FLUSH_SECONDS': 3600}
+    workers = [create_app(config), create_app(config)]
+    for app in workers:
+        with app.app_context():
+            db.create_all()
+    for _ in range(2):
+        workers[0].test_client().get('/companies')
+    workers[1].test_client().get('/companies')
+    # Le second worker n'a pas encore écrit ses compteurs : seul son propre état est à jour
+    body = workers[0].test_client().get('/metrics').get_data(as_text=True)
+    assert 'http_requests_total{endpoint="get_companies",method="GET",status="200"} 2' in body
+    for app in workers:
+        app.extensions['metrics'].flush()
+    # Les fichiers portent le pid : on simule deux processus en renommant celui du second
+    second = workers[1].extensions['metrics'].path
+    recycled = tmp_path / 'worker-999999-test.json'
+    os.replace(second, recycled)
+    body = workers[0].test_client().get('/metrics').get_data(as_text=True)
+    assert 'http_requests_total{endpoint="get_companies",method="GET",status="200"} 3' in body
+    assert 'http_request_sql_queries_count{endpoint="get_companies",method="GET"} 3' in body
+    # Un worker recyclé : ses compteurs passent dans l'archive, les totaux ne reculent pas
+    archive_worker(str(tmp_path), 999999)
+    body = workers[0].test_client().get('/metrics').get_data(as_text=True)
+    assert 'http_requests_total{endpoint="get_companies",method="GET",status="200"} 3' in body
+    archive_worker(str(tmp_path), 999998)
+    assert not recycled.exists()
+    body = workers[0].test_client().get('/metrics').get_data(as_text=True)
+    assert 'http_requests_total{endpoint="get_companies",method="GET",status="200"} 3' in body
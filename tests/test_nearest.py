@@ -0,0 +1,96 @@
+import pytest
+from sqlalchemy import event
+from app import create_app, db
+from models.company import Company
+from models.job import Job
+from models.location import Location
+from services.map_query import nearest_candidates
+import uuid
+
+def make_client(spatial_index):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'SPATIAL_INDEX_ENABLED': spatial_index,
+        'SPATIAL_INDEX_REFRESH_SECONDS': 0,
+    })
+    with app.app_context():
+        db.create_all()
+    return app
+
+@pytest.fixture(params=[False, True], ids=['sql', 'index'])
+def client(request):
+    app = make_client(request.param)
+    with app.test_client() as client:
+        yield client
+    with app.app_context():
+        db.drop_all()
+
+def add_entity(client, entity_type, name, lat, lng):
+    if entity_type == 'company':
+        entity = Company(id=uuid.uuid4(), user_id=uuid.uuid4(), name=name,
+                         description="desc", website="https://test.com")
+    else:
+        entity = Job(id=uuid.uuid4(), company_id=uuid.uuid4(), title=name,
+                     description="desc", salary=10000, job_type="full_time")
+    with client.application.app_context():
+        db.session.add(entity)
+        db.session.add(Location(entity_type=entity_type, entity_id=entity.id, latitude=lat,
+                                longitude=lng, address="Paris", cp="75000"))
+        db.session.commit()
+
+def label(result):
+    return result.get("name") or result.get("title")
+
+def test_nearest_returns_k_closest_in_order(client):
+    add_entity(client, 'job', "Far", 45.76, 4.83)
+    add_entity(client, 'job', "Near", 48.851, 2.351)
+    add_entity(client, 'company', "Mid", 48.90, 2.35)
+    add_entity(client, 'job', "Marseille", 43.30, 5.37)
+    response = client.get('/map/nearest?lat=48.85&lng=2.35&k=3')
+    assert response.status_code == 200
+    results = response.json["results"]
+    assert [label(r) for r in results] == ["Near", "Mid", "Far"]
+    assert [r["entity_type"] for r in results] == ["job", "company", "job"]
+    distances = [r["distance_km"] for r in results]
+    assert distances == sorted(distances) and 390 < distances[-1] < 400
+
+def test_nearest_filters_entity_type(client):
+    add_entity(client, 'job', "Job", 48.851, 2.351)
+    add_entity(client, 'company', "Company", 43.30, 5.37)
+    response = client.get('/map/nearest?lat=48.85&lng=2.35&k=5&entity_type=company')
+    assert [label(r) for r in response.json["results"]] == ["Company"]
+
+def test_nearest_validation(client):
+    assert client.get('/map/nearest?lat=48.85').status_code == 400
+    for query in ('lat=nan&lng=2.35', 'lat=inf&lng=2.35', 'lat=48.85&lng=-inf', 'lat=91&lng=2.35', 'lat=0&lng=181'):
+        assert client.get(f'/map/nearest?{query}').status_code == 400
+    assert client.get('/map/nearest?lat=48.85&lng=2.35&k=0').status_code == 400
+    assert client.get('/map/nearest?lat=48.85&lng=2.35&entity_type=user').status_code == 400
+
+def sql_statements(app, *args):
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if 'FROM locations' in statement:
+            statements.append(statement)
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            selected = nearest_candidates(None, 48.85, 2.35, *args)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+    return selected, statements
+
+def test_sql_nearest_widens_a_bounded_search():
+    app = make_client(False)
+    client = app.test_client()
+    add_entity(client, 'job', "Sydney", -33.87, 151.21)
+    add_entity(client, 'job', "Lyon", 45.76, 4.83)
+    # Lyon (~392 km) est trouvé dans la bbox de 1280 km : 5, 20, 80, 320 puis 1280 km
+    selected, statements = sql_statements(app, 1)
+    assert [distance for _, distance in selected] == [pytest.approx(392, abs=5)]
+    assert len(statements) == 5 and all('locations.geohash >=' in s and 'LIMIT' in s for s in statements)
+    # Sydney est hors de portée : après la dernière bbox, une requête sur toute la table
+    selected, statements = sql_statements(app, 2)
+    assert [distance > 10000 for _, distance in selected] == [False, True]
+    assert len(statements) == 6 and 'WHERE' not in statements[-1] and 'LIMIT' in statements[-1]
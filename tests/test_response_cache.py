@@ -0,0 +1,148 @@
+import pytest
+from app import create_app, db
+from models.company import Company
+from models.job import Job
+from models.location import Location
+from services import response_cache
+from services.response_cache import CachedResponse, MemoryBackend
+import uuid
+
+@pytest.fixture
+def client():
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+    })
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+        yield client
+        with app.app_context():
+            db.drop_all()
+
+def add_company(client, name):
+    company = Company(
+        id=uuid.uuid4(),
+        user_id=uuid.uuid4(),
+        name=name,
+        description="desc",
+        website="https://test.com"
+    )
+    with client.application.app_context():
+        db.session.add(company)
+        db.session.commit()
+        return company.id
+
+def test_memory_backend_lru_and_tags():
+    backend = MemoryBackend(max_size=2)
+    entry = CachedResponse(b'{}', 'application/json', 'etag', [])
+    backend.set('a', entry, 30, {'t1'})
+    backend.set('b', entry, 30, {'t2'})
+    backend.set('c', entry, 30, {'t2'})
+    assert backend.get('a') is None
+    assert backend.invalidate({'t2'}) == 2
+    assert backend.size() == 0 and backend.tags == {}
+
+def test_memory_backend_byte_budget():
+    backend = MemoryBackend(max_size=10, max_bytes=10)
+    backend.set('a', CachedResponse(b'1234', 'application/json', 'etag', []), 30, {'t'})
+    backend.set('b', CachedResponse(b'1234', 'application/json', 'etag', []), 30, {'t'})
+    # Les versions compressées comptent dans le budget : la plus ancienne entrée est évincée
+    backend.add_encoding('b', 'gzip', b'123')
+    assert backend.get('a') is None and backend.get('b').encodings == {'gzip': b'123'}
+    assert backend.bytes == 7
+    backend.set('c', CachedResponse(b'x' * 11, 'application/json', 'etag', []), 30, {'t'})
+    assert backend.get('c') is None and backend.bytes == 7
+    assert backend.invalidate({'t'}) == 1 and backend.bytes == 0
+
+def test_second_request_is_a_hit_and_supports_304(client):
+    company_id = add_company(client, "Cached")
+    response = client.get(f'/companies/{company_id}')
+    assert response.headers['X-Cache'] == 'MISS'
+    etag = response.headers['ETag']
+    response = client.get(f'/companies/{company_id}')
+    assert response.headers['X-Cache'] == 'HIT'
+    assert response.json["name"] == "Cached"
+    response = client.get(f'/companies/{company_id}', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    stats = client.get('/cache/stats').json
+    assert stats["hits"] == 2 and stats["misses"] == 1 and stats["not_modified"] == 1
+
+def test_list_tags_do_not_decode_the_body(client, monkeypatch):
+    add_company(client, "Listed")
+    decoded = []
+    monkeypatch.setattr(response_cache.json, 'loads', lambda body: decoded.append(body))
+    assert client.get('/companies').headers['X-Cache'] == 'MISS'
+    assert decoded == []
+
+def test_query_args_are_normalized(client):
+    client.get('/companies?fields=id,name&limit=5')
+    response = client.get('/companies?limit=5&fields=id,name')
+    assert response.headers['X-Cache'] == 'HIT'
+
+def test_job_change_invalidates_only_its_company(client):
+    company_a = add_company(client, "A")
+    company_b = add_company(client, "B")
+    client.get(f'/companies/{company_a}')
+    client.get(f'/companies/{company_b}')
+    with client.application.app_context():
+        db.session.add(Job(id=uuid.uuid4(), company_id=company_a, title="New",
+                           description="desc", salary=1000, job_type="full_time"))
+        db.session.commit()
+    response = client.get(f'/companies/{company_a}')
+    assert response.headers['X-Cache'] == 'MISS'
+    assert [j["title"] for j in response.json["jobs"]] == ["New"]
+    assert client.get(f'/companies/{company_b}').headers['X-Cache'] == 'HIT'
+
+def test_location_change_invalidates_lists_and_map(client):
+    company_id = add_company(client, "Located")
+    client.get('/companies')
+    client.get('/map/entities?center_lat=48.85&center_lng=2.35&radius_km=1')
+    with client.application.app_context():
+        db.session.add(Location(entity_type='company', entity_id=company_id, latitude=48.85,
+                                longitude=2.35, address="Paris", cp="75000"))
+        db.session.commit()
+    response = client.get('/companies')
+    assert response.headers['X-Cache'] == 'MISS'
+    assert response.json[0]["location"]["address"] == "Paris"
+    response = client.get('/map/entities?center_lat=48.85&center_lng=2.35&radius_km=1')
+    assert len(response.json["companies"]) == 1
+
+def test_writes_from_other_processes_invalidate_the_cache(tmp_path):
+    config = {'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///%s' % (tmp_path / 'cache.db'),
+              'MAP_CHANGE_POLL_SECONDS': 0, 'MAP_SYNC_WINDOW_SECONDS': 0}
+    writer, reader = create_app(config), create_app(config)
+    with writer.app_context():
+        db.create_all()
+    company_a = add_company(writer.test_client(), "A")
+    company_b = add_company(writer.test_client(), "B")
+    job_id = uuid.uuid4()
+    with writer.app_context():
+        db.session.add(Job(id=job_id, company_id=company_a, title="Old", description="desc",
+                           salary=1000, job_type="full_time"))
+        db.session.commit()
+    client = reader.test_client()
+    client.get(f'/jobs/{job_id}')
+    client.get(f'/companies/{company_a}')
+    client.get(f'/companies/{company_b}')
+    with writer.app_context():
+        db.session.get(Job, job_id).title = "New"
+        db.session.commit()
+    response = client.get(f'/jobs/{job_id}')
+    assert response.headers['X-Cache'] == 'MISS' and response.json['title'] == "New"
+    assert [j['title'] for j in client.get(f'/companies/{company_a}').json['jobs']] == ["New"]
+    assert client.get(f'/companies/{company_b}').headers['X-Cache'] == 'HIT'
+    with writer.app_context():
+        db.session.delete(db.session.get(Job, job_id))
+        db.session.commit()
+    assert client.get(f'/companies/{company_a}').json['jobs'] == []
+    assert client.get(f'/jobs/{job_id}').status_code == 404
+
+def test_cache_can_be_disabled():
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+                      'RESPONSE_CACHE_BACKEND': 'none'})
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+        assert 'X-Cache' not in client.get('/companies').headers
+        assert client.get('/cache/stats').json == {'enabled': False}
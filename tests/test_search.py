@@ -0,0 +1,128 @@
+import pytest
+from sqlalchemy.dialects import postgresql
+from app import create_app, db
+from models.company import Company
+from models.job import Job
+from models.location import Location
+from services.geo import filter_by_radius
+from services.map_query import radius_clause
+from services.search import InvertedIndex
+from services.text_search import any_term_query, tokenize
+import uuid
+
+@pytest.fixture
+def client():
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+    })
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+        yield client
+        with app.app_context():
+            db.drop_all()
+
+def seed(client):
+    with client.application.app_context():
+        acme = Company(id=uuid.uuid4(), user_id=uuid.uuid4(), name="Acme Logiciels",
+                       description="desc", website="https://test.com")
+        globex = Company(id=uuid.uuid4(), user_id=uuid.uuid4(), name="Globex",
+                         description="desc", website="https://test.com")
+        db.session.add_all([acme, globex])
+        specs = [
+            (acme, "Développeur Python", "API Flask et PostgreSQL", 48.85, 2.35),
+            (acme, "Data engineer", "Pipelines Python, Spark", 45.76, 4.83),
+            (globex, "Comptable", "Tenue des comptes, paie", 48.86, 2.34),
+            (globex, "Stage développeur", "Application mobile", 48.85, 2.36),
+        ]
+        for company, title, description, lat, lng in specs:
+            job = Job(id=uuid.uuid4(), company_id=company.id, title=title, description=description,
+                      salary=30000, job_type='full_time')
+            db.session.add(job)
+            db.session.add(Location(entity_type='job', entity_id=job.id, latitude=lat, longitude=lng,
+                                    address="Adresse", cp="00000"))
+        db.session.commit()
+        return acme.id
+
+def titles(response):
+    assert response.status_code == 200, response.json
+    return [job['title'] for job in response.json['results']]
+
+def test_tokenize_folds_accents_and_plurals():
+    assert tokenize("Développeurs et Données") == ['developpeur', 'donnee']
+
+def test_search_ranks_title_matches_first(client):
+    seed(client)
+    response = client.get('/jobs/search?q=python')
+    assert titles(response) == ["Développeur Python", "Data engineer"]
+    assert response.json['results'][0]['score'] > response.json['results'][1]['score']
+    assert response.json['results'][0]['company_name'] == "Acme Logiciels"
+    assert sorted(titles(client.get('/jobs/search?q=developpeurs'))) == ["Développeur Python", "Stage développeur"]
+    assert titles(client.get('/jobs/search?q=python spark')) == ["Data engineer"]
+    assert titles(client.get('/jobs/search?q=cobol')) == []
+
+def test_search_matches_company_name(client):
+    seed(client)
+    assert sorted(titles(client.get('/jobs/search?q=globex'))) == ["Comptable", "Stage développeur"]
+
+def test_search_terms_span_job_and_company(client):
+    seed(client)
+    assert titles(client.get('/jobs/search?q=stage globex')) == ["Stage développeur"]
+
+def test_any_term_query_prefilters_positive_terms():
+    params = any_term_query('"stage python" -java globex').compile(dialect=postgresql.dialect()).params
+    assert list(params.values())[-1] == 'stage or python or globex'
+    assert any_term_query('-java') is None
+
+def test_search_pagination(client):
+    seed(client)
+    response = client.get('/jobs/search?q=acme&limit=1')
+    assert len(titles(response)) == 1 and response.json['next_offset'] == 1
+    response = client.get('/jobs/search?q=acme&limit=1&offset=1')
+    assert len(titles(response)) == 1 and response.json['next_offset'] is None
+
+def test_search_within_viewport(client):
+    seed(client)
+    response = client.get('/jobs/search?q=python&center_lat=48.85&center_lng=2.35&radius_km=5')
+    assert titles(response) == ["Développeur Python"]
+
+def test_search_index_follows_writes(client):
+    company_id = seed(client)
+    assert titles(client.get('/jobs/search?q=initech')) == []
+    with client.application.app_context():
+        db.session.get(Company, company_id).name = "Initech"
+        db.session.commit()
+    assert len(titles(client.get('/jobs/search?q=initech'))) == 2
+    with client.application.app_context():
+        db.session.delete(Job.query.filter_by(title="Data engineer").one())
+        db.session.commit()
+    assert titles(client.get('/jobs/search?q=initech')) == ["Développeur Python"]
+
+def test_inverted_index_requires_all_terms():
+    index = InvertedIndex()
+    company_id, first, second = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    index.set_company(company_id, "Acme")
+    index.add_job(first, company_id, "Chef de projet", "Gestion de projet web")
+    index.add_job(second, company_id, "Chef cuisinier", "Restaurant")
+    assert [job_id for job_id, _ in index.search("chef projet")] == [first]
+    assert {job_id for job_id, _ in index.search("acme")} == {first, second}
+    index.remove_job(first)
+    assert index.search("projet") == []
+
+@pytest.mark.parametrize('query', ['', 'q=', 'q=python&limit=0', 'q=python&offset=-1',
+                                   'q=python&limit=abc', 'q=python&offset=', 'q=python&center_lat=48'])
+def test_search_invalid_params(client, query):
+    response = client.get(f'/jobs/search?{query}')
+    assert response.status_code == 400
+
+def test_radius_clause_matches_filter_by_radius(client):
+    seed(client)
+    with client.application.app_context():
+        # least() de PostgreSQL, absent de SQLite (les fonctions mathématiques y sont disponibles)
+        db.session.connection().connection.driver_connection.create_function('least', 2, min)
+        locations = Location.query.all()
+        for radius_km in (0.5, 1.0, 5.0, 400.0):
+            expected = {location.id for location, _ in filter_by_radius(locations, 48.85, 2.35, radius_km)}
+            rows = Location.query.filter(radius_clause(48.85, 2.35, radius_km)).all()
+            assert {location.id for location in rows} == expected
@@ -0,0 +1,110 @@
+import datetime
+import json
+import pytest
+from flask.json.provider import DefaultJSONProvider
+from app import create_app, db
+from models.company import Company
+from models.job import Job
+from models.location import Location
+from services.serialization import row_encoder, select_payloads
+import uuid
+
+@pytest.fixture
+def client():
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+    })
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+        yield client
+        with app.app_context():
+            db.drop_all()
+
+def seed(client):
+    with client.application.app_context():
+        company = Company(id=uuid.uuid4(), user_id=uuid.uuid4(), name="Société Générale d’Électricité ⚡",
+                          description=None, website="https://test.com")
+        job = Job(id=uuid.uuid4(), company_id=company.id, title="Ingénieur 𝔡𝔞𝔱𝔞", description="Télétravail\tpossible",
+                  salary=42123.45, job_type='contract', image_url=None)
+        db.session.add_all([company, job])
+        db.session.add(Location(entity_type='job', entity_id=job.id, latitude=48.856613,
+                                longitude=2.352222, address="Rue de l’Église", cp="75004"))
+        db.session.commit()
+
+@pytest.mark.parametrize('model', [Company, Job, Location])
+def test_row_encoder_matches_to_dict(client, model):
+    seed(client)
+    with client.application.app_context():
+        instance = model.query.first()
+        expected = instance.to_dict()
+        db.session.expunge_all()
+        payloads = select_payloads(model, model.id == instance.id)
+        assert len(db.session.identity_map) == 0
+    assert payloads == [expected]
+    assert list(payloads[0]) == list(expected)
+    assert json.dumps(payloads[0]) == json.dumps(expected)
+
+def test_row_encoder_is_cached():
+    assert row_encoder(Job) is row_encoder(Job)
+    assert row_encoder(Job, ('id', 'title')).fields == ('id', 'title')
+
+@pytest.mark.parametrize('ensure_ascii', [True, False])
+@pytest.mark.parametrize('url', ['/companies', '/jobs', '/jobs?fields=id,title,salary&limit=1',
+                                 '/map/nearest?lat=48.85&lng=2.35&k=5'])
+def test_orjson_backend_is_byte_identical(url, ensure_ascii):
+    pytest.importorskip('orjson')
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'RESPONSE_CACHE_BACKEND': 'none',
+        'JSON_ENSURE_ASCII': ensure_ascii,
+    })
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+        seed(client)
+        expected = client.get(url).get_data()
+        app.config['JSON_BACKEND'] = 'orjson'
+        assert client.get(url).get_data() == expected
+        with app.app_context():
+            db.drop_all()
+
+@pytest.mark.parametrize('value', [
+    {'when': datetime.datetime(2024, 5, 1, 12, 0)},
+    {'small': 0.00001, 'large': 1e16},
+    {'name': 'Société'},
+])
+def test_orjson_backend_falls_back_to_json(client, value):
+    pytest.importorskip('orjson')
+    app = client.application
+    with app.app_context():
+        expected = app.json.dumps(value, separators=(',', ':'))
+        app.config['JSON_BACKEND'] = 'orjson'
+        assert app.json.dumps(value, separators=(',', ':')) == expected
+
+def test_orjson_backend_used_for_uuid_payloads(client, monkeypatch):
+    pytest.importorskip('orjson')
+    app = client.application
+    # Des UUID contenant « 1e2 » : l'ancien filtre sur le texte encodé les renvoyait vers json.dumps
+    value = {'jobs': [{'id': '3f1e2a44-%04d-4e3b-9e1f-1e5a2b3c4d5e' % i, 'salary': 35000.5 + i,
+                       'distance_km': 0.25, 'latitude': 48.8566} for i in range(5)], 'total': 5}
+    with app.app_context():
+        expected = app.json.dumps(value, separators=(',', ':'))
+        app.config['JSON_BACKEND'] = 'orjson'
+
+        def fail(*args, **kwargs):
+            raise AssertionError("json.dumps utilisé")
+        monkeypatch.setattr(DefaultJSONProvider, 'dumps', fail)
+        assert app.json.dumps(value, separators=(',', ':')) == expected
+
+@pytest.mark.parametrize('value', [float('nan'), float('inf'), -0.00002, 2e16])
+def test_orjson_backend_checks_float_values(client, value):
+    pytest.importorskip('orjson')
+    app = client.application
+    payload = {'items': [{'value': value}]}
+    with app.app_context():
+        expected = app.json.dumps(payload, separators=(',', ':'))
+        app.config['JSON_BACKEND'] = 'orjson'
+        assert app.json.dumps(payload, separators=(',', ':')) == expected
@@ -0,0 +1,77 @@
+import gc
+import os
+import runpy
+import pytest
+from app import create_app, db
+from models.location import Location
+from services.server import after_fork, preload_shared_state
+from services.spatial_index import get_spatial_index
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture
+def database_url(tmp_path):
+    url = 'sqlite:///' + str(tmp_path / 'server.db')
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': url})
+    with app.app_context():
+        db.create_all()
+    yield url
+    with app.app_context():
+        db.drop_all()
+
+def make_app(database_url):
+    return create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': database_url,
+        'SPATIAL_INDEX_ENABLED': True,
+        'SPATIAL_INDEX_REFRESH_SECONDS': 0,
+    })
+
+def add_location(app, lat, lng):
+    with app.app_context():
+        location = Location(entity_type='job', entity_id=uuid.uuid4(), latitude=lat, longitude=lng)
+        db.session.add(location)
+        db.session.commit()
+        return location.id
+
+def indexed(app):
+    with app.app_context():
+        return {entry.id: (entry.latitude, entry.longitude) for entry in get_spatial_index(app).snapshot()}
+
+def test_preload_builds_shared_state_and_releases_connections(database_url):
+    add_location(make_app(database_url), 48.85, 2.35)
+    app = make_app(database_url)
+    try:
+        preload_shared_state(app)
+        assert gc.get_freeze_count() > 0
+    finally:
+        gc.unfreeze()
+    assert 'cluster_pyramid' in app.extensions
+    with app.app_context():
+        assert db.engine.pool.checkedout() == 0
+    after_fork(app)
+    response = app.test_client().get('/map/entities?center_lat=48.85&center_lng=2.35&radius_km=1')
+    assert response.status_code == 200
+
+def test_index_replays_changes_from_other_workers(database_url):
+    writer = make_app(database_url)
+    moved = add_location(writer, 48.85, 2.35)
+    deleted = add_location(writer, 48.86, 2.35)
+    reader = make_app(database_url)
+    assert set(indexed(reader)) == {moved, deleted}
+    with writer.app_context():
+        db.session.get(Location, moved).latitude = 45.75
+        db.session.delete(db.session.get(Location, deleted))
+        db.session.commit()
+    created = add_location(writer, 43.3, 5.37)
+    assert indexed(reader) == {moved: (45.75, 2.35), created: (43.3, 5.37)}
+
+def test_gunicorn_config(monkeypatch, tmp_path):
+    monkeypatch.setenv('WEB_CONCURRENCY', '3')
+    monkeypatch.setenv('PORT', '8000')
+    monkeypatch.setenv('METRICS_MULTIPROC_DIR', str(tmp_path))
+    config = runpy.run_path(os.path.join(ROOT, 'gunicorn.conf.py'))
+    assert config['workers'] == 3 and config['bind'] == '0.0.0.0:8000'
+    assert config['preload_app'] is True and config['worker_class'] == 'gthread'
+    assert config['metrics_dir'] == str(tmp_path)
@@ -0,0 +1,95 @@
+import pytest
+from app import create_app, db
+from models.company import Company
+from models.location import Location
+from services.spatial_index import GridIndex, IndexedLocation, get_spatial_index
+import uuid
+
+@pytest.fixture
+def client():
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'SPATIAL_INDEX_ENABLED': True,
+        'SPATIAL_INDEX_REFRESH_SECONDS': 0,
+    })
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+        yield client
+        with app.app_context():
+            db.drop_all()
+
+def add_company(client, name, lat, lng):
+    company = Company(
+        id=uuid.uuid4(),
+        user_id=uuid.uuid4(),
+        name=name,
+        description="desc",
+        website="https://test.com"
+    )
+    location = Location(
+        entity_type='company',
+        entity_id=company.id,
+        latitude=lat,
+        longitude=lng,
+        address="Paris",
+        cp="75000"
+    )
+    with client.application.app_context():
+        db.session.add(company)
+        db.session.add(location)
+        db.session.commit()
+
+def test_grid_index_query_and_move():
+    index = GridIndex(cell_size=0.1)
+    location_id = uuid.uuid4()
+    index.add(IndexedLocation(location_id, 'company', uuid.uuid4(), 48.85, 2.35))
+    index.add(IndexedLocation(uuid.uuid4(), 'job', uuid.uuid4(), 40.0, 0.0))
+    assert [e.id for e in index.query(48.8, 48.9, 2.3, 2.4)] == [location_id]
+    index.add(IndexedLocation(location_id, 'company', uuid.uuid4(), 40.0, 0.01))
+    assert index.query(48.8, 48.9, 2.3, 2.4) == []
+    assert len(index.query(39.0, 41.0, -1.0, 1.0)) == 2
+    index.remove(location_id)
+    assert len(index) == 1
+
+def test_map_entities_uses_index_with_incremental_refresh(client):
+    add_company(client, "Indexed", 48.85, 2.35)
+    response = client.get('/map/entities?center_lat=48.85&center_lng=2.35&radius_km=1')
+    assert [c["name"] for c in response.json["companies"]] == ["Indexed"]
+    index = client.application.extensions['spatial_index']
+    assert len(index) == 1
+    add_company(client, "Later", 48.851, 2.351)
+    add_company(client, "Far", 40.0, 0.0)
+    response = client.get('/map/entities?center_lat=48.85&center_lng=2.35&radius_km=1')
+    assert sorted(c["name"] for c in response.json["companies"]) == ["Indexed", "Later"]
+    assert len(index) == 3
+
+def test_index_disabled_by_default():
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    assert 'spatial_index' not in app.extensions
+
+def test_index_follows_location_updates_and_deletes(client):
+    add_company(client, "Moving", 48.85, 2.35)
+    index = client.application.extensions['spatial_index']
+    with client.application.app_context():
+        location = Location.query.first()
+        location.latitude = 40.0
+        db.session.commit()
+        assert index.query(48.8, 48.9, 2.3, 2.4) == []
+        assert len(index.query(39.9, 40.1, 2.3, 2.4)) == 1
+        db.session.delete(location)
+        db.session.commit()
+    assert len(index) == 0
+
+def test_concurrent_refresh_serves_current_index(client, monkeypatch):
+    app = client.application
+    with app.app_context():
+        index = get_spatial_index(app)
+        calls = []
+        monkeypatch.setattr(index, 'sync', lambda: calls.append(1) or 0)
+        # Un autre thread rafraîchit déjà l'index : pas de second rechargement, l'état courant est servi
+        with index.sync_lock:
+            assert get_spatial_index(app) is index
+        assert calls == []
+        assert get_spatial_index(app) is index and calls == [1]
@@ -0,0 +1,144 @@
+import datetime
+import pytest
+from app import create_app, db
+from models.company import Company
+from models.location import Location
+from models.map_change import MapChange
+from services.sync import SyncToken, decode_token, encode_token, prune_changes
+import uuid
+
+URL = '/map/entities?center_lat=48.85&center_lng=2.35&radius_km=5'
+
+@pytest.fixture
+def client():
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'MAP_SYNC_WINDOW_SECONDS': 0,
+    })
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+        yield client
+        with app.app_context():
+            db.drop_all()
+
+def add_company(client, name, lat=48.85, lng=2.35):
+    with client.application.app_context():
+        company = Company(
+            id=uuid.uuid4(),
+            user_id=uuid.uuid4(),
+            name=name,
+            description="desc",
+            website="https://test.com"
+        )
+        db.session.add(company)
+        db.session.add(Location(entity_type='company', entity_id=company.id,
+                                latitude=lat, longitude=lng, address="Paris", cp="75000"))
+        db.session.commit()
+        return str(company.id)
+
+def delta(client, token):
+    response = client.get(f'{URL}&since={token}')
+    assert response.status_code == 200
+    return response.json
+
+def test_full_response_carries_sync_token(client):
+    add_company(client, "A")
+    response = client.get(URL)
+    assert response.status_code == 200
+    assert response.json['sync_token']
+    assert response.json['reset'] is False
+    assert len(response.json['companies']) == 1
+
+def test_token_is_read_from_the_change_log(client):
+    add_company(client, "A")
+    token = decode_token(client.get(URL).json['sync_token'])
+    with client.application.app_context():
+        last = MapChange.query.order_by(MapChange.id.desc()).first()
+    # Horizon de la dernière entrée visible, pas l'horloge de l'application : indépendant du retard du réplica
+    assert token.seq == last.id
+    assert datetime.timedelta(0) <= token.timestamp - last.changed_at < datetime.timedelta(milliseconds=1)
+
+def test_delta_reports_added_updated_and_removed(client):
+    kept = add_company(client, "Kept")
+    moved = add_company(client, "Moved")
+    deleted = add_company(client, "Deleted")
+    token = client.get(URL).json['sync_token']
+
+    empty = delta(client, token)
+    assert empty['added'] == empty['updated'] == empty['removed'] == {'companies': [], 'jobs': []}
+
+    added = add_company(client, "Added")
+    add_company(client, "Elsewhere", lat=45.76, lng=4.83)
+    with client.application.app_context():
+        db.session.get(Company, uuid.UUID(kept)).name = "Renamed"
+        Location.query.filter_by(entity_id=uuid.UUID(moved)).one().latitude = 45.76
+        db.session.delete(Location.query.filter_by(entity_id=uuid.UUID(deleted)).one())
+        db.session.delete(db.session.get(Company, uuid.UUID(deleted)))
+        db.session.commit()
+
+    changes = delta(client, token)
+    assert [c['id'] for c in changes['added']['companies']] == [added]
+    assert [c['name'] for c in changes['updated']['companies']] == ["Renamed"]
+    assert sorted(changes['removed']['companies']) == sorted([moved, deleted])
+    assert changes['sync_token'] != token
+
+    again = delta(client, changes['sync_token'])
+    assert again['added']['companies'] == again['updated']['companies'] == again['removed']['companies'] == []
+
+def test_moving_expired_instance_logs_previous_position(client):
+    moved = add_company(client, "Moved")
+    token = client.get(URL).json['sync_token']
+    with client.application.app_context():
+        location = Location.query.filter_by(entity_id=uuid.UUID(moved)).one()
+        db.session.commit()
+        # Instance expirée par le commit : l'ancienne position n'est plus en mémoire
+        location.latitude, location.longitude = 45.76, 4.83
+        db.session.commit()
+        entry = MapChange.query.filter_by(action='updated').one()
+        assert (float(entry.prev_latitude), float(entry.prev_longitude)) == (48.85, 2.35)
+    assert delta(client, token)['removed']['companies'] == [moved]
+
+def test_pruned_token_falls_back_to_full_response(client):
+    add_company(client, "A")
+    token = client.get(URL).json['sync_token']
+    add_company(client, "B")
+    add_company(client, "C")
+    with client.application.app_context():
+        assert prune_changes(datetime.datetime.utcnow() + datetime.timedelta(days=1)) > 0
+        assert MapChange.query.count() == 1
+    response = delta(client, '0.' + token.split('.')[1])
+    assert response['reset'] is True
+    assert len(response['companies']) == 3
+
+def test_invalid_since(client):
+    response = client.get(f'{URL}&since=abc')
+    assert response.status_code == 400
+
+def test_window_rereads_changes_committed_after_token(client):
+    moved = add_company(client, "Moved", lat=45.76, lng=4.83)
+    token = decode_token(client.get(URL).json['sync_token'])
+    # Jeton pris 5 s après l'écriture de l'entrée suivante mais avant son commit : elle est sous le curseur
+    late = encode_token(SyncToken(token.seq + 1, token.timestamp + datetime.timedelta(seconds=5)))
+    with client.application.app_context():
+        location = Location.query.filter_by(entity_id=uuid.UUID(moved)).one()
+        location.latitude, location.longitude = 48.85, 2.35
+        db.session.commit()
+    changes = delta(client, late)
+    assert changes['added']['companies'] == changes['updated']['companies'] == []
+    client.application.config['MAP_SYNC_WINDOW_SECONDS'] = 30
+    client.application.extensions.pop('response_cache')
+    changes = delta(client, late)
+    # Sa création, dans la fenêtre elle aussi, est renvoyée : l'entité arrive comme ajoutée
+    assert [c['id'] for c in changes['added']['companies'] + changes['updated']['companies']] == [moved]
+
+def test_missing_change_log_degrades_to_full_viewport(client):
+    with client.application.app_context():
+        MapChange.__table__.drop(db.engine)
+    add_company(client, "A")
+    response = client.get(URL)
+    assert response.status_code == 200
+    assert response.json['sync_token'] is None and len(response.json['companies']) == 1
+    response = delta(client, '1.1700000000000')
+    assert response['reset'] is True and len(response['companies']) == 1
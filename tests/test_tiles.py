@@ -0,0 +1,143 @@
+import pytest
+from app import create_app, db
+from models.company import Company
+from models.location import Location
+from services.geo import tiles_for_point
+import uuid
+
+@pytest.fixture
+def client():
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'MAP_CLUSTER_MAX_ZOOM': 12,
+    })
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+        yield client
+        with app.app_context():
+            db.drop_all()
+
+def add_company(client, name, lat, lng):
+    company = Company(
+        id=uuid.uuid4(),
+        user_id=uuid.uuid4(),
+        name=name,
+        description="desc",
+        website="https://test.com"
+    )
+    location = Location(
+        entity_type='company',
+        entity_id=company.id,
+        latitude=lat,
+        longitude=lng,
+        address="Paris",
+        cp="75000"
+    )
+    with client.application.app_context():
+        db.session.add(company)
+        db.session.add(location)
+        db.session.commit()
+        return location.id
+
+def tile_url(lat, lng, z):
+    return '/map/tiles/%d/%d/%d' % tiles_for_point(lat, lng, z)[z]
+
+def test_tile_returns_geojson_entities(client):
+    add_company(client, "TileCompany", 48.85, 2.35)
+    response = client.get(tile_url(48.85, 2.35, 15))
+    assert response.status_code == 200
+    assert response.mimetype == 'application/geo+json'
+    features = response.json['features']
+    assert len(features) == 1
+    assert features[0]['properties']['name'] == "TileCompany"
+    assert features[0]['geometry']['coordinates'] == [2.35, 48.85]
+
+def test_tile_returns_clusters_at_low_zoom(client):
+    add_company(client, "A", 48.85, 2.35)
+    add_company(client, "B", 48.851, 2.351)
+    response = client.get(tile_url(48.85, 2.35, 5))
+    features = response.json['features']
+    assert len(features) == 1
+    assert features[0]['properties']['type'] == 'cluster'
+    assert features[0]['properties']['count'] == 2
+
+def test_tile_etag_and_not_modified(client):
+    add_company(client, "TileCompany", 48.85, 2.35)
+    url = tile_url(48.85, 2.35, 15)
+    response = client.get(url)
+    etag = response.headers['ETag']
+    assert not etag.startswith('W/')
+    assert 'max-age' in response.headers['Cache-Control']
+    response = client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+def test_tile_cache_invalidated_on_location_change(client):
+    location_id = add_company(client, "Moving", 48.85, 2.35)
+    other_url = tile_url(43.30, 5.37, 15)
+    url = tile_url(48.85, 2.35, 15)
+    assert len(client.get(url).json['features']) == 1
+    client.get(other_url)
+    cache = client.application.extensions['tile_cache']
+    assert len(cache.entries) == 2
+    with client.application.app_context():
+        location = db.session.get(Location, location_id)
+        location.latitude = 43.30
+        location.longitude = 5.37
+        db.session.commit()
+    assert len(cache.entries) == 0
+    assert client.get(url).json['features'] == []
+    assert len(client.get(other_url).json['features']) == 1
+
+def test_tile_invalidation_keeps_unrelated_tiles(client):
+    client.get(tile_url(43.30, 5.37, 15))
+    add_company(client, "New", 48.85, 2.35)
+    assert len(client.application.extensions['tile_cache'].entries) == 1
+
+def test_tile_cache_invalidated_on_entity_change(client):
+    location_id = add_company(client, "Old name", 48.85, 2.35)
+    url = tile_url(48.85, 2.35, 15)
+    assert client.get(url).json['features'][0]['properties']['name'] == "Old name"
+    client.get(tile_url(48.85, 2.35, 5))
+    client.get(tile_url(43.30, 5.37, 15))
+    with client.application.app_context():
+        company = db.session.get(Company, db.session.get(Location, location_id).entity_id)
+        company_id = company.id
+        company.name = "New name"
+        db.session.commit()
+    # Seule la tuile détaillée affichant l'entreprise est purgée : les clusters ne montrent que des comptages
+    assert len(client.application.extensions['tile_cache'].entries) == 2
+    assert client.get(url).json['features'][0]['properties']['name'] == "New name"
+    with client.application.app_context():
+        db.session.delete(db.session.get(Company, company_id))
+        db.session.commit()
+    assert client.get(url).json['features'] == []
+
+def test_tile_cache_replays_writes_from_other_processes(tmp_path):
+    config = {'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///%s' % (tmp_path / 'tiles.db'),
+              'MAP_CLUSTER_MAX_ZOOM': 12, 'MAP_CHANGE_POLL_SECONDS': 0, 'MAP_SYNC_WINDOW_SECONDS': 0}
+    writer, reader = create_app(config), create_app(config)
+    with writer.app_context():
+        db.create_all()
+    location_id = add_company(writer.test_client(), "Old name", 48.85, 2.35)
+    client = reader.test_client()
+    url = tile_url(48.85, 2.35, 15)
+    other_url = tile_url(45.76, 4.83, 15)
+    assert client.get(url).json['features'][0]['properties']['name'] == "Old name"
+    assert client.get(other_url).json['features'] == []
+    with writer.app_context():
+        location = db.session.get(Location, location_id)
+        db.session.get(Company, location.entity_id).name = "New name"
+        db.session.commit()
+    assert client.get(url).json['features'][0]['properties']['name'] == "New name"
+    with writer.app_context():
+        location = db.session.get(Location, location_id)
+        location.latitude, location.longitude = 45.76, 4.83
+        db.session.commit()
+    assert client.get(url).json['features'] == []
+    assert client.get(other_url).json['features'][0]['properties']['name'] == "New name"
+
+def test_invalid_tile(client):
+    response = client.get('/map/tiles/2/4/0')
+    assert response.status_code == 404